@@ -0,0 +1,44 @@
+'''
+Coalesces the overlapping and adjacent leaves of every user into single
+entries, a one-off compaction of data written before leaves were merged on
+write. The usage ledger and leave versions are updated with the changes.
+
+Run with (the server should be stopped):
+
+    python3 -m backend.migrations.compact_leaves sqlite:////var/lib/leave/leave.db
+'''
+
+import argparse
+from typing import Tuple
+
+from flask import Flask
+
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.server import create_app
+
+
+def compact(app: Flask) -> Tuple[int, int]:
+    '''
+    Compact the app's leaves in a single transaction. Returns the number of
+    leaves updated and deleted.
+    '''
+    with app.app_context():
+        updated, deleted = LeaveModel.compact_all()
+        db.session.commit()
+
+    return updated, deleted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('uri', help='database uri, ex. sqlite:////var/lib/leave/leave.db')
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.uri, 'LEAVE_INDEX_ENABLED': False,
+        'LEAVE_CACHE_ENABLED': False})
+    print('%d leave(s) updated, %d leave(s) deleted' % compact(app))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+'''
+Migrates a database created with DateTime leave columns to Date columns.
+Leaves are whole days, so the time of day is dropped; the usage ledger is
+then rebuilt and every user's leave version bumped (cached responses and
+etags carried the old values).
+
+Run with (the server should be stopped):
+
+    python3 -m backend.migrations.leave_dates sqlite:////var/lib/leave/leave.db
+'''
+
+import argparse
+
+from flask import Flask
+from sqlalchemy import DateTime, inspect
+from sqlalchemy.schema import DropIndex
+
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.models.version import LeaveVersionModel
+from backend.server import create_app
+
+
+LEAVE_TABLE = LeaveModel.__tablename__
+
+
+def get_leave_columns(connection) -> dict:
+    '''
+    Get the reflected leave table column types by name
+    '''
+    return {column['name']: column['type']
+        for column in inspect(connection).get_columns(LEAVE_TABLE)}
+
+
+def needs_migration(connection) -> bool:
+    '''
+    Check if the leave table still has DateTime date columns
+    '''
+    return isinstance(get_leave_columns(connection).get('start_date'), DateTime)
+
+
+def convert_sqlite(connection, has_version: bool) -> None:
+    '''
+    Rebuild the leave table, sqlite cannot change a column type in place
+    '''
+    for index in LeaveModel.__table__.indexes: # recreated with the new table
+        connection.execute(DropIndex(index, if_exists=True))
+
+    connection.exec_driver_sql('ALTER TABLE %s RENAME TO %s_old' % (LEAVE_TABLE, LEAVE_TABLE))
+    LeaveModel.__table__.create(connection)
+    connection.exec_driver_sql(
+        'INSERT INTO %s (id, user_id, start_date, end_date, version_id) '
+        'SELECT id, user_id, date(start_date), date(end_date), %s FROM %s_old' % (
+            LEAVE_TABLE, 'version_id' if has_version else '1', LEAVE_TABLE))
+    connection.exec_driver_sql('DROP TABLE %s_old' % (LEAVE_TABLE))
+
+
+def convert(connection, has_version: bool) -> None:
+    '''
+    Change the column types in place (postgresql and mysql)
+    '''
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('ALTER TABLE %s '
+            'ALTER COLUMN start_date TYPE DATE USING start_date::date, '
+            'ALTER COLUMN end_date TYPE DATE USING end_date::date' % (LEAVE_TABLE))
+    else:
+        connection.exec_driver_sql('ALTER TABLE %s MODIFY start_date DATE NOT NULL, '
+            'MODIFY end_date DATE NOT NULL' % (LEAVE_TABLE))
+
+    if not has_version:
+        connection.exec_driver_sql('ALTER TABLE %s '
+            'ADD COLUMN version_id INTEGER NOT NULL DEFAULT 1' % (LEAVE_TABLE))
+
+
+def migrate(app: Flask) -> bool:
+    '''
+    Migrate the app's database in a single transaction. Returns False if
+    it was already migrated.
+    '''
+    with app.app_context():
+        connection = db.session.connection()
+        if not needs_migration(connection):
+            return False
+
+        # created before leave rows were versioned
+        has_version = 'version_id' in get_leave_columns(connection)
+        if connection.dialect.name == 'sqlite':
+            convert_sqlite(connection, has_version)
+        else:
+            convert(connection, has_version)
+
+        LeaveModel.rebuild_usage()
+        LeaveVersionModel.bump_all()
+        db.session.commit()
+
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('uri', help='database uri, ex. sqlite:////var/lib/leave/leave.db')
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.uri, 'LEAVE_INDEX_ENABLED': False,
+        'LEAVE_CACHE_ENABLED': False})
+    if migrate(app):
+        print('Migrated leave dates')
+    else:
+        print('Leave dates already migrated')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+Creates the leave table indexes missing from a database created before they
+were added (create_all skips existing tables), ex. the (start_date, end_date,
+user_id) index of the calendar and analytics window queries. Existing
+indexes are left as they are, so it can be run again safely.
+
+Run with:
+
+    python3 -m backend.migrations.leave_indexes sqlite:////var/lib/leave/leave.db
+'''
+
+import argparse
+from typing import List
+
+from flask import Flask
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.server import create_app
+
+
+def migrate(app: Flask) -> List[str]:
+    '''
+    Create the app's missing leave table indexes in a single transaction.
+    Returns the names of the indexes created.
+    '''
+    with app.app_context():
+        connection = db.session.connection()
+        existing = {index['name'] for index in
+            inspect(connection).get_indexes(LeaveModel.__tablename__)}
+
+        created = []
+        for index in sorted(LeaveModel.__table__.indexes, key=lambda index: index.name):
+            connection.execute(CreateIndex(index, if_not_exists=True))
+            if index.name not in existing:
+                created.append(index.name)
+        db.session.commit()
+
+    return created
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('uri', help='database uri, ex. sqlite:////var/lib/leave/leave.db')
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.uri, 'LEAVE_INDEX_ENABLED': False,
+        'LEAVE_CACHE_ENABLED': False})
+    created = migrate(app)
+    print('Created %s' % (', '.join(created)) if created else 'Leave indexes up to date')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+'''
+Rebuilds the usage ledger from the leave table with the working day calendar
+of a region, after the calendar of an existing database changed (a new
+LEAVE_REGION or holidays). Every user's leave version is bumped (cached
+responses and etags carried the old balances).
+
+Run with (the server should be stopped) the region the server will use,
+read from LEAVE_REGION and LEAVE_REGIONS_FILE like backend/wsgi.py:
+
+    LEAVE_REGION=weekdays python3 -m backend.migrations.leave_usage \
+        sqlite:////var/lib/leave/leave.db
+'''
+
+import argparse
+import os
+
+from flask import Flask
+
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.models.version import LeaveVersionModel
+from backend.models.workdays import get_regions
+from backend.server import create_app
+
+
+def rebuild(app: Flask) -> None:
+    '''
+    Rebuild the app's usage ledger in a single transaction
+    '''
+    with app.app_context():
+        LeaveModel.rebuild_usage()
+        LeaveVersionModel.bump_all()
+        db.session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('uri', help='database uri, ex. sqlite:////var/lib/leave/leave.db')
+    parser.add_argument('--region', default=os.environ.get('LEAVE_REGION'),
+        help='working day calendar (default LEAVE_REGION, every day if unset)')
+    parser.add_argument('--regions-file', default=os.environ.get('LEAVE_REGIONS_FILE'),
+        help='json calendars of the regions (default LEAVE_REGIONS_FILE)')
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.uri, 'LEAVE_INDEX_ENABLED': False,
+        'LEAVE_CACHE_ENABLED': False, 'LEAVE_REGION': args.region,
+        'LEAVE_REGIONS': get_regions(args.regions_file)})
+    rebuild(app)
+    print('Rebuilt the leave usage ledger (region: %s)' % (args.region or 'every day'))
+
+
+if __name__ == '__main__':
+    main()
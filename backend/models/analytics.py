@@ -0,0 +1,140 @@
+'''
+Columnar leave analytics over a window of days: how many people are out each
+day and how many days each user used. Leaves are (user id, start, end) columns
+of day offsets from the first day of the window, computed with numpy when it
+is installed (pip install -e .[analytics]) and in plain python otherwise.
+'''
+
+from collections import namedtuple
+from itertools import accumulate, chain
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError: # optional, the python versions give the same results
+    np = None
+
+
+# user ids, start and end day offsets (inclusive, may fall outside the window)
+LeaveColumns = namedtuple('LeaveColumns', ('user_ids', 'starts', 'ends'))
+
+
+def to_columns(rows: Sequence[Tuple[int, int, int]]) -> LeaveColumns:
+    '''
+    Split (user id, start offset, end offset) rows into columns, numpy arrays
+    if numpy is installed
+    '''
+    if np is None:
+        return LeaveColumns(*(list(column) for column in zip(*rows))) if rows \
+            else LeaveColumns([], [], [])
+
+    array = np.fromiter(chain.from_iterable(rows), dtype=np.int64,
+        count=3 * len(rows)).reshape(-1, 3)
+    return LeaveColumns(array[:, 0], array[:, 1], array[:, 2])
+
+
+def headcount(columns: LeaveColumns, days: int) -> List[int]:
+    '''
+    Number of users out on each of the window's days, a user with
+    overlapping leaves counted once
+    '''
+    if np is None:
+        return headcount_python(columns, days)
+    return headcount_numpy(columns, days).tolist()
+
+
+def days_used(columns: LeaveColumns, counts: Sequence[int]) -> Tuple[List[int], List[int]]:
+    '''
+    Leave days used within the window per user, as (sorted user ids, days
+    used) lists, counts being the charged days before each day of the window
+    (WorkCalendar.window). Leaves are counted separately like
+    get_leave_days_in_year, which this matches for a window of a whole year.
+    '''
+    if np is None:
+        return days_used_python(columns, counts)
+
+    user_ids, used = days_used_numpy(columns, counts)
+    return user_ids.tolist(), used.tolist()
+
+
+def headcount_numpy(columns: LeaveColumns, days: int) -> 'np.ndarray':
+    '''
+    Difference array of the leaves clipped to the window, each user's leaves
+    first trimmed to start after the ones before them so they don't overlap
+    '''
+    # order by (user id, start) with one sort of a combined key, much faster
+    # than lexsort (the order of equal keys doesn't matter)
+    order = np.zeros(0, dtype=np.int64)
+    if len(columns.starts):
+        starts = columns.starts - columns.starts.min()
+        order = np.argsort(columns.user_ids * (int(starts.max()) + 1) + starts)
+    user_ids = columns.user_ids[order]
+    starts = np.maximum(columns.starts[order], 0)
+    ends = np.minimum(columns.ends[order], days - 1)
+
+    # running latest end per user: offset each user's ends past the previous
+    # user's so a single cumulative maximum doesn't carry across users
+    span = days + 1
+    offsets = np.zeros(len(user_ids), dtype=np.int64)
+    if len(user_ids):
+        offsets[1:] = np.cumsum(user_ids[1:] != user_ids[:-1]) * span
+    reached = np.maximum.accumulate(ends + offsets)
+    previous = np.empty_like(reached)
+    previous[:1] = -1
+    previous[1:] = reached[:-1]
+    starts = np.maximum(starts, previous - offsets + 1)
+
+    keep = starts <= ends
+    changes = np.zeros(span, dtype=np.int64)
+    np.add.at(changes, starts[keep], 1)
+    np.add.at(changes, ends[keep] + 1, -1)
+    return np.cumsum(changes[:-1])
+
+
+def headcount_python(columns: LeaveColumns, days: int) -> List[int]:
+    '''
+    headcount_numpy one leave at a time
+    '''
+    changes = [0] * (days + 1)
+    reached = {} # user id -> latest end counted
+    for user_id, start, end in sorted(zip(*columns)):
+        start = max(start, 0, reached.get(user_id, -1) + 1)
+        end = min(end, days - 1)
+        if start > end:
+            continue
+
+        reached[user_id] = end
+        changes[start] += 1
+        changes[end + 1] -= 1
+
+    return list(accumulate(changes[:-1]))
+
+
+def days_used_numpy(columns: LeaveColumns,
+    counts: Sequence[int]) -> Tuple['np.ndarray', 'np.ndarray']:
+    '''
+    Clamp the leaves to the window, look up their charged days in the
+    cumulative counts (like numpy.busday_count) and sum them per user
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    days = len(counts) - 1
+    lengths = np.maximum(counts[np.clip(columns.ends, -1, days - 1) + 1] -
+        counts[np.clip(columns.starts, 0, days)], 0)
+    user_ids, users = np.unique(columns.user_ids, return_inverse=True)
+    return user_ids, np.bincount(users, weights=lengths,
+        minlength=len(user_ids)).astype(np.int64)
+
+
+def days_used_python(columns: LeaveColumns,
+    counts: Sequence[int]) -> Tuple[List[int], List[int]]:
+    '''
+    days_used_numpy one leave at a time
+    '''
+    days = len(counts) - 1
+    used = {}
+    for user_id, start, end in zip(*columns):
+        used[user_id] = used.get(user_id, 0) + max(
+            counts[min(max(end, -1), days - 1) + 1] - counts[min(max(start, 0), days)], 0)
+
+    user_ids = sorted(used)
+    return user_ids, [used[user_id] for user_id in user_ids]
@@ -3,6 +3,107 @@ Database
 '''
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
 
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+
+
+DEFAULT_DATABASE_URI = 'sqlite:///:memory:' # use memory for debug
+
+# pragmas set on every file backed sqlite connection, see
+# https://www.sqlite.org/pragma.html
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL', # readers do not block the writer (and vice versa)
+    'synchronous': 'NORMAL', # fsync on checkpoints only, safe with WAL
+    'cache_size': -64 * 1024, # 64 MiB page cache (negative is KiB)
+    'mmap_size': 256 * 1024 * 1024, # memory map up to 256 MiB of the file
+    'busy_timeout': 5000, # ms to wait for the write lock
+    'temp_store': 'MEMORY'
+}
+
+
+def is_sqlite_file(uri: str) -> bool:
+    '''
+    Check if a database uri is a file backed sqlite database
+    '''
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def is_sqlite_memory(uri: str) -> bool:
+    '''
+    Check if a database uri is an in memory sqlite database, a single
+    connection shared by every thread
+    '''
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def configure_engine(app) -> None:
+    '''
+    Set the engine options for the configured database before the engine is
+    created. File backed sqlite databases get a connection pool shared
+    across threads so concurrent readers do not wait on each other.
+    '''
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', DEFAULT_DATABASE_URI)
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    app.config.setdefault('SQLITE_PRAGMAS', SQLITE_PRAGMAS)
+    app.config.setdefault('DATABASE_POOL_SIZE', 8)
+    app.config.setdefault('DATABASE_MAX_OVERFLOW', 8)
+
+    if not is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+
+    options = {
+        'poolclass': QueuePool,
+        'pool_size': app.config['DATABASE_POOL_SIZE'],
+        'max_overflow': app.config['DATABASE_MAX_OVERFLOW'],
+        'connect_args': {
+            'check_same_thread': False, # pooled connections move between threads
+            'timeout': app.config['SQLITE_PRAGMAS'].get('busy_timeout', 5000) / 1000
+        }
+    }
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def set_sqlite_pragmas(engine: Engine, pragmas: dict) -> None:
+    '''
+    Set pragmas on every new connection of a file backed sqlite engine.
+    Must be called before the engine first connects.
+    '''
+    if not is_sqlite_file(str(engine.url)):
+        return
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        cursor.close()
+
+
+def set_sqlite_transactions(engine: Engine) -> None:
+    '''
+    Let sqlalchemy begin the transactions of a file backed sqlite engine
+    instead of the driver (which begins lazily on the first write, after the
+    reads the write depends on). Connections with the begin_immediate
+    execution option take the write lock when they begin.
+    Must be called before the engine first connects.
+    '''
+    if not is_sqlite_file(str(engine.url)):
+        return
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        if connection.get_execution_options().get('begin_immediate'):
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+        else:
+            connection.exec_driver_sql('BEGIN')
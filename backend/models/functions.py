@@ -0,0 +1,52 @@
+'''
+Dialect specific sql functions
+'''
+
+from sqlalchemy import Integer, Table, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.dml import Insert
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class day_diff(FunctionElement):
+    '''
+    Whole days between two dates (end - start)
+    '''
+    type = Integer()
+    name = 'day_diff'
+    inherit_cache = True
+
+
+@compiles(day_diff)
+def compile_day_diff(element, compiler, **kw):
+    # julianday of a date is a whole day number (plus one half), so the
+    # difference is exact
+    start, end = list(element.clauses)
+    return 'CAST(julianday(%s) - julianday(%s) AS INTEGER)' % (
+        compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+@compiles(day_diff, 'postgresql')
+def compile_day_diff_postgresql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return '(%s - %s)' % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+@compiles(day_diff, 'mysql')
+def compile_day_diff_mysql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return 'DATEDIFF(%s, %s)' % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+def insert_ignore(table: Table, dialect_name: str) -> Insert:
+    '''
+    Insert statement that skips rows whose primary key already exists,
+    including rows inserted by a concurrent transaction
+    '''
+    if dialect_name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect_name == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+
+    return insert(table).prefix_with('IGNORE', dialect='mysql')
@@ -0,0 +1,231 @@
+'''
+In process per-user leave interval index
+'''
+
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from datetime import date
+from itertools import accumulate
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+
+from backend.models.db import db
+from backend.models.transaction import get_begin_value, record_on_begin
+
+
+LeaveEntry = namedtuple('LeaveEntry', ['start_date', 'id', 'user_id', 'end_date'])
+
+
+class UserLeaveIntervals:
+    '''
+    Immutable sorted array of a user's leaves. Leaves are ordered by start
+    date with a running maximum of end dates, so the first leave that can
+    overlap a date is found by bisection.
+    '''
+    def __init__(self, entries: Iterable[LeaveEntry]) -> None:
+        self.entries = sorted(entries)
+        self.starts = [entry.start_date for entry in self.entries]
+        self.max_ends = list(accumulate((entry.end_date for entry in self.entries), max))
+
+
+    def overlapping(self, date_from: date,
+        date_to: Optional[date] = None) -> List[LeaveEntry]:
+        '''
+        Return leaves ending on or after date_from (and starting on or before
+        date_to if given) ordered by start date in O(log n + k)
+        '''
+        low = bisect_left(self.max_ends, date_from)
+        high = len(self.entries) if date_to is None else bisect_right(self.starts, date_to)
+
+        return [entry for entry in self.entries[low:high] if entry.end_date >= date_from]
+
+
+    def insert(self, entry: LeaveEntry) -> 'UserLeaveIntervals':
+        '''
+        Return a copy with the leave added
+        '''
+        entries = list(self.entries)
+        insort(entries, entry)
+        return UserLeaveIntervals(entries)
+
+
+    def remove(self, id: int) -> 'UserLeaveIntervals':
+        '''
+        Return a copy with the leave removed
+        '''
+        return UserLeaveIntervals(entry for entry in self.entries if entry.id != id)
+
+
+def has_changes(session) -> bool:
+    '''
+    Check if a session has changes, pending or flushed by model methods
+    (which stage their index updates to run after commit)
+    '''
+    return bool(session.new or session.dirty or session.deleted
+        or session.info.get('after_commit'))
+
+
+class LeaveIndexState:
+    '''
+    Per application index state
+    '''
+    def __init__(self) -> None:
+        self.users: Dict[int, UserLeaveIntervals] = {}
+        self.writes: Dict[int, int] = {} # per user last write, to detect stale warms
+        self.sequence = 0 # last write
+        self.epoch = 0 # bumped when the whole index is cleared
+        self.lock = Lock()
+
+
+class LeaveIndex:
+    '''
+    Lazily warmed per-user leave interval index kept up to date by the leave
+    model write hooks. Reads are lock free since user intervals are replaced,
+    never mutated.
+
+    The index lives in process memory, so it must be disabled
+    (LEAVE_INDEX_ENABLED = False) when several processes write the database.
+    '''
+    def __init__(self, app=None) -> None:
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app) -> None:
+        '''
+        Register the index on the application
+        '''
+        app.config.setdefault('LEAVE_INDEX_ENABLED', True)
+        app.extensions['leave_index'] = LeaveIndexState()
+
+
+    @property
+    def state(self) -> Optional[LeaveIndexState]:
+        '''
+        Index state for the current application, None if disabled
+        '''
+        if not current_app.config.get('LEAVE_INDEX_ENABLED'):
+            return None
+
+        return current_app.extensions.get('leave_index')
+
+
+    @property
+    def enabled(self) -> bool:
+        '''
+        Check if the index is enabled for the current application
+        '''
+        return self.state is not None
+
+
+    def get_user(self, user_id: int,
+        loader: Callable[[int], Iterable[LeaveEntry]]) -> UserLeaveIntervals:
+        '''
+        Get a user's intervals, warming them with loader if not indexed.
+        Intervals loaded by a session with changes (which the loader may
+        flush and see) are not indexed, the transaction could roll back.
+        Neither are intervals loaded from a snapshot missing a write of the
+        user committed since (writes are counted from before the
+        transaction began, as the snapshot may have been taken earlier in
+        the request).
+        '''
+        state = self.state
+        intervals = state.users.get(user_id)
+        if intervals is not None:
+            return intervals
+
+        if has_changes(db.session):
+            return UserLeaveIntervals(loader(user_id))
+
+        intervals = UserLeaveIntervals(loader(user_id))
+        version = get_begin_value('leave_index') # None if enabled since
+
+        with state.lock:
+            if version is not None and state.epoch == version[0] \
+                and state.writes.get(user_id, 0) <= version[1]:
+                state.users[user_id] = intervals
+
+        return intervals
+
+
+    def get_version(self) -> Optional[Tuple[int, int]]:
+        '''
+        Get the epoch and last write of the index, None if disabled
+        '''
+        state = self.state
+        if state is None:
+            return None
+
+        return state.epoch, state.sequence
+
+
+    def add(self, entry: LeaveEntry) -> None:
+        '''
+        Index a new leave
+        '''
+        self._write(entry.user_id, lambda intervals: intervals.insert(entry))
+
+
+    def update(self, entry: LeaveEntry) -> None:
+        '''
+        Re-index an updated leave
+        '''
+        self._write(entry.user_id,
+            lambda intervals: intervals.remove(entry.id).insert(entry))
+
+
+    def remove(self, user_id: int, id: int) -> None:
+        '''
+        Remove a leave from the index
+        '''
+        self._write(user_id, lambda intervals: intervals.remove(id))
+
+
+    def invalidate(self, user_id: int) -> None:
+        '''
+        Drop a user's intervals so they are reloaded on next access
+        '''
+        state = self.state
+        if state is None:
+            return
+
+        with state.lock:
+            state.sequence += 1
+            state.writes[user_id] = state.sequence
+            state.users.pop(user_id, None)
+
+
+    def clear(self) -> None:
+        '''
+        Drop all indexed intervals
+        '''
+        state = self.state
+        if state is None:
+            return
+
+        with state.lock:
+            state.epoch += 1
+            state.users.clear()
+
+
+    def _write(self, user_id: int,
+        change: Callable[[UserLeaveIntervals], UserLeaveIntervals]) -> None:
+        '''
+        Apply a committed change to a user's intervals if they are indexed
+        '''
+        state = self.state
+        if state is None:
+            return
+
+        with state.lock:
+            state.sequence += 1
+            state.writes[user_id] = state.sequence
+            intervals = state.users.get(user_id)
+            if intervals is not None:
+                state.users[user_id] = change(intervals)
+
+
+leave_index = LeaveIndex()
+record_on_begin('leave_index', leave_index.get_version)
@@ -2,42 +2,81 @@
 Leave database entry model
 '''
 
-from datetime import datetime, timedelta
-from typing import List
-from sqlalchemy import and_, or_, extract
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import and_, case, event, func, literal, orm, select
 
+from backend.models import analytics, planner
+from backend.models.analytics import LeaveColumns, to_columns
 from backend.models.db import db
+from backend.models.functions import day_diff
+from backend.models.index import LeaveEntry, leave_index
+from backend.models.sweep import Segment, absence_segments
+from backend.models.transaction import after_commit
+from backend.models.usage import LeaveUsageModel
+from backend.models.version import LeaveVersionModel
 from backend.models.user import UserModel # needed for foreign key relationship
+from backend.models.workdays import work_calendars
 
 
-MAX_YEARLY_LEAVE = timedelta(weeks=12)
+MAX_YEARLY_LEAVE = timedelta(weeks=12) # days charged per year, see workdays.py
 
 
 class LeaveModel(db.Model):
     '''
-    Define leave database table
+    Define leave database table. Write methods only stage changes in the
+    session, which is committed once per request.
     '''
     __tablename__ = 'leave_table'
+    __table_args__ = (
+        db.Index('ix_leave_user_start', 'user_id', 'start_date'),
+        db.Index('ix_leave_user_end', 'user_id', 'end_date'),
+        db.Index('ix_leave_start_end_user', 'start_date', 'end_date', 'user_id'),
+    )
 
     id = db.Column('id', db.Integer, primary_key=True)
     user_id = db.Column('user_id', db.Integer, db.ForeignKey('user_table.id'), nullable=False)
-    start_date = db.Column('start_date', db.DateTime, nullable=False)
-    end_date = db.Column('end_date', db.DateTime, nullable=False)
+    # leaves are whole days (see backend/migrations/leave_dates.py for
+    # databases created with DateTime columns)
+    start_date = db.Column('start_date', db.Date, nullable=False)
+    end_date = db.Column('end_date', db.Date, nullable=False)
+    version_id = db.Column('version_id', db.Integer, nullable=False)
+
+    # updates check and bump the row version, failing with a StaleDataError
+    # if the leave was changed concurrently
+    __mapper_args__ = {'version_id_col': version_id}
 
     # todo: make id the only primary key with an array of start/end dates
-    # leaves = db.Column('leaves', db.ARRAY(db.DateTime, dimensions=2), nullable=False)
-    # todo: add remaining leave days
-    # remaining_leave_days = db.Column('remaining_leave_days', db.Integer, nullable=False)
+    # leaves = db.Column('leaves', db.ARRAY(db.Date, dimensions=2), nullable=False)
+    # note: remaining leave days are kept per user and year in LeaveUsageModel
 
 
-    def __init__(self, user_id: int, start_date: datetime, end_date: datetime) -> None:
+    def __init__(self, user_id: int, start_date: date, end_date: date) -> None:
         '''
         Initialize a new leave entry
         '''
         self.user_id = user_id
         self.start_date = start_date
         self.end_date = end_date
-        
+        self._stored_period = None
+
+
+    @orm.reconstructor
+    def init_on_load(self) -> None:
+        '''
+        Remember the stored leave period when loaded from the database so the
+        usage ledger can be adjusted on update/delete
+        '''
+        self._stored_period = (self.start_date, self.end_date)
+
+
+    @orm.validates('start_date', 'end_date')
+    def validate_date(self, key: str, value: date) -> date:
+        '''
+        Store whole days, dropping the time of datetimes
+        '''
+        return LeaveModel.to_date(value)
+
 
     def __repr__(self) -> str:
         '''
@@ -56,13 +95,44 @@ class LeaveModel(db.Model):
         return cls.query.all()
 
 
+    @classmethod
+    def get_rows(cls, after_id: int = 0,
+        limit: Optional[int] = None) -> List[Tuple[int, int, date, date]]:
+        '''
+        Get (id, user_id, start_date, end_date) rows of leave entries with ids
+        after after_id ordered by id, without loading model objects
+        '''
+        query = cls.select_rows().where(cls.id > after_id).limit(limit)
+        return db.session.execute(query).all()
+
+
+    @classmethod
+    def iter_rows(cls, chunk_size: int) -> Iterator[Tuple[int, int, date, date]]:
+        '''
+        Iterate over (id, user_id, start_date, end_date) rows of all leave
+        entries ordered by id, fetching chunk_size rows at a time
+        '''
+        query = cls.select_rows().execution_options(yield_per=chunk_size)
+        return iter(db.session.execute(query))
+
+
+    @classmethod
+    def select_rows(cls):
+        '''
+        Core select of the serialized leave columns, ordered by id
+        '''
+        return select(cls.id, cls.user_id, cls.start_date, cls.end_date).order_by(cls.id)
+
+
     @classmethod
     def delete_all(cls) -> int:
         '''
         Delete all leaves from the database
         '''
         deleted = cls.query.delete()
-        db.session.commit()
+        LeaveUsageModel.delete_all()
+        LeaveVersionModel.bump_all()
+        after_commit(leave_index.clear)
         return deleted
 
 
@@ -74,68 +144,354 @@ class LeaveModel(db.Model):
         return cls.query.get(id)
 
 
+    @classmethod
+    def get_leave_with_version(cls, id: int) -> Tuple[Optional['LeaveModel'], int]:
+        '''
+        Get a leave entry and the current version of its user in one query
+        '''
+        row = db.session.query(
+            cls, func.coalesce(LeaveVersionModel.version, 0)
+        ).outerjoin(
+            LeaveVersionModel, LeaveVersionModel.user_id == cls.user_id
+        ).filter(
+            cls.id == id
+        ).first()
+
+        return row if row else (None, 0)
+
+
     @classmethod
     def get_leave_remaining(cls, user_id: int, year: int) -> int:
         '''
         Get the number of remaining leave days for a user in the past year
+        from the usage ledger
+        '''
+        return MAX_YEARLY_LEAVE.days - LeaveUsageModel.get_days_used(user_id, year)
+
 
-        Assumes a leave can straddle one year boundary for both start/end date
+    @classmethod
+    def get_leave_remaining_by_year(cls, user_id: int, from_year: int,
+        to_year: int) -> Dict[int, int]:
+        '''
+        Get the number of remaining leave days for a user in each year of an
+        inclusive range with a single ledger query
+        '''
+        return {year: MAX_YEARLY_LEAVE.days - days_used for year, days_used in
+            LeaveUsageModel.get_days_used_by_year(user_id, from_year, to_year).items()}
+
+
+    @classmethod
+    def get_leave_remaining_for(cls,
+        keys: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], int]:
+        '''
+        Get the number of remaining leave days for each (user id, year) with a
+        single ledger query
         '''
-        leave_year_start = datetime(year, 1, 1)
-        leave_year_end = datetime(year, 12, 31)
+        return {key: MAX_YEARLY_LEAVE.days - days_used for key, days_used in
+            LeaveUsageModel.get_days_used_for(keys).items()}
+
 
-        user_leaves = cls.query.filter(
+    @classmethod
+    def get_leave_remaining_all(cls, year: int,
+        user_ids: Optional[List[int]] = None) -> Iterator[Tuple[int, int]]:
+        '''
+        Get (user id, remaining leave days) for every user (or the given
+        users) in a year with a single query, streamed in user id order.
+        Users without leave in the year have the full allotment.
+        '''
+        query = db.session.query(
+            UserModel.id,
+            MAX_YEARLY_LEAVE.days - func.coalesce(LeaveUsageModel.days_used, 0)
+        ).outerjoin(
+            LeaveUsageModel,
             and_(
-                cls.user_id == user_id, 
-                or_(
-                    and_(cls.start_date >= leave_year_start,
-                        cls.end_date <= leave_year_end), # in leave year
-                    extract('year', cls.end_date) == leave_year_start.year + 1, # starts previous year
-                    extract('year', cls.start_date) == leave_year_end.year # ends after year
-                )
+                LeaveUsageModel.user_id == UserModel.id,
+                LeaveUsageModel.year == year
             )
-        ).all()
+        )
 
-        days_used = sum([LeaveModel.get_leave_days_in_year(
-            leave.start_date, leave.end_date, year) for leave in user_leaves])
+        if user_ids is not None:
+            query = query.filter(UserModel.id.in_(user_ids))
 
-        return MAX_YEARLY_LEAVE.days - days_used
+        return query.order_by(UserModel.id).yield_per(1000)
 
 
     @classmethod
-    def leave_period_valid(cls, leave: 'LeaveModel') -> bool:
+    def get_max_end_date(cls, user_id: int, start_date: date) -> Optional[date]:
         '''
-        Check if a leave period does not exceed remaining leave days for the
-        date range it spans
+        Get the latest end date the remaining leave days allow for a new
+        leave of a user starting on start_date (None if none), from a single
+        ledger query
         '''
-        for year in range(leave.start_date.year, leave.end_date.year + 1):
-            remaining_leave_days = cls.get_leave_remaining(leave.user_id, year)
-            new_leave_days = cls.get_leave_days_in_year(leave.start_date, leave.end_date, year)
-            
-            if remaining_leave_days - new_leave_days < 0:
-                return False
+        calendar = work_calendars.current
+        max_span = calendar.max_span(MAX_YEARLY_LEAVE.days) or planner.MAX_SEARCH_SPAN
+        last_date = start_date + min(max_span, date.max - start_date)
+        remaining = cls.get_leave_remaining_by_year(user_id, start_date.year, last_date.year)
+        return planner.max_end_date(start_date, last_date, remaining, calendar)
 
-        return True
+
+    @classmethod
+    def get_available_period(cls, user_id: int, days: int,
+        date_from: date) -> Optional[Tuple[date, date]]:
+        '''
+        Get the earliest period of days days from date_from on that the
+        remaining leave days allow and that overlaps none of the user's
+        leaves, starting at most MAX_SEARCH_SPAN after date_from (None if
+        none), from a ledger query and a leave query
+        '''
+        length = timedelta(days=days - 1)
+        if date.max - date_from < length:
+            return None
+        last_start = date_from + min(planner.MAX_SEARCH_SPAN, date.max - length - date_from)
+        remaining = cls.get_leave_remaining_by_year(user_id, date_from.year,
+            (last_start + length).year)
+        scheduled = [(leave.start_date, leave.end_date)
+            for leave in cls.get_leave_from(user_id, date_from)]
+
+        start_date = planner.earliest_start(date_from, last_start, days, remaining, scheduled,
+            work_calendars.current)
+        return (start_date, start_date + length) if start_date else None
+
+
+    @classmethod
+    def get_leave_used(cls, user_id: int, year: int) -> int:
+        '''
+        Get the number of leave days used by a user in a year, aggregated
+        from the leave table (reference for the usage ledger)
+
+        Leaves are clamped to the year and summed in a single sql aggregate,
+        matching get_leave_days_in_year, or counted with the working day
+        calendar if not every day is charged. Range comparisons on the raw
+        columns (rather than extracting the year) keep the query on the
+        (user_id, start_date/end_date) indexes.
+        '''
+        leave_year_start = date(year, 1, 1)
+        leave_year_end = date(year, 12, 31)
+        next_year_start = date(year + 1, 1, 1)
+        in_year = and_(
+            cls.user_id == user_id,
+            cls.start_date < next_year_start, # starts before year ends
+            cls.end_date >= leave_year_start # ends after year starts
+        )
+
+        calendar = work_calendars.current
+        if not calendar.every_day:
+            return sum(calendar.count_in_year(start_date, end_date, year) for start_date, end_date
+                in db.session.query(cls.start_date, cls.end_date).filter(in_year))
+
+        start_in_year = case(
+            (cls.start_date < leave_year_start, literal(leave_year_start, db.Date)),
+            else_=cls.start_date)
+        end_in_year = case(
+            (cls.end_date >= next_year_start, literal(leave_year_end, db.Date)),
+            else_=cls.end_date)
+
+        return db.session.query(
+            func.coalesce(func.sum(day_diff(start_in_year, end_in_year) + 1), 0)
+        ).filter(in_year).scalar()
+
+
+    @classmethod
+    def rebuild_usage(cls) -> None:
+        '''
+        Rebuild the usage ledger from the leave table, counting the days used
+        per user a year at a time from the year's leave columns
+        '''
+        LeaveUsageModel.delete_all()
+
+        first_date, last_date = db.session.query(
+            func.min(cls.start_date), func.max(cls.end_date)).one()
+        if first_date is None:
+            return
+
+        days = {}
+        for year in range(first_date.year, last_date.year + 1):
+            year_start = date(year, 1, 1)
+            counts = work_calendars.current.window(year_start,
+                (date(year + 1, 1, 1) - year_start).days)
+            # unbounded, the leaves may not fit the allotment
+            user_ids, days_used = analytics.days_used(
+                cls.get_columns(year_start, date(year, 12, 31), False), counts)
+            days.update(((user_id, year), used) for user_id, used in zip(user_ids, days_used))
+
+        LeaveUsageModel.apply_all(days)
+
+
+    @classmethod
+    def get_leave_from(cls, user_id: int, date_from: date) -> List['LeaveModel']:
+        '''
+        Get leave entries for a user starting on a given date moving forward,
+        served from the interval index when enabled
+        '''
+        date_from = cls.to_date(date_from)
+        if leave_index.enabled:
+            return leave_index.get_user(user_id, cls.get_leave_entries).overlapping(date_from)
+
+        return cls.query.filter(
+            and_(
+                cls.user_id == user_id,
+                cls.end_date >= date_from # start_date <= end_date, so covers both
+            )
+        ).order_by(
+            cls.start_date
+        ).all()
 
 
     @classmethod
-    def get_leave_from(cls, user_id: int, date_from: datetime) -> List['LeaveModel']:
+    def get_leave_overlapping(cls, user_id: int, start_date: date,
+        end_date: date) -> List['LeaveModel']:
         '''
-        Get leave entries for a user starting on a given date moving forward
+        Get leave entries for a user overlapping a date range (inclusive),
+        served from the interval index when enabled
         '''
+        start_date, end_date = cls.to_date(start_date), cls.to_date(end_date)
+        if leave_index.enabled:
+            return leave_index.get_user(user_id, cls.get_leave_entries).overlapping(
+                start_date, end_date)
+
         return cls.query.filter(
             and_(
                 cls.user_id == user_id,
-                or_(
-                    cls.start_date >= date_from,
-                    cls.end_date >= date_from
-                )
+                cls.start_date <= end_date,
+                cls.end_date >= start_date
             )
         ).order_by(
             cls.start_date
         ).all()
 
 
+    @classmethod
+    def get_absences(cls, date_from: date, date_to: date,
+        user_ids: Optional[List[int]] = None) -> Iterator[Segment]:
+        '''
+        Get the runs of days between two dates (inclusive) with the same set
+        of users (or of the given users) out, from a single range query
+        swept in start date order
+        '''
+        query = db.session.query(
+            cls.start_date, cls.end_date, cls.user_id
+        ).filter(
+            cls.overlapping(date_from, date_to)
+        )
+
+        if user_ids is not None:
+            query = query.filter(cls.user_id.in_(user_ids))
+
+        return absence_segments(query.order_by(cls.start_date).yield_per(1000),
+            date_from, date_to)
+
+
+    @classmethod
+    def get_columns(cls, date_from: date, date_to: date, bounded: bool = True) -> LeaveColumns:
+        '''
+        Get the leaves overlapping two dates (inclusive) as user id, start
+        and end columns, the dates as day offsets from date_from computed by
+        the database so no date objects are built. See overlapping for
+        bounded.
+        '''
+        window_start = literal(date_from, db.Date)
+        rows = db.session.execute(
+            select(
+                cls.user_id,
+                day_diff(window_start, cls.start_date),
+                day_diff(window_start, cls.end_date)
+            ).where(
+                cls.overlapping(date_from, date_to, bounded)
+            )
+        ).fetchall()
+
+        return to_columns(rows)
+
+
+    @classmethod
+    def overlapping(cls, date_from: date, date_to: date, bounded: bool = True):
+        '''
+        Filter of the leaves overlapping two dates (inclusive). If bounded,
+        start dates are also bounded by the longest leave the yearly
+        allotment allows so the query only reads the window from the
+        start/end date index (leaves added without the allotment check, ex.
+        before a calendar change, may be missed).
+        '''
+        conditions = [cls.start_date <= date_to, cls.end_date >= date_from]
+        max_span = work_calendars.current.max_span(MAX_YEARLY_LEAVE.days)
+        if bounded and max_span is not None and date_from - date.min > max_span:
+            conditions.append(cls.start_date >= date_from - max_span)
+
+        return and_(*conditions)
+
+
+    @classmethod
+    def get_leave_mergeable(cls, leave: 'LeaveModel') -> List['LeaveModel']:
+        '''
+        Get the other leave entries of the leave's user that overlap or are
+        adjacent to it, directly or through each other, ordered by start date
+        '''
+        start_date, end_date = leave.start_date, leave.end_date
+        mergeable = {}
+
+        while True:
+            found = [other for other in cls.get_leave_overlapping(leave.user_id,
+                start_date - timedelta(days=1), end_date + timedelta(days=1))
+                if other.id != leave.id and other.id not in mergeable]
+            if not found:
+                break
+
+            for other in found:
+                mergeable[other.id] = cls.get_leave(other.id)
+                start_date = min(start_date, other.start_date)
+                end_date = max(end_date, other.end_date)
+
+        return sorted(mergeable.values(), key=lambda other: (other.start_date, other.id))
+
+
+    @classmethod
+    def compact_all(cls) -> Tuple[int, int]:
+        '''
+        Coalesce all overlapping and adjacent leaves of each user into single
+        entries. Returns the number of leaves updated and deleted.
+        '''
+        groups = []
+        group_end = None
+
+        for id, user_id, start_date, end_date in db.session.query(
+            cls.id, cls.user_id, cls.start_date, cls.end_date
+        ).order_by(
+            cls.user_id, cls.start_date, cls.id
+        ):
+            if groups and groups[-1][0] == user_id \
+                and start_date <= group_end + timedelta(days=1):
+                groups[-1][1].append(id)
+                group_end = max(group_end, end_date)
+            else:
+                groups.append((user_id, [id]))
+                group_end = end_date
+
+        updated = deleted = 0
+        for _, ids in groups:
+            if len(ids) == 1:
+                continue
+
+            leaves = cls.query.filter(cls.id.in_(ids)).order_by(cls.start_date, cls.id).all()
+            leave = leaves[0]
+            leave.end_date = max(other.end_date for other in leaves)
+            leave.coalesce(leaves[1:], None) # merging never adds leave days
+            updated += 1
+            deleted += len(leaves) - 1
+
+        return updated, deleted
+
+
+    @classmethod
+    def get_leave_entries(cls, user_id: int) -> List[LeaveEntry]:
+        '''
+        Get all leave entries for a user as plain index entries
+        '''
+        return [LeaveEntry(start_date, id, user_id, end_date)
+            for id, start_date, end_date in db.session.query(
+                cls.id, cls.start_date, cls.end_date
+            ).filter(cls.user_id == user_id)]
+
+
     @staticmethod
     def get_leave_days(leave: 'LeaveModel') -> int:
         '''
@@ -145,20 +501,22 @@ class LeaveModel(db.Model):
 
 
     @staticmethod
-    def get_leave_days_in_year(start_date: datetime, end_date: datetime, year: int) -> int:
+    def get_leave_days_in_year(start_date: date, end_date: date, year: int) -> int:
         '''
-        Return leave days used for given start and end date in given year
+        Return leave days used for given start and end date in given year,
+        the days charged by the working day calendar (every day by default)
         '''
-        if not (start_date.year <= year and end_date.year >= year):
-            return 0
+        return work_calendars.current.count_in_year(start_date, end_date, year)
 
-        if start_date.year < year:
-            start_date = datetime(year, 1, 1)
 
-        if end_date.year > year:
-            end_date = datetime(year, 12, 31)
-
-        return (end_date - start_date).days + 1
+    @staticmethod
+    def get_leave_days_by_year(start_date: date, end_date: date) -> Dict[int, int]:
+        '''
+        Return leave days used for given start and end date in each year spanned
+        '''
+        calendar = work_calendars.current
+        return {year: calendar.count_in_year(start_date, end_date, year)
+            for year in range(start_date.year, end_date.year + 1)}
 
 
     @staticmethod
@@ -170,47 +528,182 @@ class LeaveModel(db.Model):
 
 
     @staticmethod
-    def str_to_datetime(date_str: str) -> datetime:
+    def str_to_date(date_str: str) -> date:
         '''
-        Converts a an iso formatted date string to a datetime object
+        Converts an iso formatted date time string (the api format, ex.
+        2021-01-04T00:00:00) to a date, the time is validated and dropped
         '''
-        return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S')
+        if len(date_str) != 19 or date_str[10] != 'T':
+            raise ValueError('Invalid date: %r' % (date_str))
+
+        time.fromisoformat(date_str[11:])
+        return date.fromisoformat(date_str[:10])
 
 
     @staticmethod
-    def datetime_to_str(date: datetime) -> str:
+    def date_to_str(value: date) -> str:
+        '''
+        Converts a date to an iso formatted date time string (the api format)
+        '''
+        return value.isoformat() + 'T00:00:00'
+
+
+    @staticmethod
+    def to_date(value: date) -> date:
+        '''
+        Date of a date or datetime
+        '''
+        return value.date() if isinstance(value, datetime) else value
+
+
+    def to_entry(self) -> LeaveEntry:
+        '''
+        Return the leave as a plain index entry
         '''
-        Converts a datetime object to an iso formatted date string
+        return LeaveEntry(self.start_date, self.id, self.user_id, self.end_date)
+
+
+    def get_stored_days_by_year(self) -> Dict[int, int]:
+        '''
+        Return leave days per year booked in the usage ledger for this leave
         '''
-        return date.strftime('%Y-%m-%dT%H:%M:%S')
+        if not self._stored_period:
+            return {}
 
+        return LeaveModel.get_leave_days_by_year(*self._stored_period)
 
-    def add(self) -> None:
+
+    def add(self) -> bool:
         '''
-        Add new leave to the database
+        Add new leave to the database. Returns False (staging nothing) if the
+        leave does not fit in the remaining leave days.
         '''
+        if not self._stage_period():
+            return False
+
         db.session.add(self)
-        db.session.commit()
+        db.session.flush() # assigns the id
+        after_commit(leave_index.add, self.to_entry())
+        return True
 
 
     def delete(self) -> None:
         '''
         Delete leave from the database
         '''
-        db.session.delete(self)
-        db.session.commit()
+        self._stage_delete()
+        after_commit(leave_index.remove, self.user_id, self.id)
 
 
-    def update(self) -> None:
+    def update(self) -> bool:
         '''
-        Update leave in the database
+        Update leave in the database. Returns False, without reserving any
+        days, if the new period does not fit in the remaining leave days.
         '''
         # fixme: db.session.update(self)
-        db.session.commit()
+        if not self._stage_period():
+            return False
+
+        db.session.flush() # checks the row version
+        after_commit(leave_index.update, self.to_entry())
+        return True
+
+
+    @classmethod
+    def add_all(cls, leaves: List['LeaveModel']) -> Optional[List[LeaveEntry]]:
+        '''
+        Add new leaves to the database in a single transaction, returning
+        them as plain index entries. Returns None (staging nothing) if they
+        do not fit in the remaining leave days together.
+        '''
+        days = {}
+        for leave in leaves:
+            for year, leave_days in cls.get_leave_days_by_year(
+                leave.start_date, leave.end_date).items():
+                days[(leave.user_id, year)] = days.get((leave.user_id, year), 0) + leave_days
+
+        if not LeaveUsageModel.reserve_all(days, MAX_YEARLY_LEAVE.days):
+            return None
+
+        for leave in leaves:
+            leave._stored_period = (leave.start_date, leave.end_date)
+        for user_id in {leave.user_id for leave in leaves}:
+            LeaveVersionModel.bump(user_id)
+
+        db.session.add_all(leaves)
+        db.session.flush() # assigns the ids
+        entries = [leave.to_entry() for leave in leaves]
+
+        for entry in entries:
+            after_commit(leave_index.add, entry)
+
+        return entries
+
+
+    def coalesce(self, others: List['LeaveModel'],
+        max_days: Optional[int] = MAX_YEARLY_LEAVE.days) -> bool:
+        '''
+        Save the leave (adding it if new) and delete the other leaves it
+        replaces in a single transaction. Returns False, without reserving
+        any days, if the merged leave does not fit in the remaining leave
+        days once the replaced leaves' days are given back.
+        '''
+        created = self._stored_period is None
+
+        if not self._stage_period(others, max_days):
+            return False
+
+        for other in others:
+            db.session.delete(other)
+            other._stored_period = None
+            after_commit(leave_index.remove, other.user_id, other.id)
+
+        if created:
+            db.session.add(self)
+        db.session.flush() # assigns the id, checks the row versions
+        after_commit(leave_index.add if created else leave_index.update, self.to_entry())
+        return True
 
-    
-    def rollback(self) -> None:
+
+    def _stage_period(self, replaced: Iterable['LeaveModel'] = (),
+        max_days: Optional[int] = MAX_YEARLY_LEAVE.days) -> bool:
         '''
-        Rollback changes to leave in the database
+        Reserve the usage ledger change from the stored to the current leave
+        period (giving back the days of the replaced leaves). Returns False,
+        changing nothing, if a year would go over max_days.
         '''
-        db.session.rollback()
\ No newline at end of file
+        days_by_year = LeaveModel.get_leave_days_by_year(self.start_date, self.end_date)
+        for leave in [self, *replaced]:
+            for year, days in leave.get_stored_days_by_year().items():
+                days_by_year[year] = days_by_year.get(year, 0) - days
+
+        if not LeaveUsageModel.reserve(self.user_id, days_by_year, max_days):
+            return False
+
+        LeaveVersionModel.bump(self.user_id)
+        self._stored_period = (self.start_date, self.end_date)
+        return True
+
+
+    def _stage_delete(self) -> None:
+        '''
+        Stage the leave deletion and give its days back to the usage ledger
+        '''
+        user_id = self.user_id # load before the delete is flushed
+        db.session.delete(self)
+        LeaveUsageModel.apply(user_id, self.get_stored_days_by_year(), -1)
+        LeaveVersionModel.bump(user_id)
+        self._stored_period = None
+
+
+def reset_stored_period(leave: LeaveModel, context, attrs) -> None:
+    '''
+    Remember the stored period again when the leave's dates are reloaded,
+    ex. by a retry after a rollback, which reuses the instance without
+    running the reconstructor (the period would be the failed attempt's)
+    '''
+    if attrs is None or 'start_date' in attrs or 'end_date' in attrs:
+        leave.init_on_load()
+
+
+event.listen(LeaveModel, 'refresh', reset_stored_period)
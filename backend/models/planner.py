@@ -0,0 +1,96 @@
+'''
+Leave planning within a user's remaining leave days: the latest end date of a
+leave starting on a date, and the earliest free period of a number of days.
+Both work from the remaining days per year and the scheduled leaves fetched
+once, counting charged days with the working day calendar.
+'''
+
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.models.workdays import WorkCalendar
+
+
+ONE_DAY = timedelta(days=1)
+MAX_SEARCH_SPAN = timedelta(days=2 * 366) # how far ahead periods are searched
+
+
+def max_end_date(start_date: date, last_date: date, remaining: Dict[int, int],
+    calendar: WorkCalendar) -> Optional[date]:
+    '''
+    Latest end date (up to last_date) of a leave starting on start_date that
+    charges at most the remaining days (by year, covering start_date to
+    last_date) in each year, None if even a single day doesn't fit. The
+    year's cumulative counts give the last day within the limit directly.
+    '''
+    end_date = None
+    day = start_date
+    while day <= last_date:
+        year_start = date(day.year, 1, 1)
+        counts = calendar.cumulative(day.year)
+        first = (day - year_start).days
+
+        # last offset whose count up to and including it is within the limit
+        last = bisect_right(counts, counts[first] + remaining[day.year]) - 2
+        if last < first:
+            break
+
+        end_date = year_start + timedelta(days=last)
+        if last < len(counts) - 2 or day.year == last_date.year: # ran out or done
+            break
+        day = date(day.year + 1, 1, 1)
+
+    return min(end_date, last_date) if end_date else None
+
+
+def earliest_start(date_from: date, last_start: date, days: int,
+    remaining: Dict[int, int], scheduled: Iterable[Tuple[date, date]],
+    calendar: WorkCalendar) -> Optional[date]:
+    '''
+    Earliest start date (from date_from to last_start) of a leave of days
+    days that charges at most the remaining days (by year, covering the
+    searched periods) in each year and overlaps none of the scheduled leaves
+    (start and end dates), None if there is none. The leave must end by
+    date.max if it starts on last_start.
+    '''
+    busy = merge_periods(scheduled)
+    length = timedelta(days=days - 1)
+    index = 0
+
+    start_date = date_from
+    while start_date <= last_start:
+        end_date = start_date + length
+        while index < len(busy) and busy[index][1] < start_date:
+            index += 1
+
+        if index < len(busy) and busy[index][0] <= end_date:
+            if busy[index][1] >= last_start:
+                break
+            start_date = busy[index][1] + ONE_DAY # skip past the scheduled leave
+            continue
+
+        if all(calendar.count_in_year(start_date, end_date, year) <= remaining[year]
+            for year in range(start_date.year, end_date.year + 1)):
+            return start_date
+
+        if start_date == last_start:
+            break
+        start_date += ONE_DAY
+
+    return None
+
+
+def merge_periods(periods: Iterable[Tuple[date, date]]) -> List[Tuple[date, date]]:
+    '''
+    Sorted disjoint periods covering the same days as the given ones
+    '''
+    merged = []
+    for start_date, end_date in sorted(periods):
+        if merged and start_date <= merged[-1][1] + ONE_DAY:
+            if end_date > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end_date)
+        else:
+            merged.append((start_date, end_date))
+
+    return merged
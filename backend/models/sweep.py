@@ -0,0 +1,82 @@
+'''
+Sweep line over leave periods: who is out on each day of a window
+'''
+
+from datetime import date, timedelta
+from heapq import heappop, heappush
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+Segment = Tuple[date, date, List[int]] # (first day, last day, sorted user ids)
+ONE_DAY = timedelta(days=1)
+
+
+def absence_segments(leaves: Iterable[Tuple[date, date, int]], date_from: date,
+    date_to: date) -> Iterator[Segment]:
+    '''
+    Sweep (start date, end date, user id) leaves ordered by start date into
+    the maximal runs of days in [date_from, date_to] with the same (non
+    empty) set of users out. Dates are inclusive like LeaveModel and a user
+    with overlapping leaves is counted once. Runs are generated in order as
+    the leaves are read, keeping only the leaves in progress in memory.
+    '''
+    out: Dict[int, int] = {} # user id -> leaves in progress
+    ends: List[Tuple[date, int]] = [] # (day after the leave, user id) heap
+    cursor = date_from # first day not yet generated
+    pending: Optional[Segment] = None
+
+    def close(until: date) -> Iterator[Segment]:
+        '''
+        Generate the days from the cursor up to (excluding) until with the
+        current users out, merged into the pending run if it has the same users
+        '''
+        nonlocal cursor, pending
+        if until <= cursor:
+            return
+
+        if out:
+            users = sorted(out)
+            if pending is not None and pending[1] + ONE_DAY == cursor and pending[2] == users:
+                pending = (pending[0], until - ONE_DAY, users)
+            else:
+                if pending is not None:
+                    yield pending
+                pending = (cursor, until - ONE_DAY, users)
+        cursor = until
+
+    def end_before(day: date) -> Iterator[Segment]:
+        '''
+        Process the leaves ending before day
+        '''
+        while ends and ends[0][0] <= day:
+            end = ends[0][0]
+            yield from close(end)
+            while ends and ends[0][0] == end:
+                _, user_id = heappop(ends)
+                out[user_id] -= 1
+                if not out[user_id]:
+                    del out[user_id]
+
+    for start_date, end_date, user_id in leaves:
+        start_date = max(start_date, date_from)
+        end_date = min(end_date, date_to)
+        if start_date > end_date:
+            continue
+
+        yield from end_before(start_date)
+        yield from close(start_date)
+        out[user_id] = out.get(user_id, 0) + 1
+        heappush(ends, (end_date + ONE_DAY, user_id))
+
+    yield from end_before(date_to + ONE_DAY)
+    if pending is not None:
+        yield pending
+
+
+def absence_days(segments: Iterable[Segment]) -> Iterator[Tuple[date, List[int]]]:
+    '''
+    Expand runs of days into (day, user ids) for each day with users out
+    '''
+    for first_day, last_day, user_ids in segments:
+        for offset in range((last_day - first_day).days + 1):
+            yield first_day + timedelta(days=offset), user_ids
@@ -0,0 +1,170 @@
+'''
+Request scoped unit of work: model methods only stage changes in the
+session, which is committed once per request (or rolled back on an error
+response or exception)
+'''
+
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Dict
+
+from flask import current_app, g, request
+from sqlalchemy import event
+
+from backend.models.db import db, is_sqlite_memory
+
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# functions whose values are recorded when a transaction begins, by name
+BEGIN_VALUES: Dict[str, Callable[[], Any]] = {}
+
+
+def after_commit(callback: Callable, *args) -> None:
+    '''
+    Run callback(*args) once the current transaction commits, it is
+    discarded if the transaction rolls back instead. Used to update in
+    process state (index, cache) that must not see uncommitted writes.
+    '''
+    db.session.info.setdefault('after_commit', []).append(partial(callback, *args))
+
+
+def run_after_commit(session) -> None:
+    '''
+    Run the callbacks staged in a session that just committed
+    '''
+    for callback in session.info.pop('after_commit', ()):
+        callback()
+
+
+def discard_after_commit(session, previous_transaction) -> None:
+    '''
+    Drop the callbacks staged in a session that rolled back
+    '''
+    session.info.pop('after_commit', None)
+
+
+def record_on_begin(name: str, get_value: Callable[[], Any]) -> None:
+    '''
+    Record get_value() whenever a transaction begins, read back with
+    get_begin_value(name)
+    '''
+    BEGIN_VALUES[name] = get_value
+
+
+def record_begin_values(session, transaction, connection) -> None:
+    '''
+    Record the begin values of a session's transaction as it gets its
+    connection, before its first statement
+    '''
+    session.info['begin_values'] = (session.get_transaction(),
+        {name: get_value() for name, get_value in BEGIN_VALUES.items()})
+
+
+def get_begin_value(name: str) -> Any:
+    '''
+    Get the value a recorded function had when the current transaction
+    began, so before its snapshot of the database, or its value now if the
+    transaction hasn't started. Lets in process state (index, cache) detect
+    writes committed after the snapshot its data is read from.
+    '''
+    session = db.session() # the scoped session's current session
+    transaction, values = session.info.get('begin_values', (None, {}))
+    if transaction is not None and transaction is session.get_transaction():
+        return values[name]
+
+    return BEGIN_VALUES[name]()
+
+
+def begin_write() -> None:
+    '''
+    Start the current transaction by taking the database write lock (BEGIN
+    IMMEDIATE on file backed sqlite, see set_sqlite_transactions), so reads
+    made before writing cannot be invalidated by a concurrent writer and
+    the write cannot fail to upgrade its lock
+    '''
+    db.session.connection(execution_options={'begin_immediate': True})
+
+
+event.listen(db.session, 'after_begin', record_begin_values)
+event.listen(db.session, 'after_commit', run_after_commit)
+event.listen(db.session, 'after_soft_rollback', discard_after_commit)
+
+
+class UnitOfWork:
+    '''
+    Commits the session once per request. Write requests start their
+    transaction by taking the database write lock, so checks made in the
+    request (like the leave quota) still hold when it commits.
+
+    An in memory sqlite database (the development and test default) is a
+    single connection shared by all threads, so its requests run one at a
+    time instead, reads included. Sessions on one connection are not
+    isolated: a read request would see a concurrent write request's
+    uncommitted changes (and could cache or index them), and its commit,
+    or the rollback when it gives the connection back, would end the write
+    request's transaction halfway. File backed databases take no such lock,
+    their reads run concurrently and writes only wait on the database
+    write lock (the quota itself is enforced by the ledger's conditional
+    updates, see LeaveUsageModel.reserve_all).
+    '''
+    def __init__(self, app=None) -> None:
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app) -> None:
+        '''
+        Register the request hooks on the application
+        '''
+        # whole requests, not just writes, see above
+        app.extensions['unit_of_work'] = Lock() \
+            if is_sqlite_memory(app.config['SQLALCHEMY_DATABASE_URI']) else None
+
+        app.before_request(self.begin)
+        app.after_request(self.commit)
+        app.teardown_request(self.rollback)
+
+
+    def begin(self) -> None:
+        '''
+        Start the transaction of a write request, after waiting for the
+        other requests of a shared connection
+        '''
+        lock = current_app.extensions['unit_of_work']
+        if lock is not None:
+            lock.acquire()
+            g.unit_of_work_lock = lock
+
+        if request.method in WRITE_METHODS:
+            begin_write()
+
+
+    def commit(self, response):
+        '''
+        Commit the request transaction, or roll it back on an error response
+        '''
+        if response.status_code < 400:
+            db.session.commit()
+        else:
+            db.session.rollback()
+
+        return response
+
+
+    def rollback(self, error) -> None:
+        '''
+        Roll back the request transaction if the request raised, and let
+        the next request use a shared connection once this one is done with
+        it (after any streamed response)
+        '''
+        if error is not None:
+            db.session.rollback()
+
+        lock = g.pop('unit_of_work_lock', None)
+        if lock is not None:
+            db.session.close() # returning the connection rolls it back
+            lock.release()
+
+
+unit_of_work = UnitOfWork()
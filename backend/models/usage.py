@@ -0,0 +1,211 @@
+'''
+Leave usage ledger database entry model
+'''
+
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import bindparam, update
+
+from backend.models.db import db
+from backend.models.functions import insert_ignore
+
+
+class LeaveUsageModel(db.Model):
+    '''
+    Define leave usage ledger table, holding the leave days used by a user
+    in each calendar year. Entries are only changed with atomic updates
+    (days_used = days_used + n), never read-modify-write.
+    '''
+    __tablename__ = 'leave_usage'
+
+    user_id = db.Column('user_id', db.Integer, primary_key=True, autoincrement=False)
+    year = db.Column('year', db.Integer, primary_key=True, autoincrement=False)
+    days_used = db.Column('days_used', db.Integer, nullable=False, default=0)
+
+
+    def __init__(self, user_id: int, year: int, days_used: int = 0) -> None:
+        '''
+        Initialize a new usage entry
+        '''
+        self.user_id = user_id
+        self.year = year
+        self.days_used = days_used
+
+
+    def __repr__(self) -> str:
+        '''
+        Return string representation of the usage entry
+        '''
+        return '<LeaveUsage %d, %d: %d>' % (self.user_id, self.year, self.days_used)
+
+
+    @classmethod
+    def get_days_used(cls, user_id: int, year: int) -> int:
+        '''
+        Get the leave days used by a user in a year
+        '''
+        days_used = db.session.query(cls.days_used).filter(
+            cls.user_id == user_id,
+            cls.year == year
+        ).scalar()
+
+        return days_used or 0
+
+
+    @classmethod
+    def get_days_used_by_year(cls, user_id: int, from_year: int, to_year: int) -> Dict[int, int]:
+        '''
+        Get the leave days used by a user in each year of an inclusive range
+        '''
+        days_used = {year: 0 for year in range(from_year, to_year + 1)}
+
+        for year, days in db.session.query(cls.year, cls.days_used).filter(
+            cls.user_id == user_id,
+            cls.year >= from_year,
+            cls.year <= to_year
+        ):
+            days_used[year] = days
+
+        return days_used
+
+
+    @classmethod
+    def get_days_used_for(cls, keys: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], int]:
+        '''
+        Get the leave days used for each (user id, year) with a single query
+        '''
+        days_used = {key: 0 for key in keys}
+        if not days_used:
+            return days_used
+
+        user_ids = {user_id for user_id, _ in days_used}
+        years = {year for _, year in days_used}
+
+        for user_id, year, days in db.session.query(cls.user_id, cls.year, cls.days_used).filter(
+            cls.user_id.in_(user_ids),
+            cls.year.in_(years)
+        ):
+            if (user_id, year) in days_used:
+                days_used[(user_id, year)] = days
+
+        return days_used
+
+
+    @classmethod
+    def reserve_all(cls, days: Dict[Tuple[int, int], int],
+        max_days: Optional[int]) -> bool:
+        '''
+        Add leave days per (user id, year) to the ledger unless a year would
+        go over max_days (None for no limit). Each increase is a single
+        conditional update of the year's entry, so concurrent writers cannot
+        overdraw a balance and only contend on the entries they change.
+        All or nothing: if a year would go over, the changes already made are
+        undone and False is returned.
+        '''
+        applied = {}
+
+        for key, value in days.items():
+            if value == 0:
+                continue
+
+            if not cls._add(key, value, max_days if value > 0 else None):
+                cls.apply_all({key: -value for key, value in applied.items()})
+                return False
+
+            applied[key] = value
+
+        return True
+
+
+    @classmethod
+    def reserve(cls, user_id: int, days_by_year: Dict[int, int],
+        max_days: Optional[int]) -> bool:
+        '''
+        Add leave days per year to a user's ledger unless a year would go
+        over max_days, see reserve_all
+        '''
+        return cls.reserve_all({(user_id, year): days for year, days in days_by_year.items()},
+            max_days)
+
+
+    @classmethod
+    def apply_all(cls, days: Dict[Tuple[int, int], int]) -> None:
+        '''
+        Add leave days per (user id, year) to the ledger without a limit,
+        creating the missing entries and updating them with a single
+        statement each. Changes run in the current transaction.
+        '''
+        days = {key: value for key, value in days.items() if value != 0}
+        if not days:
+            return
+
+        cls._insert_missing(days.keys())
+        db.session.execute(UPDATE_STATEMENT, [{'key_user_id': user_id, 'key_year': year,
+            'days': value} for (user_id, year), value in days.items()])
+
+
+    @classmethod
+    def apply(cls, user_id: int, days_by_year: Dict[int, int], sign: int = 1) -> None:
+        '''
+        Add (or subtract for a negative sign) leave days per year to the
+        ledger without a limit
+        '''
+        cls.apply_all({(user_id, year): sign * days for year, days in days_by_year.items()})
+
+
+    @classmethod
+    def delete_all(cls) -> int:
+        '''
+        Delete all usage entries (without committing)
+        '''
+        return cls.query.delete()
+
+
+    @classmethod
+    def delete_user(cls, user_id: int) -> int:
+        '''
+        Delete all usage entries for a user (without committing)
+        '''
+        return cls.query.filter(cls.user_id == user_id).delete()
+
+
+    @classmethod
+    def _add(cls, key: Tuple[int, int], days: int, max_days: Optional[int]) -> bool:
+        '''
+        Add days to a ledger entry with a conditional update, creating the
+        entry and retrying if the update matched nothing. Returns False if
+        the entry would go over max_days.
+        '''
+        user_id, year = key
+        statement = UPDATE_STATEMENT if max_days is None else RESERVE_STATEMENT
+        params = {'key_user_id': user_id, 'key_year': year, 'days': days,
+            'max_days': max_days}
+
+        for attempt in range(2):
+            if db.session.execute(statement, params).rowcount:
+                return True
+
+            if attempt == 0: # missing entry, or over the limit
+                cls._insert_missing([key])
+
+        return False
+
+
+    @classmethod
+    def _insert_missing(cls, keys: Iterable[Tuple[int, int]]) -> None:
+        '''
+        Create empty ledger entries for the keys without one
+        '''
+        db.session.execute(
+            insert_ignore(cls.__table__, db.engine.dialect.name),
+            [{'user_id': user_id, 'year': year, 'days_used': 0} for user_id, year in keys])
+
+
+USAGE_TABLE = LeaveUsageModel.__table__
+
+UPDATE_STATEMENT = update(USAGE_TABLE).where(
+    USAGE_TABLE.c.user_id == bindparam('key_user_id'),
+    USAGE_TABLE.c.year == bindparam('key_year')
+).values(days_used=USAGE_TABLE.c.days_used + bindparam('days'))
+
+RESERVE_STATEMENT = UPDATE_STATEMENT.where(
+    USAGE_TABLE.c.days_used + bindparam('days') <= bindparam('max_days'))
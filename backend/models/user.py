@@ -2,14 +2,20 @@
 User database entry model
 '''
 
-from typing import List
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import select
 
 from backend.models.db import db
+from backend.models.index import leave_index
+from backend.models.transaction import after_commit
+from backend.models.usage import LeaveUsageModel
+from backend.models.version import LeaveVersionModel
 
 
 class UserModel(db.Model):
     '''
-    Define user database table
+    Define user database table. Write methods only stage changes in the
+    session, which is committed once per request.
     '''
     __tablename__ = 'user_table'
 
@@ -39,13 +45,33 @@ class UserModel(db.Model):
         return cls.query.all()
 
 
+    @classmethod
+    def get_rows(cls, after_id: int = 0, limit: Optional[int] = None) -> List[Tuple[int]]:
+        '''
+        Get (id,) rows of user entries with ids after after_id ordered by id,
+        without loading model objects
+        '''
+        query = select(cls.id).where(cls.id > after_id).order_by(cls.id).limit(limit)
+        return db.session.execute(query).all()
+
+
+    @classmethod
+    def iter_rows(cls, chunk_size: int) -> Iterator[Tuple[int]]:
+        '''
+        Iterate over (id,) rows of all user entries ordered by id, fetching
+        chunk_size rows at a time
+        '''
+        query = select(cls.id).order_by(cls.id).execution_options(yield_per=chunk_size)
+        return iter(db.session.execute(query))
+
+
     @classmethod
     def delete_all(cls) -> int:
         '''
         Delete all user entries from the database
         '''
         deleted = cls.query.delete()
-        db.session.commit()
+        LeaveVersionModel.bump_all()
         return deleted
 
 
@@ -62,15 +88,19 @@ class UserModel(db.Model):
         Add new user to the database
         '''
         db.session.add(self)
-        db.session.commit()
+        db.session.flush() # assigns the id
+        LeaveVersionModel.bump(self.id)
 
 
     def delete(self) -> None:
         '''
         Delete user from the database
         '''
-        db.session.delete(self)
-        db.session.commit()
+        id = self.id
+        db.session.delete(self) # cascades to the user's leaves
+        LeaveUsageModel.delete_user(id)
+        LeaveVersionModel.bump(id)
+        after_commit(leave_index.invalidate, id)
 
 
     def update(self) -> None:
@@ -78,4 +108,4 @@ class UserModel(db.Model):
         Update user in the database
         '''
         # fixme: db.session.update(self)
-        db.session.commit()
+        db.session.add(self)
@@ -0,0 +1,78 @@
+'''
+Per-user leave version database entry model
+'''
+
+from sqlalchemy import bindparam, select, update
+
+from backend.models.db import db
+from backend.models.functions import insert_ignore
+
+
+class LeaveVersionModel(db.Model):
+    '''
+    Define leave version table, holding a counter per user that every write
+    to the user (or their leaves) bumps. Rows are never deleted so versions
+    are not reused after a user is deleted.
+    '''
+    __tablename__ = 'leave_version'
+
+    user_id = db.Column('user_id', db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column('version', db.Integer, nullable=False, default=0)
+
+
+    def __init__(self, user_id: int, version: int = 0) -> None:
+        '''
+        Initialize a new version entry
+        '''
+        self.user_id = user_id
+        self.version = version
+
+
+    def __repr__(self) -> str:
+        '''
+        Return string representation of the version entry
+        '''
+        return '<LeaveVersion %d: %d>' % (self.user_id, self.version)
+
+
+    @classmethod
+    def get_version(cls, user_id: int) -> int:
+        '''
+        Get the current version for a user. A single primary key lookup with a
+        prebuilt statement on the session connection, skipping orm query
+        construction since it runs on every conditional request.
+        '''
+        version = db.session.connection().execute(
+            VERSION_STATEMENT, {'user_id': user_id}).scalar()
+        return version or 0
+
+
+    @classmethod
+    def bump(cls, user_id: int) -> None:
+        '''
+        Increment the version for a user with an atomic update (creating the
+        entry if missing). The change runs in the current transaction so it
+        commits with the write.
+        '''
+        params = {'key_user_id': user_id}
+        if not db.session.execute(BUMP_STATEMENT, params).rowcount:
+            db.session.execute(
+                insert_ignore(cls.__table__, db.engine.dialect.name),
+                {'user_id': user_id, 'version': 0})
+            db.session.execute(BUMP_STATEMENT, params)
+
+
+    @classmethod
+    def bump_all(cls) -> None:
+        '''
+        Increment the version for all users (without committing)
+        '''
+        cls.query.update({cls.version: cls.version + 1}, synchronize_session=False)
+
+
+VERSION_STATEMENT = select(LeaveVersionModel.version).where(
+    LeaveVersionModel.user_id == bindparam('user_id'))
+
+BUMP_STATEMENT = update(LeaveVersionModel.__table__).where(
+    LeaveVersionModel.__table__.c.user_id == bindparam('key_user_id')
+).values(version=LeaveVersionModel.__table__.c.version + 1)
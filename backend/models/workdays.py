@@ -0,0 +1,193 @@
+'''
+Working day calendars: the days charged against the yearly leave allotment.
+Each year's working days are precomputed as cumulative counts, so the working
+days of any period are two lookups per year it covers.
+'''
+
+import json
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+from flask import current_app, has_app_context
+
+
+EVERY_DAY = '1111111'
+WEEKDAYS = '1111100'
+MAX_CACHED_YEARS = 64 # cumulative counts kept per calendar
+
+# built in regions, extended or overridden by LEAVE_REGIONS
+DEFAULT_REGIONS = {
+    'weekdays': {'weekmask': WEEKDAYS}
+}
+
+
+def get_regions(path: Optional[str]) -> dict:
+    '''
+    Read the working day calendars of the regions from a json file
+    '''
+    if not path:
+        return {}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+class WorkCalendar:
+    '''
+    Working days of a region: a weekmask (Monday first, 1 for a working day,
+    like numpy.busday_count) less a list of holidays
+    '''
+    def __init__(self, weekmask: str = EVERY_DAY,
+        holidays: Iterable[Union[date, str]] = ()) -> None:
+        if len(weekmask) != 7 or set(weekmask) - {'0', '1'} or '1' not in weekmask:
+            raise ValueError('Invalid weekmask: %r' % (weekmask))
+
+        self.weekmask = [day == '1' for day in weekmask]
+        # holidays on days off change nothing
+        self.holidays = frozenset(day for day in (
+            date.fromisoformat(day) if isinstance(day, str) else day for day in holidays)
+            if self.weekmask[day.weekday()])
+        self.every_day = all(self.weekmask) and not self.holidays
+        self.years: Dict[int, List[int]] = {}
+
+
+    def cumulative(self, year: int) -> List[int]:
+        '''
+        Working days before each day of a year (and in the whole year, last),
+        computed once per year
+        '''
+        counts = self.years.get(year)
+        if counts is not None:
+            return counts
+
+        counts = [0]
+        year_start = date(year, 1, 1)
+        weekday = year_start.weekday()
+        for offset in range((date(year, 12, 31) - year_start).days + 1):
+            counts.append(counts[-1] + (self.weekmask[weekday]
+                and year_start + timedelta(days=offset) not in self.holidays))
+            weekday = (weekday + 1) % 7
+
+        if len(self.years) >= MAX_CACHED_YEARS:
+            self.years.clear()
+        self.years[year] = counts
+        return counts
+
+
+    def count_in_year(self, start_date: date, end_date: date, year: int) -> int:
+        '''
+        Working days from start_date to end_date (inclusive) in a year
+        '''
+        if not (start_date.year <= year and end_date.year >= year):
+            return 0
+
+        if start_date.year < year:
+            start_date = date(year, 1, 1)
+
+        if end_date.year > year:
+            end_date = date(year, 12, 31)
+
+        if self.every_day:
+            return (end_date - start_date).days + 1
+
+        counts = self.cumulative(year)
+        year_start = date(year, 1, 1)
+        return counts[(end_date - year_start).days + 1] - counts[(start_date - year_start).days]
+
+
+    def count(self, start_date: date, end_date: date) -> int:
+        '''
+        Working days from start_date to end_date (inclusive)
+        '''
+        return sum(self.count_in_year(start_date, end_date, year)
+            for year in range(start_date.year, end_date.year + 1))
+
+
+    def window(self, date_from: date, days: int) -> List[int]:
+        '''
+        Working days before each of the days from date_from (and in all of
+        them, last), for vectorized counts of periods given as day offsets
+        '''
+        if self.every_day:
+            return list(range(days + 1))
+
+        counts = [0]
+        day = date_from
+        while len(counts) <= days:
+            year_counts = self.cumulative(day.year)
+            first = (day - date(day.year, 1, 1)).days
+            taken = year_counts[first + 1:first + 1 + days + 1 - len(counts)]
+            base = counts[-1] - year_counts[first]
+            counts.extend(base + count for count in taken)
+            if len(counts) <= days: # the window goes on into the next year
+                day = date(day.year + 1, 1, 1)
+
+        return counts
+
+
+    def max_span(self, max_days: int) -> Optional[timedelta]:
+        '''
+        Longest period a leave can cover if it uses at most max_days working
+        days in each year (all of one year's leave followed by all of the
+        next's), None if it could cover a whole year. Bounds the start dates
+        of the leaves overlapping a date.
+        '''
+        if self.every_day:
+            days_in_year = max_days
+        else:
+            # any 7 consecutive days hold every working weekday once, less
+            # the holidays among them
+            days_in_year = 7 * ((max_days + len(self.holidays)) // sum(self.weekmask) + 1) - 1
+
+        if days_in_year >= 365:
+            return None
+
+        return timedelta(days=2 * days_in_year)
+
+
+CALENDAR_DAYS = WorkCalendar()
+
+
+class WorkCalendars:
+    '''
+    Working day calendar of the application, the LEAVE_REGION entry of
+    LEAVE_REGIONS (weekmask and holidays), every day if no region is set.
+    The usage ledger must be rebuilt (python3 -m backend.migrations.leave_usage)
+    when the calendar of an existing database changes.
+    '''
+    def __init__(self, app=None) -> None:
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app) -> None:
+        '''
+        Build the calendar of the configured region
+        '''
+        app.config.setdefault('LEAVE_REGION', None)
+        app.config.setdefault('LEAVE_REGIONS', {})
+
+        region = app.config['LEAVE_REGION']
+        regions = dict(DEFAULT_REGIONS, **app.config['LEAVE_REGIONS'])
+        if region is None:
+            calendar = CALENDAR_DAYS
+        elif region in regions:
+            calendar = WorkCalendar(**regions[region])
+        else:
+            raise ValueError('Unknown leave region: %r' % (region))
+
+        app.extensions['work_calendar'] = calendar
+
+
+    @property
+    def current(self) -> WorkCalendar:
+        '''
+        Calendar of the current application, every day outside of one
+        '''
+        if not has_app_context():
+            return CALENDAR_DAYS
+
+        return current_app.extensions.get('work_calendar', CALENDAR_DAYS)
+
+
+work_calendars = WorkCalendars()
@@ -0,0 +1,270 @@
+'''
+Request and sql metrics, served in the prometheus text format
+'''
+
+from bisect import bisect_left
+from threading import Lock, Thread, current_thread, local
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from flask import Response, current_app, request
+from flask_restful import Resource
+from sqlalchemy import event
+
+from backend.models.db import db
+
+
+# histogram upper bounds (the last bucket is +Inf)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class RouteStats:
+    '''
+    Counters of one route and method, only written by the thread owning
+    the shard it belongs to
+    '''
+    __slots__ = ('latency_buckets', 'latency_sum', 'statuses', 'sql_buckets',
+        'sql_statements', 'sql_seconds')
+
+    def __init__(self) -> None:
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.statuses: Dict[int, int] = {}
+        self.sql_buckets = [0] * (len(STATEMENT_BUCKETS) + 1)
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+
+
+class MetricsRegistry:
+    '''
+    Per application metrics. Each thread records into its own shard without
+    locking, the shards are only merged when the metrics are scraped. The
+    shards of finished threads (ex. one per request of the threaded
+    development server) are folded into a retired shard so they don't pile up.
+    '''
+    def __init__(self) -> None:
+        self.shards: Dict[Thread, Dict[Tuple[str, str], RouteStats]] = {}
+        self.retired: Dict[Tuple[str, str], RouteStats] = {}
+        self.lock = Lock() # guards the shards and the retired shard
+        self.local = local()
+
+
+    def get_shard(self) -> Dict[Tuple[str, str], RouteStats]:
+        '''
+        Get the calling thread's shard, registering it on first use
+        '''
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.retire()
+                self.shards[current_thread()] = shard
+
+        return shard
+
+
+    def retire(self) -> None:
+        '''
+        Fold the shards of finished threads, which can no longer write to
+        them, into the retired shard. Must hold the lock.
+        '''
+        for thread in [thread for thread in self.shards if not thread.is_alive()]:
+            add_shard(self.retired, self.shards.pop(thread))
+
+
+    def merge(self) -> Dict[Tuple[str, str], RouteStats]:
+        '''
+        Sum the shards of all threads
+        '''
+        merged: Dict[Tuple[str, str], RouteStats] = {}
+        with self.lock:
+            self.retire()
+            add_shard(merged, self.retired)
+            shards = list(self.shards.values())
+
+        for shard in shards:
+            add_shard(merged, shard)
+
+        return merged
+
+
+def add_shard(total_shard: Dict[Tuple[str, str], RouteStats],
+    shard: Dict[Tuple[str, str], RouteStats]) -> None:
+    '''
+    Add the counters of a shard to another
+    '''
+    for key, stats in list(shard.items()):
+        total = total_shard.setdefault(key, RouteStats())
+        for i, value in enumerate(stats.latency_buckets):
+            total.latency_buckets[i] += value
+        total.latency_sum += stats.latency_sum
+        for status, value in list(stats.statuses.items()):
+            total.statuses[status] = total.statuses.get(status, 0) + value
+        for i, value in enumerate(stats.sql_buckets):
+            total.sql_buckets[i] += value
+        total.sql_statements += stats.sql_statements
+        total.sql_seconds += stats.sql_seconds
+
+
+class Metrics:
+    '''
+    Records the latency, status and sql statement count and time of every
+    request by route. Sql statements are timed with cursor execute events
+    on the application engine (statements run by a streamed response body
+    after the response is returned are not counted).
+    '''
+    def __init__(self, app=None) -> None:
+        self.request = local() # per thread state of the current request
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app) -> None:
+        '''
+        Register the request hooks and sql events on the application
+        (db must be initialized first)
+        '''
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.extensions['metrics'] = MetricsRegistry()
+
+        app.before_request(self.begin)
+        app.after_request(self.record)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self.after_cursor_execute)
+
+
+    def begin(self) -> None:
+        '''
+        Start timing a request
+        '''
+        state = self.request
+        state.started = perf_counter()
+        state.sql_statements = 0
+        state.sql_seconds = 0.0
+
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context,
+        executemany) -> None:
+        self.request.sql_started = perf_counter()
+
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context,
+        executemany) -> None:
+        state = self.request
+        started = getattr(state, 'sql_started', None)
+        if started is not None and hasattr(state, 'sql_statements'):
+            state.sql_statements += 1
+            state.sql_seconds += perf_counter() - started
+
+
+    def record(self, response):
+        '''
+        Record a finished request in the calling thread's shard
+        '''
+        state = self.request
+        started = getattr(state, 'started', None)
+        if started is None or not current_app.config['METRICS_ENABLED']:
+            return response
+
+        seconds = perf_counter() - started
+        state.started = None
+        rule = request.url_rule
+        key = (rule.rule if rule is not None else 'unmatched', request.method)
+
+        shard = current_app.extensions['metrics'].get_shard()
+        stats = shard.get(key)
+        if stats is None:
+            stats = shard[key] = RouteStats()
+
+        stats.latency_buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        stats.latency_sum += seconds
+        status = response.status_code
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.sql_buckets[bisect_left(STATEMENT_BUCKETS, state.sql_statements)] += 1
+        stats.sql_statements += state.sql_statements
+        stats.sql_seconds += state.sql_seconds
+
+        return response
+
+
+    def render(self) -> str:
+        '''
+        Render the current application's metrics in the prometheus text
+        exposition format
+        '''
+        merged = current_app.extensions['metrics'].merge()
+        lines = []
+
+        lines.append('# HELP leave_http_requests_total Requests by route, method and status')
+        lines.append('# TYPE leave_http_requests_total counter')
+        for (route, method), stats in sorted(merged.items()):
+            for status, value in sorted(stats.statuses.items()):
+                lines.append('leave_http_requests_total{%s,status="%d"} %d'
+                    % (labels(route, method), status, value))
+
+        add_histogram(lines, 'leave_http_request_duration_seconds',
+            'Request latency by route and method', LATENCY_BUCKETS,
+            ((key, stats.latency_buckets, stats.latency_sum)
+                for key, stats in sorted(merged.items())))
+
+        add_histogram(lines, 'leave_sql_statements_per_request',
+            'Sql statements executed per request by route and method', STATEMENT_BUCKETS,
+            ((key, stats.sql_buckets, stats.sql_statements)
+                for key, stats in sorted(merged.items())))
+
+        lines.append('# HELP leave_sql_duration_seconds_total Time spent executing sql '
+            'statements by route and method')
+        lines.append('# TYPE leave_sql_duration_seconds_total counter')
+        for (route, method), stats in sorted(merged.items()):
+            lines.append('leave_sql_duration_seconds_total{%s} %r'
+                % (labels(route, method), stats.sql_seconds))
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def escape(value: str) -> str:
+    '''
+    Escape a prometheus label value
+    '''
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(route: str, method: str) -> str:
+    '''
+    Route and method labels
+    '''
+    return 'route="%s",method="%s"' % (escape(route), method)
+
+
+def add_histogram(lines: List[str], name: str, help: str, buckets: Tuple,
+    series) -> None:
+    '''
+    Add a histogram with cumulative buckets for each ((route, method),
+    bucket counts, sum) series
+    '''
+    lines.append('# HELP %s %s' % (name, help))
+    lines.append('# TYPE %s histogram' % (name))
+
+    for (route, method), counts, total in series:
+        route_labels = labels(route, method)
+        cumulative = 0
+        for bound, value in zip(buckets + ('+Inf',), counts):
+            cumulative += value
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, route_labels, bound, cumulative))
+        lines.append('%s_sum{%s} %r' % (name, route_labels, total))
+        lines.append('%s_count{%s} %d' % (name, route_labels, cumulative))
+
+
+class MetricsResource(Resource):
+    def get(self):
+        '''
+        Get the request and sql metrics in the prometheus text format
+        '''
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,159 @@
+'''
+Opt in per request profiler writing collapsed stacks (one "frame;frame;...
+weight" line per stack, the input of flamegraph.pl or speedscope)
+'''
+
+import os
+import random
+import re
+import sys
+import tempfile
+from time import perf_counter, strftime
+from typing import Callable, Dict, List, Optional
+
+from werkzeug.wsgi import ClosingIterator
+
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def get_frame_name(frame) -> str:
+    '''
+    module:qualified name of a python frame
+    '''
+    code = frame.f_code
+    return '%s:%s' % (frame.f_globals.get('__name__', '?'),
+        getattr(code, 'co_qualname', code.co_name))
+
+
+def get_builtin_name(function) -> str:
+    '''
+    module:qualified name of a builtin function
+    '''
+    module = getattr(function, '__module__', None) or 'builtins'
+    return '%s:%s' % (module, getattr(function, '__qualname__', repr(function)))
+
+
+class StackProfiler:
+    '''
+    Deterministic profiler of the calling thread. The self time of each call
+    is added to the weight of its whole stack, in microseconds.
+    '''
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.stack: List[list] = [] # [name, started, time in children]
+        self.stacks: Dict[str, float] = {}
+        self.previous: Optional[Callable] = None
+
+
+    def start(self) -> None:
+        self.previous = sys.getprofile()
+        sys.setprofile(self.profile)
+
+
+    def stop(self) -> None:
+        sys.setprofile(self.previous)
+        while self.stack: # calls still running when profiling stopped
+            self.pop(perf_counter())
+
+
+    def profile(self, frame, event: str, arg) -> None:
+        now = perf_counter()
+        if event == 'call':
+            self.stack.append([get_frame_name(frame), now, 0.0])
+        elif event == 'c_call':
+            self.stack.append([get_builtin_name(arg), now, 0.0])
+        elif self.stack: # return, c_return or c_exception
+            self.pop(now)
+
+
+    def pop(self, now: float) -> None:
+        key = ';'.join([self.root] + [entry[0] for entry in self.stack])
+        _, started, children = self.stack.pop()
+        elapsed = now - started
+        self.stacks[key] = self.stacks.get(key, 0.0) + elapsed - children
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+
+    def write(self, path: str) -> None:
+        '''
+        Write the collapsed stacks, weighted in microseconds
+        '''
+        with open(path, 'w') as file:
+            for stack, seconds in sorted(self.stacks.items()):
+                weight = round(seconds * 1e6)
+                if weight > 0:
+                    file.write('%s %d\n' % (stack, weight))
+
+
+class ProfilerMiddleware:
+    '''
+    Profiles the whole wsgi call of a request, including iterating a
+    streamed response body, when it has the profile header or is sampled
+    '''
+    def __init__(self, wsgi_app, directory: str, sample_rate: float,
+        header_enabled: bool) -> None:
+        self.wsgi_app = wsgi_app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.header = 'HTTP_' + PROFILE_HEADER.upper().replace('-', '_') \
+            if header_enabled else None
+
+
+    def __call__(self, environ, start_response):
+        if not ((self.header is not None and environ.get(self.header))
+            or (self.sample_rate and random.random() < self.sample_rate)):
+            return self.wsgi_app(environ, start_response)
+
+        method = environ.get('REQUEST_METHOD', 'GET')
+        path = environ.get('PATH_INFO', '/')
+        name = '%s-%s%s-%d.folded' % (strftime('%Y%m%dT%H%M%S'), method,
+            re.sub(r'[^A-Za-z0-9]+', '_', path), os.getpid())
+        profiler = StackProfiler('%s %s' % (method, path))
+
+        def profiled_start_response(status, headers, exc_info=None):
+            headers.append((PROFILE_HEADER, name))
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            profiler.stop()
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.write(os.path.join(self.directory, name))
+
+        profiler.start()
+        try:
+            body = self.wsgi_app(environ, profiled_start_response)
+        except BaseException:
+            finish()
+            raise
+
+        return ClosingIterator(body, [finish])
+
+
+class Profiler:
+    '''
+    Per request profiler. The wsgi app is only wrapped when profiling is
+    enabled, so it costs nothing otherwise.
+    '''
+    def __init__(self, app=None) -> None:
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app) -> None:
+        '''
+        Wrap the application's wsgi app if profiling is enabled
+        '''
+        app.config.setdefault('PROFILE_ENABLED', False) # profile requests with the header
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0) # share of all requests profiled
+        app.config.setdefault('PROFILE_DIRECTORY',
+            os.path.join(tempfile.gettempdir(), 'leave-profiles'))
+
+        if app.config['PROFILE_ENABLED'] or app.config['PROFILE_SAMPLE_RATE'] > 0:
+            app.wsgi_app = ProfilerMiddleware(app.wsgi_app,
+                app.config['PROFILE_DIRECTORY'], app.config['PROFILE_SAMPLE_RATE'],
+                app.config['PROFILE_ENABLED'])
+
+
+profiler = Profiler()
@@ -0,0 +1,265 @@
+'''
+Slow query log: statements over a time threshold are recorded with their
+parameters, origin and query plan
+'''
+
+import json
+import logging
+import os
+import random
+import sys
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from threading import Lock
+from time import perf_counter
+from typing import List, Optional
+
+from flask import current_app, has_request_context, request
+from flask_restful import Resource
+from sqlalchemy import event
+
+import backend.models
+from backend.models.db import db
+
+
+MODELS_DIRECTORY = os.path.dirname(os.path.abspath(backend.models.__file__))
+MAX_PARAMETERS_LENGTH = 500
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN '
+}
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+
+class SlowQueryRecorder:
+    '''
+    Times the statements of one engine and keeps the most recent slow ones.
+    Slow statements are sampled before their plan is captured, so the log
+    can stay on under production load.
+    '''
+    def __init__(self, threshold_ms: float, sample_rate: float, keep: int,
+        log_file: Optional[str] = None, max_bytes: int = 10 * 2 ** 20,
+        backups: int = 5) -> None:
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.queries: deque = deque(maxlen=keep)
+        self.counts = {'slow': 0, 'recorded': 0}
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.logger: Optional[logging.Logger] = None
+        self.logger_pid: Optional[int] = None
+        self.lock = Lock()
+
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context,
+        executemany) -> None:
+        conn.info.setdefault('query_started', []).append(perf_counter())
+
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context,
+        executemany) -> None:
+        started = conn.info['query_started'].pop()
+        seconds = perf_counter() - started
+        if seconds < self.threshold:
+            return
+
+        self.counts['slow'] += 1
+        if random.random() >= self.sample_rate:
+            return
+
+        self.record({
+            'time': datetime.utcnow().isoformat() + 'Z',
+            'duration_ms': round(seconds * 1000, 3),
+            'statement': statement,
+            'parameters': format_parameters(parameters),
+            'route': get_route(),
+            'model_method': get_model_method(),
+            'plan': None if executemany else explain(conn, statement, parameters)
+        })
+
+
+    def handle_error(self, context) -> None:
+        '''
+        Drop the start time of a statement that raised
+        '''
+        started = context.connection.info.get('query_started') \
+            if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+    def record(self, query: dict) -> None:
+        '''
+        Keep a slow query and write it to the log file
+        '''
+        with self.lock:
+            self.counts['recorded'] += 1
+            self.queries.append(query)
+            logger = self.get_logger()
+
+        if logger is not None:
+            logger.warning(json.dumps(query, default=str))
+
+
+    def get_logger(self) -> Optional[logging.Logger]:
+        '''
+        Get the file logger of this process. The log file name may contain
+        {pid} so each pre-forked worker rotates its own file.
+        '''
+        if self.log_file is None:
+            return None
+
+        pid = os.getpid()
+        if self.logger_pid != pid:
+            self.logger = logging.getLogger('backend.slow_queries.%d.%d' % (pid, id(self)))
+            self.logger.propagate = False
+            self.logger.setLevel(logging.WARNING)
+            handler = RotatingFileHandler(self.log_file.format(pid=pid),
+                maxBytes=self.max_bytes, backupCount=self.backups, delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s')) # one json object per line
+            self.logger.handlers = [handler]
+            self.logger_pid = pid
+
+        return self.logger
+
+
+    def get_queries(self, limit: int) -> List[dict]:
+        '''
+        Get the most recent slow queries, newest first
+        '''
+        with self.lock:
+            queries = list(self.queries)
+
+        return queries[::-1][:limit]
+
+
+class SlowQueryLog:
+    '''
+    Records slow statements of the application engine
+    '''
+    def __init__(self, app=None) -> None:
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app) -> None:
+        '''
+        Listen to the application engine's statements (db must be
+        initialized first)
+        '''
+        app.config.setdefault('SLOW_QUERY_ENABLED', True)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 100.0)
+        app.config.setdefault('SLOW_QUERY_SAMPLE_RATE', 1.0) # share of slow queries recorded
+        app.config.setdefault('SLOW_QUERY_KEEP', 100) # served at /debug/slow-queries
+        app.config.setdefault('SLOW_QUERY_LOG_FILE', None) # ex. /var/log/leave/slow-{pid}.log
+        app.config.setdefault('SLOW_QUERY_LOG_MAX_BYTES', 10 * 2 ** 20)
+        app.config.setdefault('SLOW_QUERY_LOG_BACKUPS', 5)
+
+        if not app.config['SLOW_QUERY_ENABLED']:
+            return
+
+        recorder = SlowQueryRecorder(app.config['SLOW_QUERY_THRESHOLD_MS'],
+            app.config['SLOW_QUERY_SAMPLE_RATE'], app.config['SLOW_QUERY_KEEP'],
+            app.config['SLOW_QUERY_LOG_FILE'], app.config['SLOW_QUERY_LOG_MAX_BYTES'],
+            app.config['SLOW_QUERY_LOG_BACKUPS'])
+        app.extensions['slow_queries'] = recorder
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', recorder.before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', recorder.after_cursor_execute)
+            event.listen(db.engine, 'handle_error', recorder.handle_error)
+
+
+    @property
+    def recorder(self) -> Optional[SlowQueryRecorder]:
+        '''
+        Recorder of the current application, None when disabled
+        '''
+        return current_app.extensions.get('slow_queries')
+
+
+slow_query_log = SlowQueryLog()
+
+
+def format_parameters(parameters) -> str:
+    '''
+    Bound parameters as text, truncated so bulk statements stay readable
+    '''
+    text = repr(parameters)
+    if len(text) > MAX_PARAMETERS_LENGTH:
+        text = text[:MAX_PARAMETERS_LENGTH] + '...'
+
+    return text
+
+
+def get_route() -> Optional[str]:
+    '''
+    Method and route of the current request
+    '''
+    if not has_request_context():
+        return None
+
+    rule = request.url_rule
+    return '%s %s' % (request.method, rule.rule if rule is not None else request.path)
+
+
+def get_model_method() -> Optional[str]:
+    '''
+    Model methods on the call stack, outermost first (ex.
+    LeaveModel.get_leave_remaining > LeaveUsageModel.get_days_used)
+    '''
+    methods = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if os.path.dirname(code.co_filename) == MODELS_DIRECTORY \
+            and not code.co_name.startswith('<'):
+            methods.append(getattr(code, 'co_qualname', code.co_name))
+        frame = frame.f_back
+
+    return ' > '.join(reversed(methods)) or None
+
+
+def explain(conn, statement: str, parameters) -> Optional[List[str]]:
+    '''
+    Query plan of a statement, run on a separate cursor of the same
+    connection so it is not timed itself
+    '''
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as error: # a plan is best effort, never fail the query
+        return ['Plan unavailable: %s' % (error)]
+    finally:
+        cursor.close()
+
+
+class SlowQueryResource(Resource):
+    def get(self):
+        '''
+        Get the most recent slow queries
+        '''
+        recorder = slow_query_log.recorder
+        if recorder is None:
+            return {'enabled': False}, 200
+
+        try:
+            limit = int(request.args.get('limit', recorder.queries.maxlen))
+        except ValueError:
+            return {'message': 'Invalid limit'}, 400
+
+        return {
+            'enabled': True,
+            'threshold_ms': recorder.threshold * 1000,
+            'sample_rate': recorder.sample_rate,
+            'counts': dict(recorder.counts),
+            'queries': recorder.get_queries(max(limit, 0))
+        }, 200
@@ -0,0 +1,273 @@
+'''
+Response cache for read endpoints with tag based invalidation
+'''
+
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from flask import current_app, request
+from flask_restful import Resource
+
+from backend.models.transaction import get_begin_value, record_on_begin
+
+
+class LRUStore:
+    '''
+    In process least recently used store with a size bound and time to live.
+    Entries are tagged so related entries can be invalidated together.
+
+    Each invalidation stamps its tags with a new generation, so a value
+    computed from data read before it (get_version) is not cached after it.
+    Only the max_size most recently invalidated tags are tracked, the others
+    share the floor generation (the latest one dropped), which can only
+    make a racing set skip caching.
+    '''
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: 'OrderedDict[Hashable, Tuple[Any, float, Tuple]]' = OrderedDict()
+        self.tags: Dict[Hashable, Set[Hashable]] = {}
+        self.generations: 'OrderedDict[Hashable, int]' = OrderedDict()
+        self.generation = 0 # last generation stamped
+        self.floor = 0 # generation of the tags not tracked
+        self.epoch = 0 # bumped when the whole store is cleared
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+            'invalidations': 0}
+        self.lock = Lock()
+
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        '''
+        Get a cached value, None on a miss
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            value, expires, _ = entry
+            if expires < monotonic():
+                self._remove(key)
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+
+    def get_version(self) -> Tuple[int, int]:
+        '''
+        Get the clear epoch and last invalidation generation of the store
+        '''
+        with self.lock:
+            return self.epoch, self.generation
+
+
+    def set(self, key: Hashable, value: Any, tags: Tuple[Hashable, ...],
+        version: Tuple[int, int]) -> None:
+        '''
+        Cache a value unless the store was cleared or one of its tags was
+        invalidated since the version was read (the value may be stale)
+        '''
+        with self.lock:
+            epoch, generation = version
+            if epoch != self.epoch or any(self.generations.get(tag, self.floor) > generation
+                for tag in tags):
+                return
+
+            if key in self.entries:
+                self._remove(key)
+
+            self.entries[key] = (value, monotonic() + self.ttl, tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+
+
+    def invalidate(self, tags: Iterable[Hashable]) -> None:
+        '''
+        Remove all entries with any of the tags
+        '''
+        with self.lock:
+            for tag in tags:
+                self.generation += 1
+                self.generations[tag] = self.generation
+                self.generations.move_to_end(tag)
+                for key in self.tags.pop(tag, ()):
+                    if key in self.entries:
+                        self._remove(key)
+                        self.stats['invalidations'] += 1
+
+            while len(self.generations) > self.max_size:
+                _, self.floor = self.generations.popitem(last=False)
+
+
+    def clear(self) -> None:
+        '''
+        Remove all entries
+        '''
+        with self.lock:
+            self.epoch += 1
+            self.stats['invalidations'] += len(self.entries)
+            self.entries.clear()
+            self.tags.clear()
+
+
+    def get_stats(self) -> Dict[str, int]:
+        '''
+        Get hit/miss/eviction counters and the current size
+        '''
+        with self.lock:
+            return dict(self.stats, size=len(self.entries), max_size=self.max_size)
+
+
+    def _remove(self, key: Hashable) -> None:
+        '''
+        Remove an entry and its tag references (lock held)
+        '''
+        _, _, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+
+class ResponseCache:
+    '''
+    Caches (body, status) responses of resource get methods by request path.
+    The store is pluggable (any object with the LRUStore interface) and
+    defaults to an in process LRU, so it must be disabled
+    (LEAVE_CACHE_ENABLED = False) when several processes write the database.
+    '''
+    def __init__(self, app=None) -> None:
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app, store=None) -> None:
+        '''
+        Register the cache on the application
+        '''
+        app.config.setdefault('LEAVE_CACHE_ENABLED', True)
+        app.config.setdefault('LEAVE_CACHE_SIZE', 4096)
+        app.config.setdefault('LEAVE_CACHE_TTL', 60.0)
+
+        if store is None:
+            store = LRUStore(app.config['LEAVE_CACHE_SIZE'], app.config['LEAVE_CACHE_TTL'])
+        app.extensions['response_cache'] = store
+
+
+    @property
+    def store(self) -> Optional[LRUStore]:
+        '''
+        Cache store of the current application, None if disabled
+        '''
+        if not current_app.config.get('LEAVE_CACHE_ENABLED'):
+            return None
+
+        return current_app.extensions.get('response_cache')
+
+
+    def cached(self, get_tags: Callable[..., Iterable[Hashable]]):
+        '''
+        Decorate a resource get method to cache its successful responses,
+        tagged with get_tags(**view_args)
+        '''
+        def decorator(method):
+            @wraps(method)
+            def wrapper(resource, *args, **kwargs):
+                store = self.store
+                if store is None:
+                    return method(resource, *args, **kwargs)
+
+                key = request.full_path
+                response = store.get(key)
+                if response is not None:
+                    return response
+
+                response = method(resource, *args, **kwargs)
+                # the store version from before the request's database snapshot
+                version = get_begin_value('response_cache') # None if enabled since
+
+                if isinstance(response, tuple) and response[1] == 200 and version is not None:
+                    store.set(key, response, tuple(get_tags(*args, **kwargs)), version)
+
+                return response
+
+            return wrapper
+
+        return decorator
+
+
+    def get_version(self) -> Optional[Tuple[int, int]]:
+        '''
+        Get the version of the cache store, None if disabled
+        '''
+        store = self.store
+        return None if store is None else store.get_version()
+
+
+    def invalidate(self, tags: Iterable[Hashable]) -> None:
+        '''
+        Invalidate cached responses with any of the tags
+        '''
+        store = self.store
+        if store is not None:
+            store.invalidate(tags)
+
+
+    def clear(self) -> None:
+        '''
+        Invalidate all cached responses
+        '''
+        store = self.store
+        if store is not None:
+            store.clear()
+
+
+response_cache = ResponseCache()
+record_on_begin('response_cache', response_cache.get_version)
+
+
+def user_tag(user_id: int) -> Tuple:
+    '''
+    Tag of all responses for a user
+    '''
+    return ('user', user_id)
+
+
+def user_schedule_tag(user_id: int) -> Tuple:
+    '''
+    Tag of responses depending on any of a user's leaves
+    '''
+    return ('user_schedule', user_id)
+
+
+def user_year_tag(user_id: int, year: int) -> Tuple:
+    '''
+    Tag of responses depending on a user's leaves in a year
+    '''
+    return ('user_year', user_id, year)
+
+
+class CacheStatsResource(Resource):
+    def get(self):
+        '''
+        Get response cache counters
+        '''
+        store = response_cache.store
+        if store is None:
+            return {'enabled': False}, 200
+
+        return dict(store.get_stats(), enabled=True), 200
@@ -0,0 +1,118 @@
+'''
+Conditional get (ETag / If-None-Match) support for per-user resources
+'''
+
+from functools import wraps
+from hashlib import blake2b
+from typing import Callable, Optional
+
+from flask import Response, request
+
+from backend.models.version import LeaveVersionModel
+
+
+def make_etag(user_id: int, version: int, scope: str = '') -> str:
+    '''
+    Make the (unquoted) strong entity tag of a user's data at a version,
+    optionally narrowed to a scope within it
+    '''
+    etag = '%d-%d' % (user_id, version)
+    return etag + '-' + scope if scope else etag
+
+
+def parse_etag_user_id(etag: str) -> Optional[int]:
+    '''
+    Get the user id from an entity tag made by make_etag
+    '''
+    try:
+        return int(etag.split('-')[0])
+    except ValueError:
+        return None
+
+
+def not_modified(etag: str) -> Response:
+    '''
+    Build a 304 not modified response
+    '''
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def with_etag(response, etag: str):
+    '''
+    Add an entity tag header to a successful resource response
+    '''
+    if isinstance(response, tuple) and len(response) == 2 and response[1] == 200:
+        return response[0], response[1], {'ETag': '"%s"' % (etag)}
+
+    return response
+
+
+def get_request_scope() -> str:
+    '''
+    Get a scope naming the requested resource (path and query), so the
+    entity tags of a user's different resources don't match each other
+    '''
+    return blake2b(request.full_path.encode(), digest_size=8).hexdigest()
+
+
+def conditional(get_user_id: Callable[..., int]):
+    '''
+    Decorate a resource get method whose response only depends on the data of
+    user get_user_id(**view_args). The user's version is looked up before the
+    method runs, and a matching If-None-Match is answered with a 304 without
+    running it. If-None-Match: * only matches if the method finds the
+    resource.
+    '''
+    def decorator(method):
+        @wraps(method)
+        def wrapper(resource, *args, **kwargs):
+            user_id = get_user_id(*args, **kwargs)
+            etag = make_etag(user_id, LeaveVersionModel.get_version(user_id),
+                get_request_scope())
+
+            if request.if_none_match.is_strong(etag):
+                return not_modified(etag)
+
+            response = method(resource, *args, **kwargs)
+            if request.if_none_match.star_tag and isinstance(response, tuple) \
+                and response[1] == 200:
+                return not_modified(etag)
+
+            return with_etag(response, etag)
+
+        return wrapper
+
+    return decorator
+
+
+def conditional_by_etag(get_scope: Callable[..., str]):
+    '''
+    Decorate a resource get method whose user is only known from its data,
+    scoped by get_scope(**view_args). The user id is taken from the
+    If-None-Match entity tags, so a matching version is answered with a 304
+    without running the method. Otherwise the method must return
+    (body, status, user id, version) with the version read together with the
+    data.
+    '''
+    def decorator(method):
+        @wraps(method)
+        def wrapper(resource, *args, **kwargs):
+            scope = get_scope(*args, **kwargs)
+
+            for etag in request.if_none_match.as_set():
+                user_id = parse_etag_user_id(etag)
+                if user_id is not None and etag == make_etag(user_id,
+                    LeaveVersionModel.get_version(user_id), scope):
+                    return not_modified(etag)
+
+            body, status, user_id, version = method(resource, *args, **kwargs)
+            if user_id is None:
+                return body, status
+
+            return with_etag((body, status), make_etag(user_id, version, scope))
+
+        return wrapper
+
+    return decorator
@@ -2,16 +2,139 @@
 Api endpoints for leave management
 '''
 
-from flask import json, request
+from datetime import MAXYEAR, MINYEAR, date, timedelta
+from typing import Iterable, List, Tuple
+from flask import Response, json, request, stream_with_context
 from flask_restful import Resource
+from marshmallow import ValidationError
+from sqlalchemy.orm.exc import StaleDataError
 
+from backend.models import analytics
+from backend.models.db import db
 from backend.models.leave import LeaveModel
-from backend.schemas.leave import LeaveSchema
+from backend.models.sweep import absence_days
+from backend.models.transaction import after_commit, begin_write
+from backend.models.workdays import work_calendars
+from backend.resources.cache import response_cache, user_schedule_tag, user_tag, \
+    user_year_tag
+from backend.resources.etag import conditional, conditional_by_etag
+from backend.resources.pagination import STREAM_CHUNK_SIZE, get_page_args, \
+    paging_requested, rows_page_response, rows_response, stream_rows_response, \
+    streaming_requested
+from backend.schemas.leave import LeaveSchema, leave_rows
 
 
 leave_schema = LeaveSchema()
 leave_list_schema = LeaveSchema(many=True)
 
+MAX_YEAR_RANGE = 100 # most years returned by a remaining leave range query
+MAX_BATCH_SIZE = 1000 # most leaves created by a batch request
+MAX_RESERVE_ATTEMPTS = 3 # tries to reserve a batch's leave days
+MAX_UPDATE_ATTEMPTS = 3 # tries to update a leave changed concurrently
+MAX_CALENDAR_DAYS = 3660 # widest absence calendar window
+MAX_AVAILABILITY_DAYS = 366 # longest leave searched for by the availability query
+
+
+def invalidate_cached(user_id: int, periods: Iterable[Tuple[date, date]]) -> None:
+    '''
+    Invalidate cached responses for a user's leaves changed over the periods
+    once the request commits
+    '''
+    after_commit(response_cache.invalidate, [user_schedule_tag(user_id)] +
+        [user_year_tag(user_id, year) for start_date, end_date in periods
+            for year in range(start_date.year, end_date.year + 1)])
+
+
+def get_year_range_args():
+    '''
+    Get the from_year and to_year arguments (to_year defaults to
+    from_year), or an error message if they are missing or invalid
+    '''
+    if 'from_year' not in request.args:
+        return None, None, 'Missing year range'
+
+    try:
+        from_year = int(request.args['from_year'])
+        to_year = int(request.args.get('to_year', from_year))
+    except ValueError:
+        return None, None, 'Invalid year range'
+
+    if from_year > to_year or to_year - from_year >= MAX_YEAR_RANGE:
+        return None, None, 'Invalid year range'
+
+    return from_year, to_year, None
+
+
+def get_remaining_range_tags(user_id: int) -> List[Tuple]:
+    '''
+    Cache tags of a remaining leave year range response
+    '''
+    from_year, to_year, error = get_year_range_args()
+
+    if error:
+        return [user_tag(user_id)] # error responses are not cached
+
+    return [user_tag(user_id)] + [user_year_tag(user_id, year)
+        for year in range(from_year, to_year + 1)]
+
+
+def get_user_ids_arg():
+    '''
+    Get the comma separated user_ids argument (None if absent), or an error
+    message if it is invalid
+    '''
+    if 'user_ids' not in request.args:
+        return None, None
+
+    try:
+        return [int(id) for id in request.args['user_ids'].split(',')], None
+    except ValueError:
+        return None, 'Invalid user ids'
+
+
+def merge_requested() -> bool:
+    '''
+    Check if the request asks for overlapping/adjacent leaves to be merged
+    '''
+    return request.args.get('merge', 'false').lower() in ('true', '1')
+
+
+def merge_leave(leave: 'LeaveModel'):
+    '''
+    Save a new or updated leave, coalescing it with the user's overlapping
+    and adjacent leaves. Responds with the merged leave and a diff of the
+    created, updated and deleted leave ids.
+    '''
+    others = LeaveModel.get_leave_mergeable(leave)
+    start_date = min([leave.start_date] + [other.start_date for other in others])
+    end_date = max([leave.end_date] + [other.end_date for other in others])
+
+    created = leave.id is None
+    if created and others: # extend an existing leave instead of adding one
+        leave, others = others[0], others[1:]
+
+    leave.start_date = start_date
+    leave.end_date = end_date
+
+    created = created and leave.id is None
+    deleted = [other.id for other in others]
+    periods = [(start_date, end_date)] + [other._stored_period for other in others]
+    if leave._stored_period:
+        periods.append(leave._stored_period)
+
+    if not leave.coalesce(others):
+        return {'message': 'Not enough leave days'}, 400
+
+    invalidate_cached(leave.user_id, periods)
+
+    diff = {
+        'created': [leave.id] if created else [],
+        'updated': [] if created else [leave.id],
+        'deleted': deleted
+    }
+
+    return {'leave': leave_schema.dump(leave), 'diff': diff}, 201 if created else 200
+
 
 def update_leave(leave: 'LeaveModel', json_data: json):
     '''
@@ -21,9 +144,9 @@ def update_leave(leave: 'LeaveModel', json_data: json):
     new_end = leave.end_date
 
     if 'start_date' in json_data:
-        new_start = LeaveModel.str_to_datetime(json_data['start_date'])
+        new_start = LeaveModel.str_to_date(json_data['start_date'])
     if 'end_date' in json_data:
-        new_end = LeaveModel.str_to_datetime(json_data['end_date'])
+        new_end = LeaveModel.str_to_date(json_data['end_date'])
     
     if new_start > new_end:
         return {'message': 'Invalid leave range'}, 400
@@ -31,52 +154,147 @@ def update_leave(leave: 'LeaveModel', json_data: json):
     leave.start_date = new_start
     leave.end_date = new_end
 
-    if not LeaveModel.leave_period_valid(leave):
-        leave.rollback()
+    if merge_requested():
+        return merge_leave(leave)
+
+    periods = [leave._stored_period, (new_start, new_end)]
+    if not leave.update():
         return {'message': 'Not enough leave days'}, 400
 
-    leave.update()
+    invalidate_cached(leave.user_id, periods)
 
     return leave_schema.dump(leave), 200
 
 
-def create_leave(json_data: json):
+def load_leave(json_data: json):
     '''
-    Create a new leave entry
+    Load a new leave entry from request data. Returns the leave, or an error
+    response if the data is incomplete or invalid.
     '''
     data = leave_schema.load(json_data)
     if (not 'user_id' in data
         or not 'start_date' in data
         or not 'end_date' in data):
-        return {'message': 'Missing leave data'}, 400
+        return None, ({'message': 'Missing leave data'}, 400)
 
-    data['start_date'] = LeaveModel.str_to_datetime(data['start_date'])
-    data['end_date'] = LeaveModel.str_to_datetime(data['end_date'])
+    data['start_date'] = LeaveModel.str_to_date(data['start_date'])
+    data['end_date'] = LeaveModel.str_to_date(data['end_date'])
 
     if data['start_date'] > data['end_date']:
-        return {'message': 'Invalid leave range'}, 400
+        return None, ({'message': 'Invalid leave range'}, 400)
     
-    leave = LeaveModel(**data)
+    return LeaveModel(**data), None
 
-    if not LeaveModel.leave_period_valid(leave):
+
+def create_leave(json_data: json):
+    '''
+    Create a new leave entry
+    '''
+    leave, error = load_leave(json_data)
+    if error:
+        return error
+
+    if merge_requested():
+        return merge_leave(leave)
+
+    if not leave.add():
         return {'message': 'Not enough leave days'}, 400
 
-    leave.add()
+    invalidate_cached(leave.user_id, [leave._stored_period])
 
     return leave_schema.dump(leave), 201
 
 
+def create_leaves(json_data: json, atomic: bool):
+    '''
+    Create a batch of leave entries in a single transaction. Quota is checked
+    per (user, year) with one query and running totals, so leaves in the batch
+    count against each other. If atomic, nothing is created unless every
+    leave is valid.
+    '''
+    if not isinstance(json_data, list) or not json_data:
+        return {'message': 'No leave data provided'}, 400
+    if len(json_data) > MAX_BATCH_SIZE:
+        return {'message': 'Too many leaves'}, 400
+
+    results = [None] * len(json_data)
+    leaves = {}
+
+    for i, item in enumerate(json_data):
+        try:
+            leave, error = load_leave(item)
+        except ValidationError as error:
+            results[i] = {'status': 400, 'message': error.messages}
+            continue
+        except (TypeError, ValueError):
+            results[i] = {'status': 400, 'message': 'Invalid leave date'}
+            continue
+
+        if error:
+            results[i] = {'status': error[1], 'message': error[0]['message']}
+        else:
+            leaves[i] = leave
+
+    keys = {(leave.user_id, year) for leave in leaves.values()
+        for year in range(leave.start_date.year, leave.end_date.year + 1)}
+
+    # the accepted leaves are picked from a ledger snapshot, then reserved
+    # together with conditional updates, retried if a concurrent write
+    # changed the balances in between
+    for _ in range(MAX_RESERVE_ATTEMPTS):
+        remaining = LeaveModel.get_leave_remaining_for(keys)
+        accepted = []
+        rejected = []
+
+        for i, leave in leaves.items():
+            days_by_year = LeaveModel.get_leave_days_by_year(leave.start_date, leave.end_date)
+
+            if any(remaining[(leave.user_id, year)] - days < 0
+                for year, days in days_by_year.items()):
+                rejected.append(i)
+                continue
+
+            for year, days in days_by_year.items():
+                remaining[(leave.user_id, year)] -= days
+            accepted.append(i)
+
+        failed = len(accepted) < len(json_data)
+        if (atomic and failed) or not accepted:
+            break
+
+        entries = LeaveModel.add_all([leaves[i] for i in accepted])
+        if entries is not None:
+            break
+    else:
+        return {'message': 'Conflicting leave changes, try again'}, 409
+
+    for i in rejected:
+        results[i] = {'status': 400, 'message': 'Not enough leave days'}
+
+    if (atomic and failed) or not accepted: # nothing created
+        for i in accepted:
+            results[i] = {'status': 400, 'message': 'Batch not committed'}
+        return {'results': results}, 400
+
+    for i, entry in zip(accepted, entries):
+        results[i] = {'status': 201, 'leave': leave_schema.dump(entry)}
+        invalidate_cached(entry.user_id, [(entry.start_date, entry.end_date)])
+
+    return {'results': results}, 200 if failed else 201
+
+
 class LeaveResource(Resource):
+    @conditional_by_etag(lambda id: 'l%d' % (id))
     def get(self, id: int):
         '''
         Get leave entry
         '''
-        leave = LeaveModel.get_leave(id)
+        leave, version = LeaveModel.get_leave_with_version(id)
         
         if leave:
-            return leave_schema.dump(leave), 200
+            return leave_schema.dump(leave), 200, leave.user_id, version
         else:
-            return {'message': 'Leave not found'}, 404
+            return {'message': 'Leave not found'}, 404, None, None
 
 
     def put(self, id: int):
@@ -89,11 +307,18 @@ class LeaveResource(Resource):
         except:
             return {'message': 'No leave data provided'}, 400
         
-        leave = LeaveModel.get_leave(id)
-        if leave:
-           return update_leave(leave, json_data)
-        else:
-            return {'message': 'Leave not found'}, 404
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            leave = LeaveModel.get_leave(id)
+            if not leave:
+                return {'message': 'Leave not found'}, 404
+
+            try:
+                return update_leave(leave, json_data)
+            except StaleDataError: # changed since loaded, reload and retry
+                db.session.rollback()
+                begin_write()
+
+        return {'message': 'Conflicting leave changes, try again'}, 409
     
 
     def delete(self, id: int):
@@ -102,7 +327,9 @@ class LeaveResource(Resource):
         '''
         leave = LeaveModel.get_leave(id)
         if leave:
+            user_id, period = leave.user_id, leave._stored_period
             leave.delete()
+            invalidate_cached(user_id, [period])
             return {'message': 'Leave deleted'}, 200
         else:
             return {'message': 'Leave not found'}, 404
@@ -122,7 +349,27 @@ class LeaveCreateResource(Resource):
         return create_leave(json_data)
 
 
+class LeaveBatchResource(Resource):
+    def post(self):
+        '''
+        Create a batch of leave entries (atomic=false to create the valid
+        entries even if others fail)
+        '''
+        json_data = None
+        try:
+            json_data = request.get_json()
+        except:
+            return {'message': 'No leave data provided'}, 400
+
+        atomic = request.args.get('atomic', 'true').lower() in ('true', '1')
+
+        return create_leaves(json_data, atomic)
+
+
 class LeaveRemainingResource(Resource):
+    @conditional(lambda user_id, year: user_id)
+    @response_cache.cached(lambda user_id, year: [user_tag(user_id),
+        user_year_tag(user_id, year)])
     def get(self, user_id: int, year: int):
         '''
         Get remaining leave for a user in the leave year preceeding
@@ -133,13 +380,195 @@ class LeaveRemainingResource(Resource):
         return {'remaining': remaining}, 200
 
 
+class LeaveRemainingRangeResource(Resource):
+    @conditional(lambda user_id: user_id)
+    @response_cache.cached(get_remaining_range_tags)
+    def get(self, user_id: int):
+        '''
+        Get remaining leave for a user in each year from from_year to
+        to_year (inclusive)
+        '''
+        from_year, to_year, error = get_year_range_args()
+        if error:
+            return {'message': error}, 400
+
+        remaining = LeaveModel.get_leave_remaining_by_year(user_id, from_year, to_year)
+
+        return {'remaining': {str(year): days for year, days in remaining.items()}}, 200
+
+
+class LeaveMaxEndResource(Resource):
+    @conditional(lambda user_id, start_date_str: user_id)
+    @response_cache.cached(lambda user_id, start_date_str: [user_tag(user_id),
+        user_schedule_tag(user_id)])
+    def get(self, user_id: int, start_date_str: str):
+        '''
+        Get the latest end date the remaining leave days allow for a new
+        leave starting on the provided date (null if none)
+        '''
+        try:
+            start_date = LeaveModel.str_to_date(start_date_str)
+        except ValueError:
+            return {'message': 'Invalid date'}, 400
+
+        max_end_date = LeaveModel.get_max_end_date(user_id, start_date)
+
+        return {'max_end_date': LeaveModel.date_to_str(max_end_date)
+            if max_end_date else None}, 200
+
+
+class LeaveAvailabilityResource(Resource):
+    def get(self, user_id: int):
+        '''
+        Get the earliest period of the provided number of days, on or after
+        the provided date (today by default), that fits in the remaining
+        leave and overlaps none of the user's leaves
+        '''
+        days = request.args.get('days', type=int)
+        if days is None or not 0 < days <= MAX_AVAILABILITY_DAYS:
+            return {'message': 'Invalid number of days'}, 400
+
+        date_from = date.today()
+        if 'after' in request.args:
+            try:
+                date_from = LeaveModel.str_to_date(request.args['after'])
+            except ValueError:
+                return {'message': 'Invalid date'}, 400
+
+        period = LeaveModel.get_available_period(user_id, days, date_from)
+        if period is None:
+            return {'message': 'No available leave period'}, 404
+
+        return {'start_date': LeaveModel.date_to_str(period[0]),
+            'end_date': LeaveModel.date_to_str(period[1])}, 200
+
+
+class LeaveRemainingBulkResource(Resource):
+    def get(self, year: int):
+        '''
+        Get remaining leave for all users (or the comma separated user_ids)
+        in a year, streamed as json or csv (format=csv)
+        '''
+        user_ids, error = get_user_ids_arg()
+        if error:
+            return {'message': error}, 400
+
+        output_format = request.args.get('format', 'json')
+        if output_format not in ('json', 'csv'):
+            return {'message': 'Invalid format'}, 400
+
+        remaining = LeaveModel.get_leave_remaining_all(year, user_ids)
+
+        if output_format == 'csv':
+            def generate_csv():
+                yield 'user_id,remaining\n'
+                for user_id, days in remaining:
+                    yield '%d,%d\n' % (user_id, days)
+
+            return Response(stream_with_context(generate_csv()), mimetype='text/csv')
+
+        def generate_json():
+            separator = ''
+            yield '['
+            for user_id, days in remaining:
+                yield separator + json.dumps({'user_id': user_id, 'remaining': days})
+                separator = ','
+            yield ']'
+
+        return Response(stream_with_context(generate_json()), mimetype='application/json')
+
+
+class LeaveAnalyticsResource(Resource):
+    def get(self, year: int):
+        '''
+        Get the number of users out on each day of a year (or of quarter=1-4)
+        and the leave days each user used in it, as arrays
+        '''
+        if not MINYEAR <= year < MAXYEAR: # the last year's windows would overflow
+            return {'message': 'Invalid year'}, 400
+
+        quarter = request.args.get('quarter')
+        if quarter is None:
+            date_from, date_to = date(year, 1, 1), date(year, 12, 31)
+        elif quarter in ('1', '2', '3', '4'):
+            first_month = 3 * int(quarter) - 2
+            date_from = date(year, first_month, 1)
+            date_to = date(year + 1, 1, 1) if quarter == '4' else date(year, first_month + 3, 1)
+            date_to -= timedelta(days=1)
+        else:
+            return {'message': 'Invalid quarter'}, 400
+
+        days = (date_to - date_from).days + 1
+        columns = LeaveModel.get_columns(date_from, date_to)
+        user_ids, days_used = analytics.days_used(columns,
+            work_calendars.current.window(date_from, days))
+
+        return {
+            'from': LeaveModel.date_to_str(date_from),
+            'to': LeaveModel.date_to_str(date_to),
+            'headcount': analytics.headcount(columns, days),
+            'user_ids': user_ids,
+            'days_used': days_used
+        }, 200
+
+
+class LeaveCalendarResource(Resource):
+    def get(self):
+        '''
+        Get who is out between two dates (from, to inclusive) for all users
+        (or the comma separated user_ids), streamed as a json list of the
+        runs of days with the same users out (or each day with users out if
+        by=day). Days with nobody out are left out.
+        '''
+        try:
+            date_from = LeaveModel.str_to_date(request.args['from'])
+            date_to = LeaveModel.str_to_date(request.args['to'])
+        except KeyError:
+            return {'message': 'Missing date range'}, 400
+        except ValueError:
+            return {'message': 'Invalid date range'}, 400
+
+        if date_from > date_to or (date_to - date_from).days >= MAX_CALENDAR_DAYS:
+            return {'message': 'Invalid date range'}, 400
+
+        user_ids, error = get_user_ids_arg()
+        if error:
+            return {'message': error}, 400
+
+        by = request.args.get('by', 'segment')
+        if by not in ('segment', 'day'):
+            return {'message': 'Invalid grouping'}, 400
+
+        segments = LeaveModel.get_absences(date_from, date_to, user_ids)
+        if by == 'day':
+            items = ({'date': LeaveModel.date_to_str(day), 'user_ids': users}
+                for day, users in absence_days(segments))
+        else:
+            items = ({'start_date': LeaveModel.date_to_str(first_day),
+                'end_date': LeaveModel.date_to_str(last_day), 'user_ids': users}
+                for first_day, last_day, users in segments)
+
+        def generate_json():
+            separator = ''
+            yield '['
+            for item in items:
+                yield separator + json.dumps(item)
+                separator = ','
+            yield ']'
+
+        return Response(stream_with_context(generate_json()), mimetype='application/json')
+
+
 class LeaveScheduledResource(Resource):
+    @conditional(lambda user_id, date_from_str: user_id)
+    @response_cache.cached(lambda user_id, date_from_str: [user_tag(user_id),
+        user_schedule_tag(user_id)])
     def get(self, user_id: int, date_from_str: str):
         '''
         Get scheduled leave for a user from the provided date onwards.
         Leave straddling the provided date is included.
         '''
-        date_from = LeaveModel.str_to_datetime(date_from_str)
+        date_from = LeaveModel.str_to_date(date_from_str)
         scheduled = LeaveModel.get_leave_from(user_id, date_from)
         return leave_list_schema.dump(scheduled), 200
 
@@ -147,9 +576,22 @@ class LeaveScheduledResource(Resource):
 class LeaveListResource(Resource):
     def get(self):
         '''
-        Get all leave entries
+        Get all leave entries, a keyset page of them (after_id, limit) or
+        stream them as newline delimited json (format=ndjson)
         '''
-        return leave_list_schema.dump(LeaveModel.get_all()), 200
+        if streaming_requested():
+            return stream_rows_response(LeaveModel.iter_rows(STREAM_CHUNK_SIZE), leave_rows)
+
+        if paging_requested():
+            page, error = get_page_args()
+            if error:
+                return {'message': error}, 400
+
+            after_id, limit = page
+            return rows_page_response(LeaveModel.get_rows(after_id, limit + 1), limit,
+                leave_rows)
+
+        return rows_response(LeaveModel.get_rows(), leave_rows)
 
 
     def delete(self):
@@ -157,4 +599,5 @@ class LeaveListResource(Resource):
         Delete all leave entries
         '''
         deleted = LeaveModel.delete_all()
+        after_commit(response_cache.clear)
         return {'message': '%d leave(s) deleted' % (deleted)}, 200
\ No newline at end of file
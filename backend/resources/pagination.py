@@ -0,0 +1,101 @@
+'''
+Helpers for paginated and streamed list endpoints
+'''
+
+from typing import Iterable, Optional, Sequence, Tuple
+
+from flask import Response, current_app, request, stream_with_context
+
+from backend.schemas.rows import RowSerializer
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 1000 # rows loaded per database round trip when streaming
+
+
+def paging_requested() -> bool:
+    '''
+    Check if the request asks for a page of the list
+    '''
+    return 'after_id' in request.args or 'limit' in request.args
+
+
+def streaming_requested() -> bool:
+    '''
+    Check if the request asks for the list streamed as newline delimited json
+    '''
+    return request.args.get('format') == 'ndjson'
+
+
+def get_page_args() -> Tuple[Optional[Tuple[int, int]], Optional[str]]:
+    '''
+    Get the (after id, limit) keyset page arguments of the request, or an
+    error message if they are invalid
+    '''
+    try:
+        after_id = int(request.args.get('after_id', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None, 'Invalid page'
+
+    if after_id < 0 or limit < 1 or limit > MAX_PAGE_SIZE:
+        return None, 'Invalid page'
+
+    return (after_id, limit), None
+
+
+def fast_json_enabled() -> bool:
+    '''
+    Check if row responses can be formatted directly, that is flask restful
+    encodes json with the default settings (not indented in debug mode)
+    '''
+    return not current_app.debug and not current_app.config.get('RESTFUL_JSON')
+
+
+def json_text_response(text: str) -> Response:
+    '''
+    Build a response from json text, encoded like flask restful would
+    '''
+    return Response(text + '\n', mimetype='application/json')
+
+
+def rows_response(rows: Sequence[Sequence], serializer: RowSerializer):
+    '''
+    Build a list response from rows
+    '''
+    if not fast_json_enabled():
+        return serializer.dump_list(rows), 200
+
+    return json_text_response(serializer.format_list(rows))
+
+
+def rows_page_response(rows: Sequence[Sequence], limit: int, serializer: RowSerializer):
+    '''
+    Build a page response from up to limit + 1 rows ordered by id (first
+    column), with the cursor for the next page if there are more rows
+    '''
+    next_id = rows[limit - 1][0] if len(rows) > limit else None
+    if not fast_json_enabled():
+        return {'items': serializer.dump_list(rows[:limit]), 'next': next_id}, 200
+
+    return json_text_response('{"items": %s, "next": %s}' % (
+        serializer.format_list(rows[:limit]), 'null' if next_id is None else next_id))
+
+
+def stream_rows_response(rows: Iterable[Sequence], serializer: RowSerializer) -> Response:
+    '''
+    Stream rows as newline delimited json, written STREAM_CHUNK_SIZE lines
+    at a time
+    '''
+    def generate():
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield serializer.format_lines(chunk)
+                chunk = []
+        if chunk:
+            yield serializer.format_lines(chunk)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -4,15 +4,21 @@ Api endpoints for user management
 
 from flask_restful import Resource
 
+from backend.models.transaction import after_commit
 from backend.models.user import UserModel
-from backend.schemas.user import UserSchema
+from backend.resources.cache import response_cache, user_tag
+from backend.resources.etag import conditional
+from backend.resources.pagination import STREAM_CHUNK_SIZE, get_page_args, \
+    paging_requested, rows_page_response, rows_response, stream_rows_response, \
+    streaming_requested
+from backend.schemas.user import UserSchema, user_rows
 
 
 user_schema = UserSchema()
-user_list_schema = UserSchema(many=True)
 
 
 class UserResource(Resource):
+    @conditional(lambda id: id)
     def get(self, id):
         '''
         Get user entry
@@ -48,6 +54,7 @@ class UserResource(Resource):
         
         if user:
             user.delete()
+            after_commit(response_cache.invalidate, [user_tag(id)])
             return {'message': 'User deleted'}, 200
         else:
             return {'message': 'User not found'}, 404
@@ -56,10 +63,22 @@ class UserResource(Resource):
 class UserListResource(Resource):
     def get(self):
         '''
-        Get all user entries
+        Get all user entries, a keyset page of them (after_id, limit) or
+        stream them as newline delimited json (format=ndjson)
         '''
-        users = UserModel.get_all()
-        return user_list_schema.dump(users), 200
+        if streaming_requested():
+            return stream_rows_response(UserModel.iter_rows(STREAM_CHUNK_SIZE), user_rows)
+
+        if paging_requested():
+            page, error = get_page_args()
+            if error:
+                return {'message': error}, 400
+
+            after_id, limit = page
+            return rows_page_response(UserModel.get_rows(after_id, limit + 1), limit,
+                user_rows)
+
+        return rows_response(UserModel.get_rows(), user_rows)
 
 
     def delete(self):
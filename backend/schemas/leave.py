@@ -2,13 +2,36 @@
 Leave model schema
 '''
 
+from datetime import date
+
+from marshmallow import fields
+
 from backend.schemas.ma import ma
+from backend.schemas.rows import RowSerializer
 from backend.models.leave import LeaveModel
 
 
+class LeaveDate(fields.Field):
+    '''
+    Leave date, dumped in the api date time format (loaded as is, the
+    resources parse it)
+    '''
+    def _serialize(self, value, attr, obj, **kwargs):
+        return None if value is None else LeaveModel.date_to_str(value)
+
+
 class LeaveSchema(ma.Schema):
+    user_id = ma.Integer() # loaded as int so in process lookups match db rows
+    start_date = LeaveDate()
+    end_date = LeaveDate()
+
     class Meta:
         model = LeaveModel
         fields = ('id', 'user_id', 'start_date', 'end_date')
         load_instance = True
         include_fk = True
+
+
+# same output as LeaveSchema for LeaveModel.get_rows/iter_rows rows
+leave_rows = RowSerializer((('id', int), ('user_id', int), ('start_date', date),
+    ('end_date', date)))
@@ -3,6 +3,7 @@ User model schema
 '''
 
 from backend.schemas.ma import ma
+from backend.schemas.rows import RowSerializer
 from backend.models.user import UserModel
 
 
@@ -11,3 +12,7 @@ class UserSchema(ma.Schema):
         model = UserModel
         fields = ('id',)
         load_instance = True
+
+
+# same output as UserSchema for UserModel.get_rows/iter_rows rows
+user_rows = RowSerializer((('id', int),))
@@ -2,57 +2,110 @@
 Sets up and runs RESTful API server
 '''
 
+import os
+from time import perf_counter
+from typing import Optional
+
 from flask import Flask, Blueprint, jsonify
 from flask_cors import CORS
 from flask_restful import Api
 from marshmallow import ValidationError
 
-from backend.models.db import db
+from backend.models.db import db, DEFAULT_DATABASE_URI, configure_engine, \
+    set_sqlite_pragmas, set_sqlite_transactions
+from backend.models.index import leave_index
+from backend.models.transaction import unit_of_work
+from backend.models.workdays import work_calendars
+from backend.monitoring.metrics import metrics, MetricsResource
+from backend.monitoring.profiler import profiler
+from backend.monitoring.slow_queries import slow_query_log, SlowQueryResource
 from backend.schemas.ma import ma
+from backend.resources.cache import response_cache, CacheStatsResource
 from backend.resources.user import UserResource, UserListResource
 from backend.resources.leave import LeaveResource, LeaveCreateResource, \
-    LeaveRemainingResource, LeaveScheduledResource, LeaveListResource
-
-app = Flask(__name__)
-CORS(app) # disable cross site blockcing
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:' # use memory for debug
+    LeaveBatchResource, LeaveRemainingResource, \
+    LeaveRemainingRangeResource, LeaveRemainingBulkResource, LeaveScheduledResource, \
+    LeaveListResource, LeaveCalendarResource, LeaveAnalyticsResource, LeaveMaxEndResource, \
+    LeaveAvailabilityResource
 
 bluePrint = Blueprint('api', __name__)
 api = Api(bluePrint)
-app.register_blueprint(bluePrint)
 
 api.add_resource(UserResource, '/user/<int:id>')
 api.add_resource(UserListResource, '/user/list')
 api.add_resource(LeaveResource, '/leave/<int:id>')
 api.add_resource(LeaveCreateResource, '/leave/create')
+api.add_resource(LeaveBatchResource, '/leave/batch')
 api.add_resource(LeaveRemainingResource, '/leave/remaining/<int:user_id>/<int:year>')
+api.add_resource(LeaveRemainingRangeResource, '/leave/remaining/<int:user_id>')
+api.add_resource(LeaveRemainingBulkResource, '/leave/remaining/bulk/<int:year>')
 api.add_resource(LeaveScheduledResource, 
     '/leave/scheduled/<int:user_id>/<string:date_from_str>')
 api.add_resource(LeaveListResource, '/leave/list')
+api.add_resource(LeaveCalendarResource, '/leave/calendar')
+api.add_resource(LeaveAnalyticsResource, '/leave/analytics/<int:year>')
+api.add_resource(LeaveMaxEndResource, '/leave/max-end/<int:user_id>/<string:start_date_str>')
+api.add_resource(LeaveAvailabilityResource, '/leave/availability/<int:user_id>')
+api.add_resource(CacheStatsResource, '/cache/stats')
+api.add_resource(MetricsResource, '/metrics')
+api.add_resource(SlowQueryResource, '/debug/slow-queries')
 
 
-@app.before_first_request
-def create_tables():
-    db.create_all()
-
-
-@app.errorhandler(404)
 def handle_404(error):
     return jsonify({'message': 'Not found'}), 404
 
 
-@app.errorhandler(ValidationError)
 def handle_validation_error(error):
     return jsonify(error.messages), 400
 
 
-def main():
-    app.logger.info('Starting backend...')
+def create_app(config: Optional[dict] = None) -> Flask:
+    '''
+    Create the api application, overriding the default config with config.
+    The extensions are initialized and the schema is created before the app
+    is returned so the first request does not pay for it.
+    '''
+    started = perf_counter()
+
+    app = Flask(__name__)
+    CORS(app) # disable cross site blockcing
+    # ex. DATABASE_URI=sqlite:////var/lib/leave/leave.db for a persistent database
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI', DEFAULT_DATABASE_URI)
+    app.config['LEAVE_INDEX_ENABLED'] = True # in process leave interval index
+    app.config['LEAVE_CACHE_ENABLED'] = True # in process read response cache
+    app.config.update(config or {})
+
+    app.register_blueprint(bluePrint)
+    app.register_error_handler(404, handle_404)
+    app.register_error_handler(ValidationError, handle_validation_error)
 
+    configure_engine(app)
     db.init_app(app)
+    metrics.init_app(app) # first, so it times the hooks of the other extensions
+    slow_query_log.init_app(app)
+    profiler.init_app(app)
     ma.init_app(app)
+    work_calendars.init_app(app)
+    leave_index.init_app(app)
+    response_cache.init_app(app)
+    unit_of_work.init_app(app)
+
+    with app.app_context():
+        set_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        set_sqlite_transactions(db.engine)
+        db.create_all()
+
+    app.config['STARTUP_MS'] = (perf_counter() - started) * 1000
+    app.logger.info('App created in %.1f ms', app.config['STARTUP_MS'])
+
+    return app
+
+
+def main():
+    app = create_app()
+    app.logger.info('Starting backend...')
     app.run(debug=True)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
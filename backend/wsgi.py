@@ -0,0 +1,115 @@
+'''
+Production entry point, serves the api from pre-forked gunicorn workers
+(one per core by default):
+
+    DATABASE_URI=sqlite:////var/lib/leave/leave.db python3 backend/wsgi.py
+
+or with the gunicorn command line:
+
+    gunicorn -c python:backend.wsgi backend.wsgi:app
+'''
+
+import logging
+import multiprocessing
+import os
+import tempfile
+from time import perf_counter
+
+from backend.models.db import db, is_sqlite_memory
+from backend.models.workdays import get_regions
+from backend.server import create_app
+
+
+logger = logging.getLogger('backend.wsgi')
+
+
+# the in process index and cache only see their own worker's writes
+PRODUCTION_CONFIG = {
+    'LEAVE_INDEX_ENABLED': False,
+    'LEAVE_CACHE_ENABLED': False,
+    'SLOW_QUERY_SAMPLE_RATE': float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 0.1)),
+    # ex. /var/log/leave/slow-{pid}.log, one file per worker
+    'SLOW_QUERY_LOG_FILE': os.environ.get('SLOW_QUERY_LOG_FILE'),
+    # ex. PROFILE_SAMPLE_RATE=0.001 to profile one request in a thousand
+    'PROFILE_ENABLED': os.environ.get('PROFILE_ENABLED') == '1',
+    'PROFILE_SAMPLE_RATE': float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0)),
+    'PROFILE_DIRECTORY': os.environ.get('PROFILE_DIRECTORY',
+        os.path.join(tempfile.gettempdir(), 'leave-profiles')),
+    # ex. LEAVE_REGION=weekdays to only charge Monday to Friday, or a region of
+    # LEAVE_REGIONS_FILE (json, ex. {"us": {"weekmask": "1111100",
+    # "holidays": ["2021-12-24", ...]}}); rebuild the usage ledger on a change
+    # (python3 -m backend.migrations.leave_usage)
+    'LEAVE_REGION': os.environ.get('LEAVE_REGION'),
+    'LEAVE_REGIONS': get_regions(os.environ.get('LEAVE_REGIONS_FILE'))
+}
+
+
+def get_workers(uri: str) -> int:
+    '''
+    Get the number of worker processes, WEB_CONCURRENCY or one per core. An
+    in memory database cannot be shared so it is limited to one worker.
+    '''
+    if is_sqlite_memory(uri):
+        logger.warning('In memory database, serving from a single worker')
+        return 1
+
+    return int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+
+started = perf_counter()
+app = create_app(PRODUCTION_CONFIG)
+
+
+'''
+Gunicorn settings (read with -c python:backend.wsgi)
+'''
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = get_workers(app.config['SQLALCHEMY_DATABASE_URI'])
+preload_app = True # import and create the schema once in the arbiter
+
+
+def post_fork(server, worker) -> None:
+    '''
+    Drop the connections inherited from the arbiter without closing them
+    (the arbiter still owns them) so each worker opens its own. The single
+    worker of an in memory database keeps the inherited connection, a new
+    one would open a new, empty database.
+    '''
+    if is_sqlite_memory(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def when_ready(server) -> None:
+    '''
+    Report the cold start latency, from import to accepting connections
+    '''
+    server.log.info('Cold start in %.1f ms (app created in %.1f ms), %d worker(s)',
+        (perf_counter() - started) * 1000, app.config['STARTUP_MS'], workers)
+
+
+def main() -> None:
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit('gunicorn is required to serve in production, '
+            'install with: pip3 install -e .[production]')
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for name in ('bind', 'workers', 'preload_app'):
+                self.cfg.set(name, globals()[name])
+            self.cfg.set('post_fork', post_fork)
+            self.cfg.set('when_ready', when_ready)
+
+
+        def load(self):
+            return app
+
+    Application().run()
+
+
+if __name__ == '__main__':
+    main()
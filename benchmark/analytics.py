@@ -0,0 +1,91 @@
+'''
+Compares the columnar analytics (numpy and plain python) with looping the
+per leave helpers, on random leaves over a year.
+
+Run with:
+
+    python3 -m benchmark.analytics [--leaves 1000000] [--repeat 3]
+'''
+
+import argparse
+import random
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+from backend.models import analytics
+from backend.models.leave import LeaveModel
+from benchmark.serialization import measure
+
+
+YEAR = 2021
+YEAR_START = date(YEAR, 1, 1)
+DAYS = 365
+COUNTS = list(range(DAYS + 1)) # every day charged
+
+
+def random_rows(count: int, users: int) -> List[Tuple[int, int, int]]:
+    '''
+    (user id, start offset, end offset) rows overlapping the year
+    '''
+    rand = random.Random(0)
+    rows = []
+    for _ in range(count):
+        start = rand.randrange(-20, DAYS)
+        rows.append((rand.randint(1, users), start, start + rand.randrange(20)))
+    return rows
+
+
+def per_leave(rows: List[Tuple[int, int, int]]) -> None:
+    '''
+    Headcount from checking each leave on each day and usage from
+    get_leave_days_in_year, the way the model helpers would be looped
+    '''
+    leaves = [(user_id, YEAR_START + timedelta(days=start), YEAR_START + timedelta(days=end))
+        for user_id, start, end in rows]
+    for offset in range(DAYS):
+        day = YEAR_START + timedelta(days=offset)
+        len({user_id for user_id, start_date, end_date in leaves
+            if start_date <= day <= end_date})
+
+    used = {}
+    for user_id, start_date, end_date in leaves:
+        used[user_id] = used.get(user_id, 0) + \
+            LeaveModel.get_leave_days_in_year(start_date, end_date, YEAR)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--leaves', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--sample', type=int, default=10000,
+        help='leaves the per leave loop runs on, its time is scaled up')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = random_rows(args.leaves, args.users)
+    columns = analytics.to_columns(rows)
+    python_columns = analytics.LeaveColumns(*(list(column) for column in columns))
+
+    candidates: Dict[str, Callable] = {}
+    if analytics.np is not None:
+        candidates['numpy'] = lambda: (analytics.headcount_numpy(columns, DAYS),
+            analytics.days_used_numpy(columns, COUNTS))
+        candidates['to_columns'] = lambda: analytics.to_columns(rows)
+    candidates['python'] = lambda: (analytics.headcount_python(python_columns, DAYS),
+        analytics.days_used_python(python_columns, COUNTS))
+
+    print('%d leaves, %d users' % (args.leaves, args.users))
+    print('%-14s %10s' % ('version', 'seconds'))
+    for name, function in candidates.items():
+        print('%-14s %10.3f' % (name, measure(function, args.repeat)))
+
+    sample = rows[:args.sample]
+    started = perf_counter()
+    per_leave(sample)
+    print('%-14s %10.3f (scaled from %d leaves)' % ('per leave',
+        (perf_counter() - started) * args.leaves / len(sample), len(sample)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''
+Compares two endpoint benchmark results (see benchmark.endpoints), printing
+the change of each endpoint's latency and throughput. Exits with an error
+if an endpoint regressed by more than the threshold.
+
+Run with:
+
+    python3 -m benchmark.compare benchmark/results/<old>.json benchmark/results/<new>.json \
+        [--threshold 0.1]
+'''
+
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+
+# metric name, True if larger is better
+METRICS = [('p50_ms', False), ('p99_ms', False), ('throughput_rps', True)]
+
+
+def change(old: float, new: float) -> Optional[float]:
+    '''
+    Relative change from old to new, None if old is zero
+    '''
+    return (new - old) / old if old else None
+
+
+def compare(old: Dict, new: Dict, threshold: float) -> List[str]:
+    '''
+    Print the changes per mode and endpoint, returning the regressions
+    '''
+    regressions = []
+
+    for mode, endpoints in new['modes'].items():
+        old_endpoints = old['modes'].get(mode, {})
+        print('\n%s' % (mode))
+        print('%-22s' % ('endpoint') + ''.join('%24s' % (name) for name, _ in METRICS))
+
+        for name, result in endpoints.items():
+            if name not in old_endpoints:
+                print('%-22s %s' % (name, 'new'))
+                continue
+
+            line = '%-22s' % (name)
+            for metric, larger_better in METRICS:
+                old_value = old_endpoints[name][metric]
+                relative = change(old_value, result[metric])
+                line += '%12.2f %+10.1f%%' % (result[metric],
+                    relative * 100 if relative is not None else 0)
+
+                worse = relative is not None and \
+                    (-relative if larger_better else relative) > threshold
+                if worse:
+                    regressions.append('%s %s %s' % (mode, name, metric))
+
+            print(line)
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1,
+        help='relative change counted as a regression')
+    args = parser.parse_args()
+
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+
+    print('%s -> %s' % (old.get('commit'), new.get('commit')))
+    if old.get('dataset') != new.get('dataset'):
+        print('warning: datasets differ %s -> %s' % (old.get('dataset'), new.get('dataset')))
+
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        print('\nRegressions over %.0f%%:' % (args.threshold * 100))
+        for regression in regressions:
+            print('  ' + regression)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+'''
+Synthetic dataset generator: users with non overlapping leaves spread over
+several years (some straddling new year), kept within the yearly
+allotment, with a matching usage ledger.
+
+Run with:
+
+    python3 -m benchmark.data sqlite:////tmp/leave.db [--users 10000] [--leaves 1000000]
+'''
+
+import argparse
+import random
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Dict, Iterator, List, Tuple
+
+from flask import Flask
+
+from backend.models.db import db
+from backend.models.leave import LeaveModel, MAX_YEARLY_LEAVE
+from backend.models.usage import LeaveUsageModel
+from backend.models.user import UserModel
+from backend.models.version import LeaveVersionModel
+from backend.server import create_app
+
+
+FIRST_YEAR = 2020
+YEARS = 5
+INSERT_CHUNK_SIZE = 10000
+
+
+def generate_leaves(user_id: int, count: int,
+    rand: random.Random) -> Iterator[Tuple[date, date]]:
+    '''
+    Generate count (start, end) leaves for a user in order over the years,
+    separated by at least two days so none overlap or are adjacent. Leaves
+    that would go over the yearly allotment are skipped.
+    '''
+    used: Dict[int, int] = {}
+    slot = max(3, YEARS * 365 // max(count, 1)) # days per leave, with the gap
+    # longest leave so about 80% of the allotment is used on average
+    max_days = max(1, min(14, slot - 2,
+        int(1.6 * MAX_YEARLY_LEAVE.days * YEARS / max(count, 1))))
+    start = date(FIRST_YEAR, 1, 1) + timedelta(days=rand.randrange(slot))
+
+    for _ in range(count):
+        days = rand.randint(1, max_days)
+        end = start + timedelta(days=days - 1)
+        days_by_year = LeaveModel.get_leave_days_by_year(start, end)
+
+        if all(used.get(year, 0) + year_days <= MAX_YEARLY_LEAVE.days
+            for year, year_days in days_by_year.items()):
+            for year, year_days in days_by_year.items():
+                used[year] = used.get(year, 0) + year_days
+            yield start, end
+
+        start = end + timedelta(days=rand.randint(2, max(2, 2 * (slot - days) - 2)))
+
+
+def seed(app: Flask, users: int, leaves: int, seed: int = 0) -> Dict[str, int]:
+    '''
+    Fill an empty database with users and their leaves using bulk inserts.
+    Returns the dataset size.
+    '''
+    rand = random.Random(seed)
+    per_user, extra = divmod(leaves, max(users, 1))
+
+    leave_rows: List[dict] = []
+    usage: Dict[Tuple[int, int], int] = {}
+    total = 0
+
+    with app.app_context():
+        db.session.execute(UserModel.__table__.insert(),
+            [{'id': user_id} for user_id in range(1, users + 1)])
+        db.session.execute(LeaveVersionModel.__table__.insert(),
+            [{'user_id': user_id, 'version': 1} for user_id in range(1, users + 1)])
+
+        for user_id in range(1, users + 1):
+            count = per_user + (1 if user_id <= extra else 0)
+            for start, end in generate_leaves(user_id, count, rand):
+                leave_rows.append({'user_id': user_id, 'start_date': start,
+                    'end_date': end, 'version_id': 1})
+                for year, days in LeaveModel.get_leave_days_by_year(start, end).items():
+                    usage[(user_id, year)] = usage.get((user_id, year), 0) + days
+
+            if len(leave_rows) >= INSERT_CHUNK_SIZE:
+                db.session.execute(LeaveModel.__table__.insert(), leave_rows)
+                total += len(leave_rows)
+                leave_rows = []
+
+        if leave_rows:
+            db.session.execute(LeaveModel.__table__.insert(), leave_rows)
+            total += len(leave_rows)
+
+        db.session.execute(LeaveUsageModel.__table__.insert(),
+            [{'user_id': user_id, 'year': year, 'days_used': days}
+                for (user_id, year), days in usage.items()])
+        db.session.commit()
+
+    return {'users': users, 'leaves': total}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('uri', help='database uri, ex. sqlite:////tmp/leave.db')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--leaves', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = perf_counter()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.uri})
+    size = seed(app, args.users, args.leaves, args.seed)
+    print('Seeded %d users and %d leaves in %.1f s' % (size['users'], size['leaves'],
+        perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,513 @@
+'''
+Endpoint benchmark suite: seeds a synthetic dataset, then drives every api
+route through the in process test client and through the production wsgi
+server (backend/wsgi.py) at a configurable concurrency. Reports latency
+percentiles, throughput and peak RSS per endpoint and saves the results
+as json (compare runs with benchmark.compare).
+
+Run with:
+
+    python3 -m benchmark.endpoints [--users 10000] [--leaves 1000000] \
+        [--concurrency 8] [--requests 200] [--mode inprocess|server|both]
+'''
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import namedtuple
+from datetime import date, timedelta
+from itertools import count
+from threading import Lock, Thread
+from time import perf_counter, sleep, time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.migrations.compact_leaves import compact
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.server import create_app
+from benchmark.data import FIRST_YEAR, YEARS, seed
+
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), 'results')
+
+# path and body of a request, built from a random generator and the dataset
+Request = Tuple[str, Optional[object]]
+
+# routes are run in order (destructive ones last), with at most max_requests
+# requests each (None for the --requests default)
+Scenario = namedtuple('Scenario', ['name', 'route', 'method', 'build', 'max_requests'])
+
+
+class Dataset:
+    '''
+    Seeded dataset ids shared by the request builders. Ids that requests
+    consume (deleted users and leaves) are handed out once.
+    '''
+    def __init__(self, users: int, leaves: int) -> None:
+        self.users = users
+        self.leaves = leaves
+        self.deleted_users = count(users, -1) # deleted from the last user down
+        self.deleted_leaves = count(leaves, -1)
+        self.lock = Lock()
+
+
+    def user_id(self, rand: random.Random) -> int:
+        '''
+        Random user id that is never deleted
+        '''
+        return rand.randint(1, max(1, self.users // 2))
+
+
+    def leave_id(self, rand: random.Random) -> int:
+        '''
+        Random leave id that is never deleted
+        '''
+        return rand.randint(1, max(1, self.leaves // 2))
+
+
+    def next_deleted(self, ids: count) -> int:
+        '''
+        Hand out the next id to delete
+        '''
+        with self.lock:
+            return next(ids)
+
+
+def date_str(value: date) -> str:
+    '''
+    Format a date like the api
+    '''
+    return LeaveModel.date_to_str(value)
+
+
+def new_leave(rand: random.Random, data: Dataset, year: int) -> dict:
+    '''
+    One day leave in a year without seeded leaves
+    '''
+    start = date(year, 1, 1) + timedelta(days=rand.randrange(365))
+    return {'user_id': data.user_id(rand), 'start_date': date_str(start),
+        'end_date': date_str(start)}
+
+
+def update_leave(rand: random.Random, data: Dataset) -> Request:
+    '''
+    Shorten a leave to its first day (always within the allotment)
+    '''
+    start = date(FIRST_YEAR, 1, 1) + timedelta(days=rand.randrange(YEARS * 365))
+    return '/leave/%d' % (data.leave_id(rand)), {'start_date': date_str(start),
+        'end_date': date_str(start)}
+
+
+def batch_leaves(rand: random.Random, data: Dataset) -> Request:
+    '''
+    Ten one day leaves for a user in a year without seeded leaves
+    '''
+    user_id = data.user_id(rand)
+    leaves = [new_leave(rand, data, FIRST_YEAR + YEARS + 2) for _ in range(10)]
+    for leave in leaves:
+        leave['user_id'] = user_id
+    return '/leave/batch?atomic=false', leaves
+
+
+def calendar_window(rand: random.Random, days: int) -> Tuple[str, str]:
+    '''
+    Random window of days within the seeded years
+    '''
+    start = date(FIRST_YEAR, 1, 1) + timedelta(days=rand.randrange(YEARS * 365 - days))
+    return date_str(start), date_str(start + timedelta(days=days - 1))
+
+
+SCENARIOS = [
+    Scenario('user_get', '/user/<int:id>', 'GET',
+        lambda rand, data: ('/user/%d' % (data.user_id(rand)), None), None),
+    Scenario('user_put', '/user/<int:id>', 'PUT',
+        lambda rand, data: ('/user/0', None), None),
+    Scenario('user_list', '/user/list', 'GET',
+        lambda rand, data: ('/user/list', None), 20),
+    Scenario('user_list_page', '/user/list', 'GET',
+        lambda rand, data: ('/user/list?limit=100&after_id=%d'
+            % (rand.randrange(data.users)), None), None),
+    Scenario('leave_get', '/leave/<int:id>', 'GET',
+        lambda rand, data: ('/leave/%d' % (data.leave_id(rand)), None), None),
+    Scenario('leave_put', '/leave/<int:id>', 'PUT', update_leave, None),
+    Scenario('leave_create', '/leave/create', 'POST',
+        lambda rand, data: ('/leave/create', new_leave(rand, data, FIRST_YEAR + YEARS + 1)),
+        None),
+    Scenario('leave_batch', '/leave/batch', 'POST', batch_leaves, None),
+    Scenario('leave_remaining', '/leave/remaining/<int:user_id>/<int:year>', 'GET',
+        lambda rand, data: ('/leave/remaining/%d/%d' % (data.user_id(rand),
+            FIRST_YEAR + rand.randrange(YEARS)), None), None),
+    Scenario('leave_remaining_range', '/leave/remaining/<int:user_id>', 'GET',
+        lambda rand, data: ('/leave/remaining/%d?from_year=%d&to_year=%d' % (
+            data.user_id(rand), FIRST_YEAR, FIRST_YEAR + YEARS - 1), None), None),
+    Scenario('leave_remaining_bulk', '/leave/remaining/bulk/<int:year>', 'GET',
+        lambda rand, data: ('/leave/remaining/bulk/%d?format=csv'
+            % (FIRST_YEAR + rand.randrange(YEARS)), None), 20),
+    Scenario('leave_scheduled', '/leave/scheduled/<int:user_id>/<string:date_from_str>',
+        'GET', lambda rand, data: ('/leave/scheduled/%d/%s' % (data.user_id(rand),
+            date_str(date(FIRST_YEAR + rand.randrange(YEARS), 1, 1))), None), None),
+    Scenario('leave_list_page', '/leave/list', 'GET',
+        lambda rand, data: ('/leave/list?limit=100&after_id=%d'
+            % (rand.randrange(data.leaves)), None), None),
+    Scenario('leave_list_stream', '/leave/list', 'GET',
+        lambda rand, data: ('/leave/list?format=ndjson', None), 1),
+    Scenario('leave_calendar_week', '/leave/calendar', 'GET',
+        lambda rand, data: ('/leave/calendar?from=%s&to=%s' % calendar_window(rand, 7), None),
+        None),
+    Scenario('leave_calendar_year', '/leave/calendar', 'GET',
+        lambda rand, data: ('/leave/calendar?from=%s&to=%s&by=day' % calendar_window(rand, 365),
+            None), 5),
+    Scenario('leave_analytics_quarter', '/leave/analytics/<int:year>', 'GET',
+        lambda rand, data: ('/leave/analytics/%d?quarter=%d' % (
+            rand.randrange(FIRST_YEAR, FIRST_YEAR + YEARS), rand.randint(1, 4)), None),
+        5),
+    Scenario('leave_max_end', '/leave/max-end/<int:user_id>/<string:start_date_str>', 'GET',
+        lambda rand, data: ('/leave/max-end/%d/%s' % (data.user_id(rand), calendar_window(rand,
+            1)[0]), None), None),
+    Scenario('leave_availability', '/leave/availability/<int:user_id>', 'GET',
+        lambda rand, data: ('/leave/availability/%d?days=%d&after=%s' % (data.user_id(rand),
+            rand.randint(1, 20), calendar_window(rand, 1)[0]), None), None),
+    Scenario('cache_stats', '/cache/stats', 'GET',
+        lambda rand, data: ('/cache/stats', None), None),
+    Scenario('metrics', '/metrics', 'GET',
+        lambda rand, data: ('/metrics', None), None),
+    Scenario('slow_queries', '/debug/slow-queries', 'GET',
+        lambda rand, data: ('/debug/slow-queries?limit=20', None), None),
+    Scenario('leave_delete', '/leave/<int:id>', 'DELETE',
+        lambda rand, data: ('/leave/%d' % (data.next_deleted(data.deleted_leaves)), None),
+        None),
+    Scenario('user_delete', '/user/<int:id>', 'DELETE',
+        lambda rand, data: ('/user/%d' % (data.next_deleted(data.deleted_users)), None),
+        None),
+    Scenario('leave_list_delete', '/leave/list', 'DELETE',
+        lambda rand, data: ('/leave/list', None), 1),
+    Scenario('user_list_delete', '/user/list', 'DELETE',
+        lambda rand, data: ('/user/list', None), 1),
+]
+
+
+'''
+Memory
+'''
+def reset_peak_rss(pids: List[int]) -> None:
+    '''
+    Reset the peak resident set size of processes to their current size
+    (linux only, ignored elsewhere)
+    '''
+    for pid in pids:
+        try:
+            with open('/proc/%d/clear_refs' % (pid), 'w') as file:
+                file.write('5')
+        except OSError:
+            pass
+
+
+def get_peak_rss(pids: List[int]) -> List[int]:
+    '''
+    Get the peak resident set sizes in KiB of processes (linux only, empty
+    elsewhere)
+    '''
+    peaks = []
+    for pid in pids:
+        try:
+            with open('/proc/%d/status' % (pid)) as file:
+                for line in file:
+                    if line.startswith('VmHWM:'):
+                        peaks.append(int(line.split()[1]))
+        except OSError:
+            pass
+
+    return peaks
+
+
+def get_children(pid: int) -> List[int]:
+    '''
+    Get the child process ids of a process (linux only)
+    '''
+    children = []
+    for name in os.listdir('/proc') if os.path.isdir('/proc') else ():
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % (name)) as file:
+                if int(file.read().rsplit(')', 1)[1].split()[1]) == pid:
+                    children.append(int(name))
+        except (OSError, IndexError, ValueError):
+            pass
+
+    return children
+
+
+'''
+Clients
+'''
+def in_process_client(app) -> Callable[[str, str, Optional[object]], int]:
+    '''
+    Request function on the flask test client, returns the status code
+    '''
+    client = app.test_client()
+
+    def send(method: str, path: str, body: Optional[object]) -> int:
+        response = client.open(path, method=method, json=body)
+        response.get_data() # read streamed bodies
+        return response.status_code
+
+    return send
+
+
+def http_client(host: str, port: int) -> Callable[[str, str, Optional[object]], int]:
+    '''
+    Request function over http, returns the status code
+    '''
+    def send(method: str, path: str, body: Optional[object]) -> int:
+        connection = http.client.HTTPConnection(host, port, timeout=300)
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            connection.request(method, path,
+                json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    return send
+
+
+'''
+Runner
+'''
+def percentile(values: List[float], fraction: float) -> float:
+    '''
+    Nearest rank percentile of sorted values
+    '''
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(scenario: Scenario, make_send: Callable, data: Dataset,
+    concurrency: int, requests: int, pids: List[int]) -> Dict[str, object]:
+    '''
+    Send the scenario's requests from concurrency threads and summarize them
+    '''
+    total = min(requests, scenario.max_requests or requests)
+    threads = min(concurrency, total)
+    latencies: List[float] = []
+    errors = [0]
+    lock = Lock()
+
+    def worker(n: int) -> None:
+        rand = random.Random('%s-%d' % (scenario.name, n))
+        send = make_send()
+        local = []
+        local_errors = 0
+
+        for _ in range(total // threads + (1 if n < total % threads else 0)):
+            path, body = scenario.build(rand, data)
+            started = perf_counter()
+            status = send(scenario.method, path, body)
+            local.append((perf_counter() - started) * 1000)
+            if status >= 500 or status == 404:
+                local_errors += 1
+
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    reset_peak_rss(pids)
+    started = perf_counter()
+    workers = [Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = perf_counter() - started
+
+    peaks = get_peak_rss(pids)
+    latencies.sort()
+    return {
+        'route': scenario.route,
+        'method': scenario.method,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'throughput_rps': len(latencies) / elapsed,
+        'peak_rss_kb': max(peaks) if peaks else None, # of the busiest process
+        'peak_rss_total_kb': sum(peaks) if peaks else None
+    }
+
+
+def run_suite(make_send: Callable, data: Dataset, concurrency: int,
+    requests: int, pids: Callable[[], List[int]]) -> Dict[str, Dict[str, object]]:
+    '''
+    Run every scenario in order, printing a line per endpoint
+    '''
+    results = {}
+    print('%-22s %-7s %8s %8s %8s %9s %7s %10s %10s' % ('endpoint', 'method', 'p50 ms',
+        'p95 ms', 'p99 ms', 'req/s', 'errors', 'rss KiB', 'total KiB'))
+
+    for scenario in SCENARIOS:
+        result = run_scenario(scenario, make_send, data, concurrency, requests, pids())
+        results[scenario.name] = result
+        print('%-22s %-7s %8.2f %8.2f %8.2f %9.1f %7d %10s %10s' % (scenario.name,
+            scenario.method, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['throughput_rps'], result['errors'], result['peak_rss_kb'],
+            result['peak_rss_total_kb']))
+
+    return results
+
+
+def check_routes(app) -> None:
+    '''
+    Warn about api routes without a scenario
+    '''
+    covered = {(scenario.route, scenario.method) for scenario in SCENARIOS}
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if (rule.rule, method) not in covered:
+                print('warning: no scenario for %s %s' % (method, rule.rule))
+
+
+def run_in_process(path: str, data: Dataset, args) -> Dict[str, Dict[str, object]]:
+    '''
+    Run the suite on the flask test client
+    '''
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path})
+    check_routes(app)
+
+    print('\nIn process, %d thread(s)' % (args.concurrency))
+    results = run_suite(lambda: in_process_client(app), data, args.concurrency,
+        args.requests, lambda: [os.getpid()])
+
+    with app.app_context():
+        db.engine.dispose()
+
+    return results
+
+
+def run_server(path: str, data: Dataset, args) -> Optional[Dict[str, Dict[str, object]]]:
+    '''
+    Run the suite over http against the production wsgi server
+    '''
+    env = dict(os.environ, DATABASE_URI='sqlite:///' + path,
+        WEB_CONCURRENCY=str(args.workers), BIND='127.0.0.1:%d' % (args.port))
+    process = subprocess.Popen([sys.executable, '-m', 'backend.wsgi'], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        send = http_client('127.0.0.1', args.port)
+        while True:
+            try:
+                send('GET', '/cache/stats', None)
+                break
+            except OSError:
+                if process.poll() is not None:
+                    print('\nServer exited, skipping (is gunicorn installed?)')
+                    return None
+                sleep(0.05)
+
+        print('\nWsgi server, %d worker(s), %d connection(s)' % (args.workers,
+            args.concurrency))
+        # the workers only, the preloading arbiter's peak is the app's
+        # startup and would hide theirs
+        return run_suite(lambda: send, data, args.concurrency, args.requests,
+            lambda: get_children(process.pid))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_compact(path: str) -> Dict[str, object]:
+    '''
+    Time the one-off leave compaction (backend.migrations.compact_leaves)
+    '''
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        'LEAVE_INDEX_ENABLED': False, 'LEAVE_CACHE_ENABLED': False})
+    started = perf_counter()
+    updated, deleted = compact(app)
+    seconds = perf_counter() - started
+
+    with app.app_context():
+        db.engine.dispose()
+
+    print('\nCompacted leaves in %.2f s (%d updated, %d deleted)' % (seconds, updated, deleted))
+    return {'seconds': seconds, 'updated': updated, 'deleted': deleted}
+
+
+def get_commit() -> Optional[str]:
+    '''
+    Get the current git commit of the repository
+    '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--leaves', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200,
+        help='requests per endpoint (some endpoints send fewer)')
+    parser.add_argument('--mode', choices=('inprocess', 'server', 'both'), default='both')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--output', help='results json path '
+        '(default benchmark/results/<commit>.json)')
+    args = parser.parse_args()
+
+    commit = get_commit()
+    results = {
+        'commit': commit,
+        'timestamp': time(),
+        'config': vars(args),
+        'modes': {}
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        base = os.path.join(directory, 'base.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + base})
+        started = perf_counter()
+        size = seed(app, args.users, args.leaves, args.seed)
+        with app.app_context():
+            db.engine.dispose() # checkpoints the wal into the database file
+        print('Seeded %d users and %d leaves in %.1f s' % (size['users'], size['leaves'],
+            perf_counter() - started))
+        results['dataset'] = size
+
+        for mode, run in (('inprocess', run_in_process), ('server', run_server)):
+            if args.mode not in (mode, 'both'):
+                continue
+
+            path = os.path.join(directory, mode + '.db') # fresh copy per mode
+            shutil.copyfile(base, path)
+            mode_results = run(path, Dataset(size['users'], size['leaves']), args)
+            if mode_results is not None:
+                results['modes'][mode] = mode_results
+
+        path = os.path.join(directory, 'compact.db')
+        shutil.copyfile(base, path)
+        results['compact'] = run_compact(path)
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, '%s.json' % (commit or 'results'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print('\nSaved results to %s' % (output))
+
+
+if __name__ == '__main__':
+    main()
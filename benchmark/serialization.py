@@ -0,0 +1,110 @@
+'''
+Compares the marshmallow schema dump with the fast row serializer on large
+leave lists, from loading the rows to the encoded response body.
+
+Run with:
+
+    python3 -m benchmark.serialization [--leaves 100000] [--repeat 3]
+'''
+
+import argparse
+import json
+from time import perf_counter
+from typing import Callable, Dict
+
+from backend.models.leave import LeaveModel
+from backend.schemas.leave import LeaveSchema, leave_rows
+from backend.server import create_app
+from benchmark.data import seed
+
+try:
+    import orjson
+except ImportError: # optional, only used as a reference point
+    orjson = None
+
+
+def schema_dump() -> str:
+    '''
+    Current path: load model objects, schema dump, stdlib json
+    '''
+    return json.dumps(LeaveSchema(many=True).dump(LeaveModel.get_all())) + '\n'
+
+
+def rows_dump() -> str:
+    '''
+    Core select rows dumped to dicts, stdlib json (debug mode fallback)
+    '''
+    return json.dumps(leave_rows.dump_list(LeaveModel.get_rows())) + '\n'
+
+
+def rows_format() -> str:
+    '''
+    Core select rows formatted straight to json text (the api path)
+    '''
+    return leave_rows.format_list(LeaveModel.get_rows()) + '\n'
+
+
+def rows_orjson() -> bytes:
+    '''
+    Core select rows encoded by orjson (compact output, not byte identical)
+    '''
+    return orjson.dumps(leave_rows.dump_list(LeaveModel.get_rows()))
+
+
+def rows_fetch() -> list:
+    '''
+    Core select rows only, the floor of the row serializers
+    '''
+    return LeaveModel.get_rows()
+
+
+def measure(function: Callable, repeat: int) -> float:
+    '''
+    Best wall time of repeat runs, in seconds
+    '''
+    times = []
+    for _ in range(repeat):
+        started = perf_counter()
+        function()
+        times.append(perf_counter() - started)
+
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--leaves', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'LEAVE_INDEX_ENABLED': False, 'LEAVE_CACHE_ENABLED': False})
+    size = seed(app, args.users, args.leaves)
+
+    candidates: Dict[str, Callable] = {
+        'schema dump': schema_dump,
+        'rows dump': rows_dump,
+        'rows format': rows_format
+    }
+    if orjson is not None:
+        candidates['rows orjson'] = rows_orjson
+    candidates['rows fetch'] = rows_fetch
+
+    with app.app_context():
+        reference = schema_dump()
+        if rows_format() != reference or rows_dump() != reference:
+            raise SystemExit('Serializer output differs from the schema dump')
+
+        print('%d leaves' % (size['leaves']))
+        print('%-12s %10s %10s %8s' % ('serializer', 'seconds', 'rows/s', 'speedup'))
+        baseline = None
+        for name, function in candidates.items():
+            seconds = measure(function, args.repeat)
+            baseline = baseline or seconds
+            print('%-12s %10.3f %10.0f %7.1fx' % (name, seconds, size['leaves'] / seconds,
+                baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''
+Measures the cold start latency of the production entry point, from
+spawning the process to the first successful response, and the latency of
+the first request against a warm one.
+
+Run with:
+
+    python3 -m benchmark.startup [--workers 4] [--runs 5]
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep
+from urllib.error import URLError
+from urllib.request import urlopen
+
+
+def get(url: str) -> float:
+    '''
+    Get a url, returning the latency in ms
+    '''
+    started = perf_counter()
+    with urlopen(url, timeout=5) as response:
+        response.read()
+    return (perf_counter() - started) * 1000
+
+
+def cold_start(workers: int, port: int, uri: str) -> tuple:
+    '''
+    Start the server and time (ready ms, first request ms, warm request ms)
+    '''
+    env = dict(os.environ, DATABASE_URI=uri, WEB_CONCURRENCY=str(workers),
+        BIND='127.0.0.1:%d' % (port))
+    url = 'http://127.0.0.1:%d/leave/remaining/1/2021' % (port)
+
+    started = perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'backend.wsgi'], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                first = get(url)
+                break
+            except (URLError, ConnectionError):
+                if process.poll() is not None:
+                    raise SystemExit('Server exited, is gunicorn installed?')
+                sleep(0.005)
+
+        ready = (perf_counter() - started) * 1000
+        warm = statistics.median(get(url) for _ in range(20))
+        return ready, first, warm
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for run in range(args.runs):
+            uri = 'sqlite:///' + os.path.join(directory, 'leave%d.db' % (run))
+            results.append(cold_start(args.workers, args.port, uri))
+
+    print('%d worker(s), median of %d runs' % (args.workers, args.runs))
+    for name, values in zip(('ready', 'first request', 'warm request'), zip(*results)):
+        print('%-14s %8.1f ms' % (name, statistics.median(values)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+'''
+Compares read and write throughput of the in memory and file backed (WAL)
+sqlite storage modes under concurrent load.
+
+Run with:
+
+    python3 -m benchmark.storage [--threads 8] [--seconds 3]
+'''
+
+import argparse
+import os
+import tempfile
+from datetime import date, timedelta
+from threading import Barrier, Thread
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from flask import Flask
+
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.models.transaction import begin_write
+from backend.models.user import UserModel
+from backend.server import create_app
+
+
+YEAR = 2021
+
+
+def make_app(uri: str) -> Flask:
+    '''
+    Create an app on the database with the in process index and cache
+    disabled so every operation reaches the database
+    '''
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'LEAVE_INDEX_ENABLED': False,
+        'LEAVE_CACHE_ENABLED': False
+    })
+
+
+def setup_users(app: Flask, count: int) -> List[int]:
+    '''
+    Add users with a few leaves each to read
+    '''
+    with app.app_context():
+        user_ids = []
+        for _ in range(count):
+            user = UserModel()
+            user.add()
+            user_ids.append(user.id)
+        db.session.commit()
+
+        start = date(YEAR, 1, 4)
+        LeaveModel.add_all([LeaveModel(user_id, start + timedelta(weeks=week),
+            start + timedelta(weeks=week, days=1)) for user_id in user_ids
+            for week in range(0, 8, 2)])
+        db.session.commit()
+
+        return user_ids
+
+
+def read(user_id: int, i: int) -> None:
+    '''
+    Read a user's scheduled leaves and recompute their used days
+    '''
+    LeaveModel.get_leave_from(user_id, date(YEAR, 1, 1))
+    LeaveModel.get_leave_used(user_id, YEAR)
+
+
+def write(user_id: int, i: int) -> None:
+    '''
+    Schedule and delete a one day leave for a user (two requests)
+    '''
+    start = date(YEAR, 6, 1) + timedelta(days=i % 180)
+    leave = LeaveModel(user_id, start, start)
+    begin_write()
+    leave.add()
+    db.session.commit()
+    begin_write()
+    leave.delete()
+    db.session.commit()
+
+
+def run(app: Flask, user_ids: List[int], threads: int, seconds: float,
+    operation: Callable[[int, int], None], writers: int) -> Dict[str, float]:
+    '''
+    Run the operation (reads for threads beyond the writer count) from
+    several threads for a duration, each thread on its own user
+    '''
+    counts = [0] * threads
+    errors = [0] * threads
+    barrier = Barrier(threads + 1)
+
+    def worker(n: int) -> None:
+        user_id = user_ids[n % len(user_ids)]
+        op = operation if n < writers else read
+        with app.app_context():
+            barrier.wait()
+            end = perf_counter() + seconds
+            i = 0
+            while perf_counter() < end:
+                try:
+                    op(user_id, i)
+                    counts[n] += 1
+                except Exception: # ex. locked, or interleaved on a shared connection
+                    db.session.rollback()
+                    errors[n] += 1
+                i += 1
+            db.session.remove()
+
+    workers = [Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    for thread in workers:
+        thread.join()
+
+    return {
+        'ops/s': sum(counts) / seconds,
+        'write ops/s': sum(counts[:writers]) / seconds,
+        'read ops/s': sum(counts[writers:]) / seconds,
+        'errors': sum(errors)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--users', type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        modes = {
+            'memory': 'sqlite:///:memory:',
+            'wal': 'sqlite:///' + os.path.join(directory, 'leave.db')
+        }
+        workloads = {
+            'read': (read, 0),
+            'write': (write, args.threads),
+            'mixed': (write, max(1, args.threads // 4))
+        }
+
+        print('%-8s %-6s %10s %12s %12s %7s' % ('mode', 'load', 'ops/s',
+            'write ops/s', 'read ops/s', 'errors'))
+        for mode, uri in modes.items():
+            app = make_app(uri)
+            user_ids = setup_users(app, args.users)
+
+            for load, (operation, writers) in workloads.items():
+                result = run(app, user_ids, args.threads, args.seconds, operation, writers)
+                print('%-8s %-6s %10.0f %12.0f %12.0f %7d' % (mode, load, result['ops/s'],
+                    result['write ops/s'], result['read ops/s'], result['errors']))
+
+            with app.app_context():
+                db.get_engine(app).dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -14,5 +14,6 @@ setup(
     zip_safe = False,
     install_requires=['flask', 'flask_restful', 'flask_sqlalchemy', \
         'flask_marshmallow', 'flask_cors', 'sqlalchemy', 'marshmallow'],
+    extras_require={'production': ['gunicorn'], 'analytics': ['numpy']},
     python_requires='>=3.7'
 )
\ No newline at end of file
@@ -0,0 +1,135 @@
+'''
+Tests for the leave analytics (run in process, no server needed).
+'''
+
+import random
+import unittest
+from collections import Counter
+from datetime import date, timedelta
+
+from backend.server import create_app
+from backend.models import analytics
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.models.user import UserModel
+
+
+def random_leaves(rand: random.Random, count: int) -> list:
+    '''
+    (user id, start date, end date) leaves around 2021, some overlapping
+    '''
+    leaves = []
+    for _ in range(count):
+        start = date(2020, 12, 1) + timedelta(days=rand.randrange(420))
+        leaves.append((rand.randint(1, 8), start, start + timedelta(days=rand.randrange(20))))
+    return leaves
+
+
+class AnalyticsTests(unittest.TestCase):
+    '''
+    Columnar computations against per leave references
+    '''
+    def test_random(self):
+        '''
+        numpy and python versions match per day checks and
+        get_leave_days_in_year
+        '''
+        rand = random.Random(0)
+        year_start = date(2021, 1, 1)
+        for count in (0, 1, 30, 300):
+            leaves = random_leaves(rand, count)
+            rows = [(user_id, (start - year_start).days, (end - year_start).days)
+                for user_id, start, end in leaves]
+
+            expected_headcount = [len({user_id for user_id, start, end in leaves
+                if start <= year_start + timedelta(days=day) <= end}) for day in range(365)]
+            used = Counter()
+            for user_id, start, end in leaves:
+                used[user_id] += LeaveModel.get_leave_days_in_year(start, end, 2021)
+            user_ids = sorted(user_id for user_id in used if used[user_id])
+            expected_used = (user_ids, [used[user_id] for user_id in user_ids])
+
+            columns = analytics.to_columns(rows)
+            python_columns = analytics.LeaveColumns(*(list(column) for column in columns))
+            self.assertEqual(analytics.headcount(columns, 365), expected_headcount)
+            self.assertEqual(analytics.headcount_python(python_columns, 365),
+                expected_headcount)
+
+            # leaves outside the window are left out by the query
+            inside = [index for index, (_, start, end) in enumerate(rows)
+                if end >= 0 and start < 365]
+            columns = analytics.to_columns([rows[index] for index in inside])
+            python_columns = analytics.LeaveColumns(*(list(column) for column in columns))
+            counts = list(range(366))
+            self.assertEqual(analytics.days_used(columns, counts), expected_used)
+            self.assertEqual(analytics.days_used_python(python_columns, counts), expected_used)
+
+
+class AnalyticsResourceTests(unittest.TestCase):
+    '''
+    /leave/analytics endpoint
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False})
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.session.execute(UserModel.__table__.insert(), [{'id': 1}, {'id': 2}])
+            db.session.execute(LeaveModel.__table__.insert(), [
+                {'user_id': 1, 'start_date': date(2020, 12, 30), 'end_date': date(2021, 1, 2),
+                    'version_id': 1},
+                {'user_id': 1, 'start_date': date(2021, 1, 2), 'end_date': date(2021, 1, 3),
+                    'version_id': 1},
+                {'user_id': 2, 'start_date': date(2021, 3, 31), 'end_date': date(2021, 4, 1),
+                    'version_id': 1}
+            ])
+            db.session.commit()
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def test_analytics(self):
+        '''
+        Year and quarter windows
+        '''
+        response = self.client.get('/leave/analytics/2021')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual((body['from'], body['to']), ('2021-01-01T00:00:00', '2021-12-31T00:00:00'))
+        self.assertEqual(len(body['headcount']), 365)
+        self.assertEqual(body['headcount'][:4], [1, 1, 1, 0])
+        self.assertEqual(body['headcount'][89:92], [1, 1, 0])
+        self.assertEqual((body['user_ids'], body['days_used']), ([1, 2], [2 + 2, 2]))
+
+        body = self.client.get('/leave/analytics/2021?quarter=2').get_json()
+        self.assertEqual((body['from'], body['to']), ('2021-04-01T00:00:00', '2021-06-30T00:00:00'))
+        self.assertEqual(len(body['headcount']), 91)
+        self.assertEqual(body['headcount'][:2], [1, 0])
+        self.assertEqual((body['user_ids'], body['days_used']), ([2], [1]))
+
+        body = self.client.get('/leave/analytics/2030').get_json()
+        self.assertEqual((body['user_ids'], body['days_used'], sum(body['headcount'])),
+            ([], [], 0))
+
+        self.assertEqual(self.client.get('/leave/analytics/2021?quarter=5').status_code, 400)
+
+
+    def test_invalid_year(self):
+        '''
+        Years without a full window of dates are rejected
+        '''
+        for url in ('/leave/analytics/0', '/leave/analytics/9999',
+            '/leave/analytics/9999?quarter=4'):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+        self.assertEqual(self.client.get('/leave/analytics/1').status_code, 200)
+        self.assertEqual(self.client.get('/leave/analytics/9998?quarter=4').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
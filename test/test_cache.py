@@ -0,0 +1,161 @@
+'''
+Tests for the response cache store (run in process, no server needed).
+'''
+
+import os
+import tempfile
+import unittest
+from threading import Thread
+from time import sleep
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.models.version import LeaveVersionModel
+from backend.resources.cache import LRUStore
+from backend.resources.leave import LeaveRemainingResource
+
+
+class LRUStoreTests(unittest.TestCase):
+    '''
+    Cache store unit tests
+    '''
+    def set(self, store, key, value, tags=()):
+        '''
+        Cache a value with the current store version
+        '''
+        store.set(key, value, tags, store.get_version())
+
+
+    def test_evict_least_recently_used(self):
+        '''
+        Least recently used entries are evicted beyond the size bound
+        '''
+        store = LRUStore(2, 60)
+        self.set(store, 'a', 1)
+        self.set(store, 'b', 2)
+        store.get('a')
+        self.set(store, 'c', 3)
+
+        self.assertEqual(store.get('a'), 1)
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get_stats()['evictions'], 1)
+        self.assertEqual(store.get_stats()['size'], 2)
+
+
+    def test_expire(self):
+        '''
+        Entries expire after the time to live
+        '''
+        store = LRUStore(2, 0.01)
+        self.set(store, 'a', 1)
+        sleep(0.02)
+
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.get_stats()['expirations'], 1)
+
+
+    def test_invalidate_tags(self):
+        '''
+        Invalidating a tag removes only the entries with that tag
+        '''
+        store = LRUStore(10, 60)
+        self.set(store, 'a', 1, ('user1',))
+        self.set(store, 'b', 2, ('user1', 'user1_2021'))
+        self.set(store, 'c', 3, ('user2',))
+        store.invalidate(['user1_2021'])
+
+        self.assertEqual(store.get('a'), 1)
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('c'), 3)
+
+
+    def test_stale_set(self):
+        '''
+        Values computed before an invalidation of their tags are not cached
+        '''
+        store = LRUStore(10, 60)
+        version = store.get_version()
+        store.invalidate(['user1'])
+        store.set('a', 1, ('user1',), version)
+
+        self.assertIsNone(store.get('a'))
+
+        version = store.get_version()
+        store.invalidate(['user1'])
+        store.set('c', 3, ('user2',), version) # other tags don't matter
+        self.assertEqual(store.get('c'), 3)
+
+        version = store.get_version()
+        store.clear()
+        store.set('b', 2, ('user2',), version)
+
+        self.assertIsNone(store.get('b'))
+
+
+    def test_bounded_generations(self):
+        '''
+        Only the most recently invalidated tags keep their own generation,
+        a set racing an invalidation whose tag was dropped is still skipped
+        '''
+        store = LRUStore(2, 60)
+        version = store.get_version()
+        store.invalidate(['user1'])
+        for user_id in range(2, 100):
+            store.invalidate(['user%d' % (user_id)])
+
+        self.assertEqual(len(store.generations), 2)
+        store.set('a', 1, ('user1',), version)
+        self.assertIsNone(store.get('a'))
+
+        self.set(store, 'b', 2, ('user1',))
+        self.assertEqual(store.get('b'), 2)
+
+
+class ResponseCacheSnapshotTests(unittest.TestCase):
+    '''
+    Cached responses racing writes on a file database, whose transactions
+    read a snapshot
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(
+                self.directory.name, 'leave.db'),
+            'LEAVE_INDEX_ENABLED': False
+        })
+        self.client = self.app.test_client()
+        self.user_id = self.client.put('/user/0').get_json()['id']
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.directory.cleanup()
+
+
+    def test_write_after_snapshot(self):
+        '''
+        Responses computed from a snapshot taken before a concurrent write
+        committed are not cached
+        '''
+        def create():
+            response = self.client.post('/leave/create', json={'user_id': self.user_id,
+                'start_date': '2021-01-04T00:00:00', 'end_date': '2021-01-08T00:00:00'})
+            self.assertEqual(response.status_code, 201)
+
+        path = '/leave/remaining/%d/2021' % (self.user_id)
+        with self.app.test_request_context(path):
+            LeaveVersionModel.get_version(self.user_id) # starts the snapshot
+            writer = Thread(target=create)
+            writer.start()
+            writer.join()
+
+            response = LeaveRemainingResource().get(user_id=self.user_id, year=2021)
+            self.assertEqual(response[0], {'remaining': 84})
+            db.session.commit()
+
+        self.assertEqual(self.client.get(path).get_json(), {'remaining': 84 - 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+'''
+Tests for the who is out calendar (run in process, no server needed).
+'''
+
+import random
+import unittest
+from datetime import date, timedelta
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.models.sweep import absence_days, absence_segments
+from backend.models.user import UserModel
+
+
+def brute_force(leaves, date_from, date_to) -> list:
+    '''
+    (day, user ids) for each day with users out, checking every leave
+    '''
+    days = []
+    day = date_from
+    while day <= date_to:
+        users = sorted({user_id for start_date, end_date, user_id in leaves
+            if start_date <= day <= end_date})
+        if users:
+            days.append((day, users))
+        day += timedelta(days=1)
+    return days
+
+
+class SweepTests(unittest.TestCase):
+    '''
+    Sweep line over leave periods
+    '''
+    def sweep(self, leaves, date_from, date_to) -> list:
+        return list(absence_segments(sorted(leaves), date_from, date_to))
+
+
+    def test_segments(self):
+        '''
+        Runs with the same users merge, overlapping leaves of a user count
+        once and leaves are clipped to the window
+        '''
+        leaves = [
+            (date(2021, 1, 1), date(2021, 1, 10), 1),
+            (date(2021, 1, 4), date(2021, 1, 6), 1),
+            (date(2021, 1, 5), date(2021, 1, 5), 2),
+            (date(2021, 1, 11), date(2021, 1, 12), 1),
+            (date(2021, 1, 20), date(2021, 2, 20), 3)
+        ]
+        self.assertEqual(self.sweep(leaves, date(2021, 1, 3), date(2021, 1, 31)), [
+            (date(2021, 1, 3), date(2021, 1, 4), [1]),
+            (date(2021, 1, 5), date(2021, 1, 5), [1, 2]),
+            (date(2021, 1, 6), date(2021, 1, 12), [1]),
+            (date(2021, 1, 20), date(2021, 1, 31), [3])
+        ])
+        self.assertEqual(self.sweep(leaves, date(2021, 1, 13), date(2021, 1, 19)), [])
+
+
+    def test_random(self):
+        '''
+        Expanded runs match checking every day against every leave
+        '''
+        rand = random.Random(0)
+        for _ in range(50):
+            leaves = []
+            for _ in range(rand.randrange(30)):
+                start = date(2021, 1, 1) + timedelta(days=rand.randrange(60))
+                leaves.append((start, start + timedelta(days=rand.randrange(8)),
+                    rand.randint(1, 5)))
+            date_from = date(2021, 1, 1) + timedelta(days=rand.randrange(40))
+            date_to = date_from + timedelta(days=rand.randrange(40))
+
+            segments = self.sweep(leaves, date_from, date_to)
+            self.assertEqual(list(absence_days(segments)),
+                brute_force(leaves, date_from, date_to))
+            for previous, segment in zip(segments, segments[1:]):
+                self.assertFalse(previous[1] + timedelta(days=1) == segment[0]
+                    and previous[2] == segment[2])
+
+
+class CalendarResourceTests(unittest.TestCase):
+    '''
+    /leave/calendar endpoint
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False})
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.session.execute(UserModel.__table__.insert(), [{'id': 1}, {'id': 2}])
+            db.session.execute(LeaveModel.__table__.insert(), [
+                {'user_id': 1, 'start_date': date(2020, 12, 28), 'end_date': date(2021, 1, 8),
+                    'version_id': 1},
+                {'user_id': 2, 'start_date': date(2021, 1, 7), 'end_date': date(2021, 1, 7),
+                    'version_id': 1}
+            ])
+            db.session.commit()
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def test_calendar(self):
+        '''
+        Segments, days and user filtering
+        '''
+        response = self.client.get('/leave/calendar?from=2021-01-06T00:00:00'
+            '&to=2021-01-10T00:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [
+            {'start_date': '2021-01-06T00:00:00', 'end_date': '2021-01-06T00:00:00',
+                'user_ids': [1]},
+            {'start_date': '2021-01-07T00:00:00', 'end_date': '2021-01-07T00:00:00',
+                'user_ids': [1, 2]},
+            {'start_date': '2021-01-08T00:00:00', 'end_date': '2021-01-08T00:00:00',
+                'user_ids': [1]}
+        ])
+
+        response = self.client.get('/leave/calendar?from=2021-01-01T00:00:00'
+            '&to=2021-01-07T00:00:00&by=day&user_ids=2')
+        self.assertEqual(response.get_json(),
+            [{'date': '2021-01-07T00:00:00', 'user_ids': [2]}])
+
+        response = self.client.get('/leave/calendar?from=2021-02-01T00:00:00'
+            '&to=2021-02-01T00:00:00')
+        self.assertEqual(response.get_json(), [])
+
+
+    def test_invalid(self):
+        '''
+        Bad windows and arguments are rejected
+        '''
+        for query in ('from=2021-01-01T00:00:00',
+            'from=2021-01-02T00:00:00&to=2021-01-01T00:00:00',
+            'from=2021-01-01&to=2021-01-02',
+            'from=2000-01-01T00:00:00&to=2021-01-01T00:00:00',
+            'from=2021-01-01T00:00:00&to=2021-01-02T00:00:00&user_ids=a',
+            'from=2021-01-01T00:00:00&to=2021-01-02T00:00:00&by=week'):
+            self.assertEqual(self.client.get('/leave/calendar?' + query).status_code, 400,
+                query)
+
+
+if __name__ == '__main__':
+    unittest.main()
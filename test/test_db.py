@@ -0,0 +1,85 @@
+'''
+Tests for the database engine configuration (run in process, no server needed).
+'''
+
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+from sqlalchemy import inspect
+from sqlalchemy.pool import QueuePool
+
+from backend.models.db import db, configure_engine, set_sqlite_pragmas
+from backend.server import create_app
+
+
+class DatabaseConfigTests(unittest.TestCase):
+    '''
+    Database engine configuration unit tests
+    '''
+    def make_app(self, uri):
+        '''
+        Create an app on the database with the engine configured
+        '''
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = uri
+        configure_engine(app)
+        db.init_app(app)
+
+        with app.app_context():
+            set_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+
+        return app
+
+
+    def pragma(self, name):
+        '''
+        Get a pragma value on a pooled connection
+        '''
+        return db.session.connection().exec_driver_sql('PRAGMA ' + name).scalar()
+
+
+    def test_file_pragmas(self):
+        '''
+        File backed databases use a connection pool and WAL journaling
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            app = self.make_app('sqlite:///' + os.path.join(directory, 'leave.db'))
+
+            with app.app_context():
+                self.assertIsInstance(db.engine.pool, QueuePool)
+                self.assertEqual(self.pragma('journal_mode'), 'wal')
+                self.assertEqual(self.pragma('synchronous'), 1) # NORMAL
+                self.assertEqual(self.pragma('busy_timeout'), 5000)
+                db.session.remove()
+                db.engine.dispose()
+
+
+    def test_memory_unchanged(self):
+        '''
+        In memory databases keep the default engine options
+        '''
+        app = self.make_app('sqlite:///:memory:')
+
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS'], {})
+        with app.app_context():
+            self.assertEqual(self.pragma('journal_mode'), 'memory')
+            db.session.remove()
+
+
+    def test_create_app(self):
+        '''
+        The app factory applies the config and creates the schema eagerly
+        '''
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False})
+
+        self.assertFalse(app.config['LEAVE_CACHE_ENABLED'])
+        with app.app_context():
+            self.assertTrue({'user_table', 'leave_table', 'leave_usage', 'leave_version'}
+                <= set(inspect(db.engine).get_table_names()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+'''
+Tests for the conditional gets (run in process, no server needed).
+'''
+
+import unittest
+
+from backend.server import create_app
+from backend.models.db import db
+
+
+class ConditionalTests(unittest.TestCase):
+    '''
+    Entity tags of per-user resources
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        self.client = self.app.test_client()
+        self.user_id = self.client.put('/user/0').get_json()['id']
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def test_resource_scoped(self):
+        '''
+        An entity tag only matches the resource (and query) it was sent for
+        '''
+        urls = ['/user/%d' % (self.user_id),
+            '/leave/remaining/%d/2021' % (self.user_id),
+            '/leave/remaining/%d?from_year=2021&to_year=2022' % (self.user_id),
+            '/leave/remaining/%d?from_year=2021&to_year=2023' % (self.user_id),
+            '/leave/scheduled/%d/2021-01-01T00:00:00' % (self.user_id)]
+        etags = [self.client.get(url).headers['ETag'] for url in urls]
+        self.assertEqual(len(set(etags)), len(urls))
+
+        for url, etag in zip(urls, etags):
+            for other in etags:
+                response = self.client.get(url, headers={'If-None-Match': other})
+                self.assertEqual(response.status_code, 304 if other == etag else 200, url)
+
+
+    def test_any(self):
+        '''
+        If-None-Match: * only matches an existing resource
+        '''
+        response = self.client.get('/user/%d' % (self.user_id), headers={'If-None-Match': '*'})
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('ETag', response.headers)
+
+        response = self.client.get('/user/%d' % (self.user_id + 1),
+            headers={'If-None-Match': '*'})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
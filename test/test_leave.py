@@ -2,6 +2,7 @@
 Tests for the leave backend restful api.
 '''
 
+import json
 import unittest
 import requests
 
@@ -12,9 +13,13 @@ HEADERS = {'Content-Type': 'application/json'}
 
 LEAVE_URL = 'http://localhost:5000/leave'
 LEAVE_CREATE_URL = 'http://localhost:5000/leave/create'
+LEAVE_BATCH_URL = 'http://localhost:5000/leave/batch'
 LEAVE_REMAINING_URL = 'http://localhost:5000/leave/remaining'
 LEAVE_SCHEDULED_URL = 'http://localhost:5000/leave/scheduled'
 LEAVE_LIST_URL = 'http://localhost:5000/leave/list'
+USER_URL = 'http://localhost:5000/user'
+USER_LIST_URL = 'http://localhost:5000/user/list'
+CACHE_STATS_URL = 'http://localhost:5000/cache/stats'
 
 USER_ID = '1'
 LEAVE1 = ('2021-01-01T00:00:00', '2021-01-31T00:00:00')
@@ -34,7 +39,7 @@ def clear_leaves():
     return requests.delete(LEAVE_LIST_URL)
 
 
-def add_leave(start_date, end_date):
+def add_leave(start_date, end_date, user_id=USER_ID):
     '''
     Add new leave
     '''
@@ -42,12 +47,26 @@ def add_leave(start_date, end_date):
         json={
             'start_date': start_date,
             'end_date': end_date,
-            'user_id': USER_ID},
+            'user_id': user_id},
         headers=HEADERS)
 
     return response.json()['id']
 
 
+def clear_users():
+    '''
+    Clear all users
+    '''
+    return requests.delete(USER_LIST_URL)
+
+
+def add_user():
+    '''
+    Add new user
+    '''
+    return requests.put(USER_URL + '/0').json()['id']
+
+
 class LeaveTests(unittest.TestCase):
     '''
     Leave unit tests
@@ -312,6 +331,157 @@ class LeaveCreateTests(unittest.TestCase):
         self.assertEqual(response.json(), {'message': 'Not enough leave days'})
 
 
+class LeaveBatchTests(unittest.TestCase):
+    '''
+    Leave batch create unit tests
+    '''
+    def test_leave_batch(self):
+        '''
+        Create a batch of leaves
+        '''
+        clear_leaves()
+
+        response = requests.post(LEAVE_BATCH_URL,
+            json=[
+                {'start_date': LEAVE1[0], 'end_date': LEAVE1[1], 'user_id': USER_ID},
+                {'start_date': LEAVE2[0], 'end_date': LEAVE2[1], 'user_id': USER_ID}],
+            headers=HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.json()['results']],
+            [201, 201])
+        self.assertEqual(response.json()['results'][1]['leave']['start_date'], LEAVE2[0])
+
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '/2021',
+            headers=HEADERS)
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days - 59})
+
+
+    def test_leave_batch_atomic(self):
+        '''
+        Create a batch where leaves together exceed the remaining leave days
+        '''
+        clear_leaves()
+
+        batch = [
+            {'start_date': LEAVE1[0], 'end_date': LEAVE1[1], 'user_id': USER_ID},
+            {'start_date': '2021-03-01T00:00:00', 'end_date': '2021-04-30T00:00:00',
+                'user_id': USER_ID},
+            {'start_date': LEAVE1[1], 'end_date': LEAVE1[0], 'user_id': USER_ID}]
+        response = requests.post(LEAVE_BATCH_URL, json=batch, headers=HEADERS)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'results': [
+            {'status': 400, 'message': 'Batch not committed'},
+            {'status': 400, 'message': 'Not enough leave days'},
+            {'status': 400, 'message': 'Invalid leave range'}]})
+        self.assertEqual(requests.get(LEAVE_LIST_URL).json(), [])
+
+        response = requests.post(LEAVE_BATCH_URL + '?atomic=false', json=batch,
+            headers=HEADERS)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']],
+            [201, 400, 400])
+        self.assertEqual(len(requests.get(LEAVE_LIST_URL).json()), 1)
+
+        # nothing created
+        response = requests.post(LEAVE_BATCH_URL + '?atomic=false', json=batch[1:],
+            headers=HEADERS)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.json()['results']],
+            [400, 400])
+
+
+    def test_leave_batch_no_info(self):
+        '''
+        Create a batch without provided data
+        '''
+        response = requests.post(LEAVE_BATCH_URL, json={}, headers=HEADERS)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message': 'No leave data provided'})
+
+
+class LeaveMergeTests(unittest.TestCase):
+    '''
+    Leave merge unit tests
+    '''
+    def test_leave_create_merge(self):
+        '''
+        Create a leave adjacent to an existing leave with merging
+        '''
+        clear_leaves()
+
+        id = add_leave(*LEAVE1)
+        response = requests.post(LEAVE_CREATE_URL + '?merge=true',
+            json={
+                'start_date': LEAVE2[0],
+                'end_date': LEAVE2[1],
+                'user_id': USER_ID},
+            headers=HEADERS)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'leave': {
+                'id': id,
+                'user_id': int(USER_ID),
+                'start_date': LEAVE1[0],
+                'end_date': LEAVE2[1]},
+            'diff': {'created': [], 'updated': [id], 'deleted': []}})
+
+        response = requests.get(LEAVE_LIST_URL)
+        self.assertEqual(len(response.json()), 1)
+
+
+    def test_leave_create_merge_new(self):
+        '''
+        Create a leave with merging where nothing overlaps
+        '''
+        clear_leaves()
+
+        response = requests.post(LEAVE_CREATE_URL + '?merge=true',
+            json={
+                'start_date': LEAVE1[0],
+                'end_date': LEAVE1[1],
+                'user_id': USER_ID},
+            headers=HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        id = response.json()['leave']['id']
+        self.assertEqual(response.json()['diff'],
+            {'created': [id], 'updated': [], 'deleted': []})
+
+
+    def test_leave_update_merge(self):
+        '''
+        Update a leave to overlap other leaves with merging
+        '''
+        clear_leaves()
+
+        id1 = add_leave(*LEAVE1)
+        id2 = add_leave(*LEAVE2)
+        id3 = add_leave('2021-04-01T00:00:00', '2021-04-10T00:00:00')
+        response = requests.put(LEAVE_URL + '/' + str(id3) + '?merge=true',
+            json={
+                'start_date': '2021-01-15T00:00:00',
+                'end_date': '2021-02-01T00:00:00'},
+            headers=HEADERS)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['leave']['start_date'], LEAVE1[0])
+        self.assertEqual(response.json()['leave']['end_date'], LEAVE2[1])
+        self.assertEqual(response.json()['diff'],
+            {'created': [], 'updated': [id3], 'deleted': [id1, id2]})
+
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '/2021',
+            headers=HEADERS)
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days - 59})
+
+
 class LeaveRemainingTests(unittest.TestCase):
     '''
     Leave remaining unit tests
@@ -347,6 +517,158 @@ class LeaveRemainingTests(unittest.TestCase):
         self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days})
 
 
+    def test_leave_remaining_split(self):
+        '''
+        Get remaining leave for a leave straddling a year boundary
+        '''
+        clear_leaves()
+
+        add_leave('2021-12-25T00:00:00', '2022-01-05T00:00:00')
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '/2021',
+            headers=HEADERS)
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days - 7})
+
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '/2022',
+            headers=HEADERS)
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days - 5})
+
+
+    def test_leave_remaining_after_update(self):
+        '''
+        Get remaining leave after a leave is updated
+        '''
+        clear_leaves()
+
+        id = add_leave(*LEAVE1)
+        requests.put(LEAVE_URL + '/' + str(id),
+            json={
+                'start_date': LEAVE2[0],
+                'end_date': LEAVE2[1],
+                'user_id': USER_ID},
+            headers=HEADERS)
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '/2021',
+            headers=HEADERS)
+
+        # 28 days used in LEAVE2
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days - 28})
+
+
+    def test_leave_remaining_after_delete(self):
+        '''
+        Get remaining leave after leaves are deleted
+        '''
+        clear_leaves()
+
+        id = add_leave(*LEAVE1)
+        add_leave(*LEAVE2)
+        requests.delete(LEAVE_URL + '/' + str(id))
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '/2021',
+            headers=HEADERS)
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days - 28})
+
+        clear_leaves()
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '/2021',
+            headers=HEADERS)
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days})
+
+
+
+    def test_leave_remaining_range(self):
+        '''
+        Get remaining leave for a user over a range of years
+        '''
+        clear_leaves()
+
+        add_leave('2021-12-25T00:00:00', '2022-01-05T00:00:00')
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '?from_year=2020&to_year=2022',
+            headers=HEADERS)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'remaining': {
+            '2020': MAX_YEARLY_LEAVE.days,
+            '2021': MAX_YEARLY_LEAVE.days - 7,
+            '2022': MAX_YEARLY_LEAVE.days - 5}})
+
+
+    def test_leave_remaining_range_invalid(self):
+        '''
+        Get remaining leave for a user with a missing or reversed year range
+        '''
+        clear_leaves()
+
+        response = requests.get(LEAVE_REMAINING_URL + '/' + USER_ID, headers=HEADERS)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message': 'Missing year range'})
+
+        response = requests.get(
+            LEAVE_REMAINING_URL + '/' + USER_ID + '?from_year=2022&to_year=2021',
+            headers=HEADERS)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message': 'Invalid year range'})
+
+        for query in ('?from_year=2021&to_year=abc', '?from_year=abc'):
+            response = requests.get(LEAVE_REMAINING_URL + '/' + USER_ID + query,
+                headers=HEADERS)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'message': 'Invalid year range'})
+
+
+class LeaveRemainingBulkTests(unittest.TestCase):
+    '''
+    Leave remaining bulk unit tests
+    '''
+    def test_leave_remaining_bulk(self):
+        '''
+        Get remaining leave for all users
+        '''
+        clear_leaves()
+        clear_users()
+
+        user1 = add_user()
+        user2 = add_user()
+        add_leave(*LEAVE1, user_id=user1)
+        response = requests.get(LEAVE_REMAINING_URL + '/bulk/2021')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'user_id': user1, 'remaining': MAX_YEARLY_LEAVE.days - 31},
+            {'user_id': user2, 'remaining': MAX_YEARLY_LEAVE.days}])
+
+
+    def test_leave_remaining_bulk_csv(self):
+        '''
+        Get remaining leave for selected users as csv
+        '''
+        clear_leaves()
+        clear_users()
+
+        user1 = add_user()
+        add_user()
+        add_leave(*LEAVE1, user_id=user1)
+        response = requests.get(LEAVE_REMAINING_URL + '/bulk/2021?format=csv&user_ids=%d'
+            % (user1))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, 'user_id,remaining\n%d,%d\n'
+            % (user1, MAX_YEARLY_LEAVE.days - 31))
+
+
+    def test_leave_remaining_bulk_invalid(self):
+        '''
+        Get remaining leave for invalid user ids
+        '''
+        response = requests.get(LEAVE_REMAINING_URL + '/bulk/2021?user_ids=a,b')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message': 'Invalid user ids'})
+
+
 class LeaveScheduledTests(unittest.TestCase):
     '''
     Leave scheduled unit tests
@@ -397,6 +719,94 @@ class LeaveScheduledTests(unittest.TestCase):
         self.assertEqual(len(response.json()), 2)
 
 
+class LeaveCacheTests(unittest.TestCase):
+    '''
+    Leave response cache unit tests
+    '''
+    def test_leave_remaining_cached(self):
+        '''
+        Repeated remaining leave requests are served from the cache until
+        the user's leave changes
+        '''
+        clear_leaves()
+
+        url = LEAVE_REMAINING_URL + '/' + USER_ID + '/2021'
+        requests.get(url)
+        hits = requests.get(CACHE_STATS_URL).json()['hits']
+
+        response = requests.get(url)
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days})
+        self.assertEqual(requests.get(CACHE_STATS_URL).json()['hits'], hits + 1)
+
+        add_leave(*LEAVE1)
+        response = requests.get(url)
+        self.assertEqual(response.json(), {'remaining': MAX_YEARLY_LEAVE.days - 31})
+
+
+    def test_leave_scheduled_cached(self):
+        '''
+        Scheduled leave responses are invalidated by leave changes
+        '''
+        clear_leaves()
+
+        url = LEAVE_SCHEDULED_URL + '/' + USER_ID + '/' + LEAVE1[0]
+        self.assertEqual(requests.get(url).json(), [])
+
+        id = add_leave(*LEAVE1)
+        self.assertEqual([leave['id'] for leave in requests.get(url).json()], [id])
+
+        requests.delete(LEAVE_URL + '/' + str(id))
+        self.assertEqual(requests.get(url).json(), [])
+
+
+class LeaveConditionalTests(unittest.TestCase):
+    '''
+    Leave conditional get unit tests
+    '''
+    def test_leave_remaining_not_modified(self):
+        '''
+        Remaining leave is not resent until the user's leave changes
+        '''
+        clear_leaves()
+
+        url = LEAVE_REMAINING_URL + '/' + USER_ID + '/2021'
+        etag = requests.get(url).headers['ETag']
+        response = requests.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        add_leave(*LEAVE1)
+        response = requests.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+    def test_leave_get_not_modified(self):
+        '''
+        A leave is not resent until it (or its user's leave) changes
+        '''
+        clear_leaves()
+
+        id = add_leave(*LEAVE1)
+        url = LEAVE_URL + '/' + str(id)
+        etag = requests.get(url).headers['ETag']
+        response = requests.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        requests.put(url,
+            json={
+                'start_date': LEAVE2[0],
+                'end_date': LEAVE2[1]},
+            headers=HEADERS)
+        response = requests.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['start_date'], LEAVE2[0])
+
+        requests.delete(url)
+        response = requests.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 404)
+
+
 class LeaveListTests(unittest.TestCase):
     '''
     Leave list unit tests
@@ -428,6 +838,40 @@ class LeaveListTests(unittest.TestCase):
         self.assertEqual(len(response.json()), 2)
 
 
+    def test_leave_list_get_page(self):
+        '''
+        Get leaves a page at a time
+        '''
+        clear_leaves()
+
+        id1 = add_leave(*LEAVE1)
+        id2 = add_leave(*LEAVE2)
+
+        response = requests.get(LEAVE_LIST_URL + '?limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([leave['id'] for leave in response.json()['items']], [id1])
+        self.assertEqual(response.json()['next'], id1)
+
+        response = requests.get(LEAVE_LIST_URL + '?limit=1&after_id=' + str(id1))
+        self.assertEqual([leave['id'] for leave in response.json()['items']], [id2])
+        self.assertEqual(response.json()['next'], None)
+
+
+    def test_leave_list_get_stream(self):
+        '''
+        Get all leaves streamed as newline delimited json
+        '''
+        clear_leaves()
+
+        add_leave(*LEAVE1)
+        add_leave(*LEAVE2)
+
+        response = requests.get(LEAVE_LIST_URL + '?format=ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([json.loads(line) for line in response.text.splitlines()],
+            requests.get(LEAVE_LIST_URL).json())
+
+
     def test_leave_list_delete(self):
         '''
         Delete all leaves
@@ -0,0 +1,216 @@
+'''
+Tests for the in process leave interval index (run in process, no server needed).
+'''
+
+import os
+import random
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+from threading import Thread
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.models.index import LeaveEntry, UserLeaveIntervals, leave_index
+from backend.models.leave import LeaveModel
+from backend.models.version import LeaveVersionModel
+
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+USER_ID = 1
+
+
+class UserLeaveIntervalsTests(unittest.TestCase):
+    '''
+    Interval array unit tests
+    '''
+    def test_overlapping(self):
+        '''
+        Overlap lookups match a linear scan
+        '''
+        rand = random.Random(42)
+        entries = []
+        for id in range(200):
+            start = datetime(2021, 1, 1) + timedelta(days=rand.randrange(365))
+            end = start + timedelta(days=rand.randrange(60))
+            entries.append(LeaveEntry(start, id, USER_ID, end))
+        intervals = UserLeaveIntervals(entries)
+
+        for _ in range(50):
+            date_from = datetime(2021, 1, 1) + timedelta(days=rand.randrange(400))
+            date_to = date_from + timedelta(days=rand.randrange(30))
+
+            self.assertEqual(intervals.overlapping(date_from),
+                sorted(e for e in entries if e.end_date >= date_from))
+            self.assertEqual(intervals.overlapping(date_from, date_to),
+                sorted(e for e in entries
+                    if e.end_date >= date_from and e.start_date <= date_to))
+
+
+    def test_insert_remove(self):
+        '''
+        Inserting and removing leaves returns updated copies
+        '''
+        leave1 = LeaveEntry(datetime(2021, 2, 1), 1, USER_ID, datetime(2021, 2, 5))
+        leave2 = LeaveEntry(datetime(2021, 1, 1), 2, USER_ID, datetime(2021, 3, 1))
+        intervals = UserLeaveIntervals([leave1])
+
+        inserted = intervals.insert(leave2)
+        self.assertEqual(inserted.overlapping(datetime(2021, 2, 10)), [leave2])
+        self.assertEqual(intervals.overlapping(datetime(2021, 2, 10)), [])
+        self.assertEqual(inserted.remove(2).entries, [leave1])
+
+
+class LeaveIndexTests(unittest.TestCase):
+    '''
+    Leave model interval index unit tests
+    '''
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        leave_index.clear()
+        self.context.pop()
+
+
+    def get_leave_from(self, date_from):
+        '''
+        Get scheduled leave ids from the index and the database
+        '''
+        app.config['LEAVE_INDEX_ENABLED'] = False
+        expected = [leave.id for leave in LeaveModel.get_leave_from(USER_ID, date_from)]
+        app.config['LEAVE_INDEX_ENABLED'] = True
+        indexed = [leave.id for leave in LeaveModel.get_leave_from(USER_ID, date_from)]
+        return indexed, expected
+
+
+    def test_leave_from_hooks(self):
+        '''
+        Index stays consistent with the database through add/update/delete
+        '''
+        leave1 = LeaveModel(USER_ID, datetime(2021, 1, 1), datetime(2021, 1, 31))
+        leave1.add()
+        db.session.commit()
+        self.assertEqual(*self.get_leave_from(datetime(2021, 1, 15))) # warms index
+
+        leave2 = LeaveModel(USER_ID, datetime(2021, 2, 1), datetime(2021, 2, 28))
+        leave2.add()
+        db.session.commit()
+        indexed, expected = self.get_leave_from(datetime(2021, 1, 15))
+        self.assertEqual(indexed, expected)
+        self.assertEqual(len(indexed), 2)
+
+        leave1 = LeaveModel.get_leave(leave1.id)
+        leave1.start_date = datetime(2021, 3, 1)
+        leave1.end_date = datetime(2021, 3, 10)
+        leave1.update()
+        db.session.commit()
+        self.assertEqual(*self.get_leave_from(datetime(2021, 2, 15)))
+
+        LeaveModel.get_leave(leave2.id).delete()
+        db.session.commit()
+        indexed, expected = self.get_leave_from(datetime(2021, 1, 1))
+        self.assertEqual(indexed, expected)
+        self.assertEqual(len(indexed), 1)
+
+        LeaveModel(USER_ID, datetime(2021, 4, 1), datetime(2021, 4, 2)).add()
+        db.session.rollback() # rolled back writes never reach the index
+        self.assertEqual(*self.get_leave_from(datetime(2021, 1, 1)))
+
+        LeaveModel.delete_all()
+        db.session.commit()
+        self.assertEqual(self.get_leave_from(datetime(2021, 1, 1)), ([], []))
+
+
+class LeaveIndexResourceTests(unittest.TestCase):
+    '''
+    Index snapshots served by the api
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False})
+        self.client = self.app.test_client()
+        self.user_id = self.client.put('/user/0').get_json()['id']
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def test_rolled_back_merge(self):
+        '''
+        A write request warming the index doesn't leave its rolled back
+        changes in it
+        '''
+        leave_id = self.client.post('/leave/create', json={'user_id': self.user_id,
+            'start_date': '2021-01-01T00:00:00', 'end_date': '2021-01-10T00:00:00'}
+            ).get_json()['id']
+
+        response = self.client.put('/leave/%d?merge=true' % (leave_id),
+            json={'end_date': '2021-06-30T00:00:00'})
+        self.assertEqual(response.status_code, 400)
+
+        scheduled = self.client.get('/leave/scheduled/%d/2021-01-01T00:00:00'
+            % (self.user_id)).get_json()
+        self.assertEqual([leave['end_date'] for leave in scheduled], ['2021-01-10T00:00:00'])
+
+
+class LeaveIndexSnapshotTests(unittest.TestCase):
+    '''
+    Index warms racing writes on a file database, whose transactions read
+    a snapshot
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(
+                self.directory.name, 'leave.db'),
+            'LEAVE_CACHE_ENABLED': False
+        })
+        self.client = self.app.test_client()
+        self.user_id = self.client.put('/user/0').get_json()['id']
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.directory.cleanup()
+
+
+    def create(self, start: str, end: str) -> None:
+        response = self.client.post('/leave/create', json={'user_id': self.user_id,
+            'start_date': start, 'end_date': end})
+        self.assertEqual(response.status_code, 201)
+
+
+    def test_write_after_snapshot(self):
+        '''
+        Intervals loaded from a snapshot taken before a concurrent write
+        committed are not indexed
+        '''
+        self.create('2021-01-01T00:00:00', '2021-01-10T00:00:00')
+
+        with self.app.app_context():
+            LeaveVersionModel.get_version(self.user_id) # starts the snapshot, like conditional
+            writer = Thread(target=self.create,
+                args=('2021-02-01T00:00:00', '2021-02-10T00:00:00'))
+            writer.start()
+            writer.join()
+
+            self.assertEqual(len(LeaveModel.get_leave_from(self.user_id, date(2021, 1, 1))), 1)
+            db.session.commit()
+
+        scheduled = self.client.get('/leave/scheduled/%d/2021-01-01T00:00:00'
+            % (self.user_id)).get_json()
+        self.assertEqual(len(scheduled), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
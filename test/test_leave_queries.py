@@ -0,0 +1,159 @@
+'''
+Tests for the leave model queries (run in process, no server needed).
+'''
+
+import random
+import unittest
+from datetime import date, datetime, timedelta
+from sqlalchemy import event
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.models.leave import LeaveModel, MAX_YEARLY_LEAVE
+
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+USER_ID = 1
+
+
+'''
+Helpers
+'''
+def capture_statements(func, *args):
+    '''
+    Run func and return the sql statements (and parameters) it executed
+    '''
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func(*args)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return statements
+
+
+def explain(statement, parameters):
+    '''
+    Return the sqlite query plan for a statement
+    '''
+    rows = db.session.connection().exec_driver_sql(
+        'EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    return ' '.join(row[-1] for row in rows)
+
+
+class LeaveQueryPlanTests(unittest.TestCase):
+    '''
+    Leave query plan unit tests
+    '''
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+        app.config['LEAVE_INDEX_ENABLED'] = False
+
+        for month in range(1, 13):
+            LeaveModel(USER_ID, datetime(2021, month, 1), datetime(2021, month, 2)).add()
+
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        app.config['LEAVE_INDEX_ENABLED'] = True
+        self.context.pop()
+
+
+    def test_leave_used_uses_index(self):
+        '''
+        Yearly leave aggregation is an index range scan
+        '''
+        statements = capture_statements(LeaveModel.get_leave_used, USER_ID, 2021)
+        plan = explain(*statements[-1])
+
+        self.assertIn('USING INDEX ix_leave_user_', plan)
+        self.assertNotIn('SCAN leave_table', plan)
+
+
+    def test_leave_from_uses_index(self):
+        '''
+        Scheduled leave lookup is an index range scan
+        '''
+        statements = capture_statements(
+            LeaveModel.get_leave_from, USER_ID, datetime(2021, 6, 1))
+        plan = explain(*statements[-1])
+
+        self.assertIn('USING INDEX ix_leave_user_end', plan)
+        self.assertNotIn('SCAN leave_table', plan)
+
+
+    def test_leave_used_year_overlap(self):
+        '''
+        Yearly leave aggregation counts leaves straddling the year boundaries
+        '''
+        LeaveModel(USER_ID, datetime(2020, 12, 30), datetime(2021, 1, 3)).add()
+        LeaveModel(USER_ID, datetime(2021, 12, 30), datetime(2022, 1, 3)).add()
+        LeaveModel(USER_ID, datetime(2022, 2, 1), datetime(2022, 2, 3)).add()
+
+        self.assertEqual(LeaveModel.get_leave_used(USER_ID, 2021), 12 * 2 + 3 + 2)
+        self.assertEqual(LeaveModel.get_leave_used(USER_ID, 2022), 3 + 3)
+        self.assertEqual(LeaveModel.get_leave_used(USER_ID, 2020), 2)
+
+
+class LeaveUsedTests(unittest.TestCase):
+    '''
+    Differential tests of the sql leave aggregation against the python
+    get_leave_days_in_year reference
+    '''
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+
+    def test_leave_used_random(self):
+        '''
+        Sql aggregation matches the python reference on random leave sets
+        '''
+        rand = random.Random(1234)
+        leaves = [
+            ('2020-06-01T00:00:00', '2021-01-01T00:00:00'), # straddles start
+            ('2021-12-31T00:00:00', '2022-06-01T00:00:00'), # straddles end
+            ('2021-01-01T00:00:00', '2021-01-31T00:00:00'),
+            ('2021-12-30T12:00:00', '2021-12-31T15:00:00') # time of day
+        ]
+        leaves = [(LeaveModel.str_to_date(start), LeaveModel.str_to_date(end))
+            for start, end in leaves] # the time of day is dropped
+
+        for _ in range(300):
+            start = date(2019, 1, 1) + timedelta(days=rand.randrange(4 * 365))
+            end = start + timedelta(days=rand.randrange(200))
+            leaves.append((start, end))
+
+        # added directly, the random leaves go over the yearly allotment
+        db.session.add_all([LeaveModel(i % 5, start, end)
+            for i, (start, end) in enumerate(leaves)])
+        LeaveModel.rebuild_usage()
+
+        for user_id in range(5):
+            user_leaves = leaves[user_id::5]
+            for year in range(2018, 2024):
+                expected = sum(LeaveModel.get_leave_days_in_year(start, end, year)
+                    for start, end in user_leaves)
+
+                self.assertEqual(LeaveModel.get_leave_used(user_id, year), expected)
+                self.assertEqual(LeaveModel.get_leave_remaining(user_id, year),
+                    MAX_YEARLY_LEAVE.days - expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
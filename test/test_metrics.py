@@ -0,0 +1,130 @@
+'''
+Tests for the request and sql metrics (run in process, no server needed).
+'''
+
+import re
+import unittest
+from threading import Thread
+
+from backend.server import create_app
+from backend.models.db import db
+
+
+def sample(text: str, name: str, **labels) -> float:
+    '''
+    Value of the sample of a metric with the given labels
+    '''
+    for line in text.splitlines():
+        match = re.match(r'^(\w+)\{(.*)\} (\S+)$', line)
+        if match is None or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2)))
+        if all(found.get(key) == value for key, value in labels.items()):
+            return float(match.group(3))
+
+    raise AssertionError('No sample %s %s' % (name, labels))
+
+
+class MetricsTests(unittest.TestCase):
+    '''
+    Metrics endpoint tests
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False})
+        self.client = self.app.test_client()
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def test_request_counts(self):
+        '''
+        Requests are counted by route, method and status
+        '''
+        user_id = self.client.put('/user/0').get_json()['id']
+        self.client.get('/user/%d' % (user_id))
+        self.client.get('/user/%d' % (user_id))
+        self.client.get('/user/1000')
+        self.client.get('/missing')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+
+        route = '/user/<int:id>'
+        self.assertEqual(sample(text, 'leave_http_requests_total', route=route,
+            method='GET', status='200'), 2)
+        self.assertEqual(sample(text, 'leave_http_requests_total', route=route,
+            method='GET', status='404'), 1)
+        self.assertEqual(sample(text, 'leave_http_requests_total', route=route,
+            method='PUT', status='201'), 1)
+        self.assertEqual(sample(text, 'leave_http_requests_total', route='unmatched',
+            method='GET', status='404'), 1)
+        self.assertNotIn('route="/metrics"', text)
+
+
+    def test_histograms(self):
+        '''
+        Latency and sql histograms are cumulative and count every request
+        '''
+        user_id = self.client.put('/user/0').get_json()['id']
+        for _ in range(3):
+            self.client.get('/leave/remaining/%d/2021' % (user_id))
+        text = self.client.get('/metrics').get_data(as_text=True)
+
+        labels = {'route': '/leave/remaining/<int:user_id>/<int:year>', 'method': 'GET'}
+        self.assertEqual(sample(text, 'leave_http_request_duration_seconds_count',
+            **labels), 3)
+        self.assertEqual(sample(text, 'leave_http_request_duration_seconds_bucket',
+            le='+Inf', **labels), 3)
+        self.assertLessEqual(sample(text, 'leave_http_request_duration_seconds_bucket',
+            le='0.001', **labels), 3)
+        self.assertGreater(sample(text, 'leave_http_request_duration_seconds_sum',
+            **labels), 0)
+
+        statements = sample(text, 'leave_sql_statements_per_request_sum', **labels)
+        self.assertGreaterEqual(statements, 3) # at least one query per request
+        self.assertEqual(sample(text, 'leave_sql_statements_per_request_count',
+            **labels), 3)
+        self.assertGreater(sample(text, 'leave_sql_duration_seconds_total', **labels), 0)
+
+
+    def test_disabled(self):
+        '''
+        Nothing is recorded when metrics are disabled
+        '''
+        self.app.config['METRICS_ENABLED'] = False
+        self.client.put('/user/0')
+        text = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertNotIn('/user/<int:id>', text)
+
+
+    def test_finished_threads(self):
+        '''
+        The shards of finished threads are folded together, their requests
+        still counted
+        '''
+        user_id = self.client.put('/user/0').get_json()['id']
+
+        def get():
+            self.app.test_client().get('/user/%d' % (user_id))
+
+        for _ in range(50):
+            thread = Thread(target=get)
+            thread.start()
+            thread.join()
+
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertEqual(sample(text, 'leave_http_requests_total', route='/user/<int:id>',
+            method='GET', status='200'), 50)
+        self.assertEqual(len(self.app.extensions['metrics'].shards), 1) # this thread's
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+'''
+Tests for the database migrations (run in process, no server needed).
+'''
+
+import os
+import tempfile
+import unittest
+from datetime import date, datetime
+
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, MetaData, Table, \
+    create_engine, inspect
+
+from backend.server import create_app
+from backend.migrations.compact_leaves import compact
+from backend.migrations import leave_indexes
+from backend.migrations.leave_dates import migrate
+from backend.migrations.leave_usage import rebuild
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.models.usage import LeaveUsageModel
+
+
+class LeaveDatesMigrationTests(unittest.TestCase):
+    '''
+    DateTime to Date leave column migration
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.uri = 'sqlite:///' + os.path.join(self.directory.name, 'leave.db')
+
+        # schema and rows as created before leaves were stored as dates
+        metadata = MetaData()
+        users = Table('user_table', metadata, Column('id', Integer, primary_key=True))
+        leaves = Table('leave_table', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('user_id', Integer, ForeignKey('user_table.id'), nullable=False),
+            Column('start_date', DateTime, nullable=False),
+            Column('end_date', DateTime, nullable=False))
+
+        engine = create_engine(self.uri)
+        metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(users.insert(), [{'id': 1}, {'id': 2}])
+            connection.execute(leaves.insert(), [
+                {'user_id': 1, 'start_date': datetime(2021, 1, 4),
+                    'end_date': datetime(2021, 1, 8)},
+                {'user_id': 1, 'start_date': datetime(2021, 12, 30, 12),
+                    'end_date': datetime(2022, 1, 2, 9)},
+                {'user_id': 2, 'start_date': datetime(2021, 3, 1, 23, 30),
+                    'end_date': datetime(2021, 3, 1, 23, 45)}
+            ])
+        engine.dispose()
+
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': self.uri,
+            'LEAVE_INDEX_ENABLED': False, 'LEAVE_CACHE_ENABLED': False})
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.directory.cleanup()
+
+
+    def test_migrate(self):
+        '''
+        Dates lose their time, the ledger is rebuilt and the api serves the
+        migrated leaves
+        '''
+        self.assertTrue(migrate(self.app))
+        self.assertFalse(migrate(self.app))
+
+        with self.app.app_context():
+            inspector = inspect(db.engine)
+            columns = {column['name']: column['type']
+                for column in inspector.get_columns('leave_table')}
+            self.assertIsInstance(columns['start_date'], Date)
+            self.assertIsInstance(columns['end_date'], Date)
+            self.assertEqual({index['name'] for index in inspector.get_indexes('leave_table')},
+                {'ix_leave_user_start', 'ix_leave_user_end', 'ix_leave_start_end_user'})
+
+            self.assertEqual(LeaveModel.get_rows(), [
+                (1, 1, date(2021, 1, 4), date(2021, 1, 8)),
+                (2, 1, date(2021, 12, 30), date(2022, 1, 2)),
+                (3, 2, date(2021, 3, 1), date(2021, 3, 1))
+            ])
+            self.assertEqual(LeaveUsageModel.get_days_used(1, 2021), 5 + 2)
+            self.assertEqual(LeaveUsageModel.get_days_used(1, 2022), 2)
+            self.assertEqual(LeaveUsageModel.get_days_used(2, 2021), 1)
+
+        client = self.app.test_client()
+        self.assertEqual(client.get('/leave/2').get_json()['start_date'], '2021-12-30T00:00:00')
+        response = client.put('/leave/2', json={'end_date': '2022-01-05T00:00:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get('/leave/remaining/1/2022').get_json()['remaining'],
+            84 - 5)
+
+
+class LeaveIndexesMigrationTests(unittest.TestCase):
+    '''
+    Creation of the leave table indexes added after a database was created
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.uri = 'sqlite:///' + os.path.join(self.directory.name, 'leave.db')
+
+        app = create_app({'SQLALCHEMY_DATABASE_URI': self.uri})
+        with app.app_context():
+            db.session.execute('DROP INDEX ix_leave_start_end_user')
+            db.session.commit()
+            db.engine.dispose()
+
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': self.uri,
+            'LEAVE_INDEX_ENABLED': False, 'LEAVE_CACHE_ENABLED': False})
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.directory.cleanup()
+
+
+    def test_migrate(self):
+        '''
+        Missing indexes are created once
+        '''
+        self.assertEqual(leave_indexes.migrate(self.app), ['ix_leave_start_end_user'])
+        self.assertEqual(leave_indexes.migrate(self.app), [])
+
+        with self.app.app_context():
+            self.assertEqual({index['name'] for index in
+                inspect(db.engine).get_indexes('leave_table')},
+                {'ix_leave_user_start', 'ix_leave_user_end', 'ix_leave_start_end_user'})
+
+
+class CompactLeavesTests(unittest.TestCase):
+    '''
+    One-off compaction of overlapping and adjacent leaves
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_INDEX_ENABLED': False, 'LEAVE_CACHE_ENABLED': False})
+        self.client = self.app.test_client()
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def test_compact(self):
+        '''
+        Each user's overlapping and adjacent leaves become one, charged once
+        '''
+        user_ids = [self.client.put('/user/0').get_json()['id'] for _ in range(2)]
+        for user_id, start, end in ((user_ids[0], '2021-01-01', '2021-01-31'),
+            (user_ids[0], '2021-01-10', '2021-01-12'), (user_ids[0], '2021-02-01', '2021-02-28'),
+            (user_ids[0], '2021-03-02', '2021-03-02'), (user_ids[1], '2021-01-01', '2021-01-01')):
+            response = self.client.post('/leave/create', json={'user_id': user_id,
+                'start_date': start + 'T00:00:00', 'end_date': end + 'T00:00:00'})
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(compact(self.app), (1, 2))
+        self.assertEqual(compact(self.app), (0, 0))
+
+        with self.app.app_context():
+            self.assertEqual([row[1:] for row in LeaveModel.get_rows()], [
+                (user_ids[0], date(2021, 1, 1), date(2021, 2, 28)),
+                (user_ids[0], date(2021, 3, 2), date(2021, 3, 2)),
+                (user_ids[1], date(2021, 1, 1), date(2021, 1, 1))
+            ])
+        self.assertEqual(self.client.get('/leave/remaining/%d/2021' % (user_ids[0])
+            ).get_json()['remaining'], 84 - 59 - 1)
+
+
+class LeaveUsageRebuildTests(unittest.TestCase):
+    '''
+    Usage ledger rebuild after a calendar change
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.uri = 'sqlite:///' + os.path.join(self.directory.name, 'leave.db')
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def create_app(self, region=None):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': self.uri, 'LEAVE_REGION': region,
+            'LEAVE_INDEX_ENABLED': False, 'LEAVE_CACHE_ENABLED': False})
+        self.addCleanup(self.dispose, app)
+        return app
+
+
+    def dispose(self, app):
+        with app.app_context():
+            db.engine.dispose()
+
+
+    def test_rebuild(self):
+        '''
+        Balances are recounted with the new region's calendar
+        '''
+        client = self.create_app().test_client()
+        user_id = client.put('/user/0').get_json()['id']
+        response = client.post('/leave/create', json={'user_id': user_id,
+            'start_date': '2021-01-04T00:00:00', 'end_date': '2021-01-17T00:00:00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(client.get('/leave/remaining/%d/2021' % (user_id)
+            ).get_json()['remaining'], 84 - 14)
+
+        app = self.create_app('weekdays')
+        rebuild(app)
+        with app.app_context():
+            self.assertEqual(LeaveUsageModel.get_days_used(user_id, 2021), 10)
+        self.assertEqual(app.test_client().get('/leave/remaining/%d/2021' % (user_id)
+            ).get_json()['remaining'], 84 - 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
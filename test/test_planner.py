@@ -0,0 +1,179 @@
+'''
+Tests for the leave planning queries (run in process, no server needed).
+'''
+
+import random
+import unittest
+from datetime import date, timedelta
+
+from backend.server import create_app
+from backend.models import planner
+from backend.models.db import db
+from backend.models.workdays import WorkCalendar
+
+ONE_DAY = timedelta(days=1)
+CALENDARS = (WorkCalendar(), WorkCalendar('1111100', ['2021-12-24', '2022-01-03']))
+
+
+def fits(calendar: WorkCalendar, start_date: date, end_date: date, remaining: dict) -> bool:
+    return all(calendar.count_in_year(start_date, end_date, year) <= remaining[year]
+        for year in range(start_date.year, end_date.year + 1))
+
+
+class PlannerTests(unittest.TestCase):
+    '''
+    Searches against trying every end or start date
+    '''
+    def test_max_end_date(self):
+        rand = random.Random(0)
+        for calendar in CALENDARS:
+            for _ in range(200):
+                start_date = date(2021, 1, 1) + timedelta(days=rand.randrange(365))
+                last_date = start_date + timedelta(days=200)
+                remaining = {year: rand.choice([0, 1, 5, 30, 84])
+                    for year in range(2021, last_date.year + 1)}
+
+                expected = None
+                end_date = start_date
+                while end_date <= last_date and fits(calendar, start_date, end_date, remaining):
+                    expected = end_date
+                    end_date += ONE_DAY
+
+                self.assertEqual(planner.max_end_date(start_date, last_date, remaining, calendar),
+                    expected, (start_date, remaining))
+
+
+    def test_earliest_start(self):
+        rand = random.Random(1)
+        for calendar in CALENDARS:
+            for _ in range(100):
+                date_from = date(2021, 1, 1) + timedelta(days=rand.randrange(365))
+                last_start = date_from + timedelta(days=100)
+                days = rand.randint(1, 15)
+                remaining = {year: rand.choice([0, 3, 10, 84]) for year in range(2021, 2024)}
+                scheduled = []
+                for _ in range(rand.randrange(8)):
+                    start_date = date_from + timedelta(days=rand.randrange(-10, 100))
+                    scheduled.append((start_date, start_date + timedelta(days=rand.randrange(10))))
+
+                expected = None
+                start_date = date_from
+                while start_date <= last_start:
+                    end_date = start_date + timedelta(days=days - 1)
+                    if fits(calendar, start_date, end_date, remaining) and not any(
+                        start <= end_date and end >= start_date for start, end in scheduled):
+                        expected = start_date
+                        break
+                    start_date += ONE_DAY
+
+                self.assertEqual(planner.earliest_start(date_from, last_start, days, remaining,
+                    scheduled, calendar), expected)
+
+
+    def test_last_dates(self):
+        '''
+        Searches up to date.max stop there instead of overflowing
+        '''
+        for calendar in CALENDARS:
+            self.assertEqual(planner.max_end_date(date(9999, 12, 1), date.max, {9999: 84},
+                calendar), date.max)
+            self.assertEqual(planner.earliest_start(date(9999, 12, 30), date.max, 1, {9999: 84},
+                [], calendar), date(9999, 12, 30))
+            self.assertIsNone(planner.earliest_start(date(9999, 12, 30), date.max, 1, {9999: 84},
+                [(date(9999, 12, 30), date.max)], calendar))
+
+
+class PlannerResourceTests(unittest.TestCase):
+    '''
+    /leave/max-end and /leave/availability endpoints
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        self.client = self.app.test_client()
+        self.user_id = self.client.put('/user/0').get_json()['id']
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def create(self, start: str, end: str):
+        return self.client.post('/leave/create', json={'user_id': self.user_id,
+            'start_date': start, 'end_date': end})
+
+
+    def test_max_end(self):
+        '''
+        The max end date is accepted, the day after is not
+        '''
+        self.assertEqual(self.create('2021-01-04T00:00:00', '2021-03-14T00:00:00').status_code,
+            201) # 70 days
+        self.assertEqual(self.create('2022-01-03T00:00:00', '2022-03-27T00:00:00').status_code,
+            201) # 84 days, none left in 2022
+
+        response = self.client.get('/leave/max-end/%d/2021-12-20T00:00:00' % (self.user_id))
+        self.assertEqual(response.get_json(), {'max_end_date': '2021-12-31T00:00:00'})
+        response = self.client.get('/leave/max-end/%d/2021-06-01T00:00:00' % (self.user_id))
+        self.assertEqual(response.get_json(), {'max_end_date': '2021-06-14T00:00:00'})
+
+        self.assertEqual(self.create('2021-06-01T00:00:00', '2021-06-15T00:00:00').status_code,
+            400)
+        self.assertEqual(self.create('2021-06-01T00:00:00', '2021-06-14T00:00:00').status_code,
+            201)
+
+        # cached responses follow leave changes
+        response = self.client.get('/leave/max-end/%d/2021-12-20T00:00:00' % (self.user_id))
+        self.assertEqual(response.get_json(), {'max_end_date': None})
+        self.assertEqual(self.client.get('/leave/max-end/%d/2021-12-20' % (self.user_id)
+            ).status_code, 400)
+
+
+    def test_availability(self):
+        '''
+        The earliest free period within the remaining days
+        '''
+        self.assertEqual(self.create('2021-01-04T00:00:00', '2021-01-10T00:00:00').status_code,
+            201)
+        self.assertEqual(self.create('2021-01-13T00:00:00', '2021-03-28T00:00:00').status_code,
+            201) # 7 + 75 days, 2 left in 2021
+
+        def availability(query):
+            return self.client.get('/leave/availability/%d?%s' % (self.user_id, query))
+
+        self.assertEqual(availability('days=2&after=2021-01-01T00:00:00').get_json(),
+            {'start_date': '2021-01-01T00:00:00', 'end_date': '2021-01-02T00:00:00'})
+        self.assertEqual(availability('days=2&after=2021-01-05T00:00:00').get_json(),
+            {'start_date': '2021-01-11T00:00:00', 'end_date': '2021-01-12T00:00:00'})
+        # 2 days left in 2021, so longer periods straddle the new year
+        self.assertEqual(availability('days=5&after=2021-01-05T00:00:00').get_json(),
+            {'start_date': '2021-12-30T00:00:00', 'end_date': '2022-01-03T00:00:00'})
+        self.assertEqual(availability('days=3&after=2021-12-31T00:00:00').get_json(),
+            {'start_date': '2021-12-31T00:00:00', 'end_date': '2022-01-02T00:00:00'})
+
+        self.assertEqual(availability('days=200&after=2021-01-01T00:00:00').status_code, 404)
+        self.assertEqual(availability('days=0').status_code, 400)
+        self.assertEqual(availability('after=2021-01-01T00:00:00').status_code, 400)
+        self.assertEqual(availability('days=2&after=2021-01-01').status_code, 400)
+        self.assertEqual(availability('days=2').status_code, 200)
+
+
+    def test_last_dates(self):
+        '''
+        Searches near date.max are cut short at it
+        '''
+        response = self.client.get('/leave/max-end/%d/9999-12-01T00:00:00' % (self.user_id))
+        self.assertEqual(response.get_json(), {'max_end_date': '9999-12-31T00:00:00'})
+
+        def availability(query):
+            return self.client.get('/leave/availability/%d?%s' % (self.user_id, query))
+
+        self.assertEqual(availability('days=5&after=9999-12-20T00:00:00').get_json(),
+            {'start_date': '9999-12-20T00:00:00', 'end_date': '9999-12-24T00:00:00'})
+        self.assertEqual(availability('days=1&after=9999-12-31T00:00:00').status_code, 200)
+        self.assertEqual(availability('days=5&after=9999-12-29T00:00:00').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+'''
+Tests for the per request profiler (run in process, no server needed).
+'''
+
+import os
+import tempfile
+import unittest
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.monitoring.profiler import PROFILE_HEADER, ProfilerMiddleware
+
+
+class ProfilerTests(unittest.TestCase):
+    '''
+    Profiler middleware tests
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def create_app(self, **config):
+        app = create_app(dict({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False, 'PROFILE_DIRECTORY': self.directory.name},
+            **config))
+        self.addCleanup(self.drop_all, app)
+        return app
+
+
+    def drop_all(self, app):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def read_profile(self, response) -> dict:
+        '''
+        Collapsed stacks of a profiled response, by stack
+        '''
+        response.close() # the profile is written when the body is closed
+        with open(os.path.join(self.directory.name, response.headers[PROFILE_HEADER])) as file:
+            return {stack: int(weight) for stack, weight in
+                (line.rsplit(' ', 1) for line in file.read().splitlines())}
+
+
+    def test_disabled(self):
+        '''
+        The wsgi app is not wrapped unless profiling is enabled
+        '''
+        app = self.create_app()
+        self.assertNotIsInstance(app.wsgi_app, ProfilerMiddleware)
+
+        response = app.test_client().put('/user/0', headers={PROFILE_HEADER: '1'})
+        self.assertNotIn(PROFILE_HEADER, response.headers)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+    def test_header(self):
+        '''
+        Requests with the header are profiled from dispatch to commit
+        '''
+        app = self.create_app(PROFILE_ENABLED=True)
+        client = app.test_client()
+        user_id = client.put('/user/0').get_json()['id']
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+        response = client.post('/leave/create', headers={PROFILE_HEADER: '1'},
+            json={'user_id': user_id, 'start_date': '2021-01-04T00:00:00',
+                'end_date': '2021-01-08T00:00:00'})
+        self.assertEqual(response.status_code, 201)
+        stacks = self.read_profile(response)
+
+        self.assertTrue(all(stack.startswith('POST /leave/create;') for stack in stacks))
+        self.assertTrue(all(weight > 0 for weight in stacks.values()))
+        for function in ('LeaveModel.str_to_date', 'Session.commit',
+            'LeaveCreateResource.post'):
+            self.assertTrue(any(function in stack for stack in stacks), function)
+
+
+    def test_sampled(self):
+        '''
+        Sampled requests are profiled including their streamed body
+        '''
+        app = self.create_app(PROFILE_SAMPLE_RATE=1.0)
+        client = app.test_client()
+        client.put('/user/0')
+
+        response = client.get('/leave/list?format=ndjson')
+        self.assertEqual(response.status_code, 200)
+        response.get_data()
+        stacks = self.read_profile(response)
+
+        self.assertTrue(any('LeaveListResource.get' in stack for stack in stacks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+'''
+Tests for the leave quota reservation (run in process, no server needed).
+'''
+
+import os
+import random
+import tempfile
+import unittest
+from datetime import date, timedelta
+from threading import Event, Thread
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.models.leave import LeaveModel, MAX_YEARLY_LEAVE
+from backend.models.usage import LeaveUsageModel
+
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+USER_ID = 1
+MAX_DAYS = MAX_YEARLY_LEAVE.days
+
+
+class LeaveReserveTests(unittest.TestCase):
+    '''
+    Usage ledger reservation unit tests
+    '''
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+
+    def test_reserve(self):
+        '''
+        Reservations apply up to the limit and fail past it
+        '''
+        self.assertTrue(LeaveUsageModel.reserve(USER_ID, {2021: MAX_DAYS - 1}, MAX_DAYS))
+        self.assertTrue(LeaveUsageModel.reserve(USER_ID, {2021: 1}, MAX_DAYS))
+        self.assertFalse(LeaveUsageModel.reserve(USER_ID, {2021: 1}, MAX_DAYS))
+        self.assertTrue(LeaveUsageModel.reserve(USER_ID, {2021: -2}, MAX_DAYS))
+        self.assertEqual(LeaveUsageModel.get_days_used(USER_ID, 2021), MAX_DAYS - 2)
+
+
+    def test_reserve_all_or_nothing(self):
+        '''
+        A failed reservation undoes the years already reserved
+        '''
+        LeaveUsageModel.reserve(USER_ID, {2022: MAX_DAYS}, MAX_DAYS)
+
+        self.assertFalse(LeaveUsageModel.reserve(USER_ID, {2021: 10, 2022: 1}, MAX_DAYS))
+        self.assertEqual(LeaveUsageModel.get_days_used(USER_ID, 2021), 0)
+        self.assertEqual(LeaveUsageModel.get_days_used(USER_ID, 2022), MAX_DAYS)
+        self.assertTrue(LeaveUsageModel.reserve(USER_ID, {2021: 10, 2022: 1}, None))
+
+
+    def test_stale_update(self):
+        '''
+        Updating a leave changed since it was loaded fails
+        '''
+        leave = LeaveModel(USER_ID, date(2021, 1, 1), date(2021, 1, 10))
+        self.assertTrue(leave.add())
+        db.session.commit()
+
+        table = LeaveModel.__table__
+        db.session.execute(table.update().where(table.c.id == leave.id).values(
+            version_id=table.c.version_id + 1)) # concurrent writer
+
+        leave.end_date = date(2021, 1, 5)
+        with self.assertRaises(StaleDataError):
+            leave.update()
+
+
+class LeaveReserveRaceTests(unittest.TestCase):
+    '''
+    Reservations racing without the database write lock, on a file database
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(
+                self.directory.name, 'leave.db')
+        })
+        with self.app.app_context():
+            LeaveUsageModel.apply(USER_ID, {2021: MAX_DAYS - 4})
+            db.session.commit()
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.directory.cleanup()
+
+
+    def test_conditional_update(self):
+        '''
+        Of two reservations that each fit the balance but not together,
+        exactly one succeeds: the second update waits for the first to
+        commit, then its condition no longer holds
+        '''
+        results = []
+        reserved = Event()
+        commit = Event()
+
+        def reserve(first: bool):
+            with self.app.app_context():
+                results.append(LeaveUsageModel.reserve(USER_ID, {2021: 3}, MAX_DAYS))
+                if first:
+                    reserved.set()
+                    commit.wait() # hold the row while the second update runs
+                db.session.commit()
+
+        threads = [Thread(target=reserve, args=(True,)), Thread(target=reserve, args=(False,))]
+        threads[0].start()
+        reserved.wait()
+        threads[1].start()
+        threads[1].join(0.2) # blocked on the first transaction
+        commit.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [True, False])
+        with self.app.app_context():
+            self.assertEqual(LeaveUsageModel.get_days_used(USER_ID, 2021), MAX_DAYS - 1)
+
+
+class LeaveQuotaStressTests(unittest.TestCase):
+    '''
+    Concurrent leave writes on a file database
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(
+                self.directory.name, 'leave.db'),
+            'LEAVE_CACHE_ENABLED': False
+        })
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.directory.cleanup()
+
+
+    def test_no_overdraw(self):
+        '''
+        Concurrent creates, updates and deletes never overdraw a balance and
+        keep the ledger equal to the leave table
+        '''
+        client = self.app.test_client()
+        user_ids = [client.put('/user/0').get_json()['id'] for _ in range(4)]
+        errors = []
+
+        def write(seed):
+            rand = random.Random(seed)
+            client = self.app.test_client()
+            created = []
+
+            for _ in range(40):
+                start = date(2021, 1, 1) + timedelta(days=rand.randrange(700))
+                data = {'user_id': rand.choice(user_ids),
+                    'start_date': LeaveModel.date_to_str(start),
+                    'end_date': LeaveModel.date_to_str(
+                        start + timedelta(days=rand.randrange(30)))}
+                action = rand.random()
+
+                if action < 0.6 or not created:
+                    response = client.post('/leave/create', json=data)
+                    if response.status_code == 201:
+                        created.append(response.get_json()['id'])
+                elif action < 0.85:
+                    del data['user_id']
+                    response = client.put('/leave/%d' % (rand.choice(created)), json=data)
+                else:
+                    response = client.delete('/leave/%d' % (created.pop()))
+
+                if response.status_code not in (200, 201, 400):
+                    errors.append(response.status_code)
+
+        threads = [Thread(target=write, args=(seed,)) for seed in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with self.app.app_context():
+            for user_id in user_ids:
+                for year in (2021, 2022, 2023):
+                    used = LeaveModel.get_leave_used(user_id, year)
+                    self.assertLessEqual(used, MAX_DAYS)
+                    self.assertEqual(LeaveUsageModel.get_days_used(user_id, year), used)
+
+
+class LeaveQuotaMemoryStressTests(LeaveQuotaStressTests):
+    '''
+    Concurrent leave writes on an in memory database, whose single
+    connection is shared by the threads
+    '''
+    def setUp(self):
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False
+        })
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
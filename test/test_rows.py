@@ -0,0 +1,112 @@
+'''
+Tests for the fast list serializer (run in process, no server needed).
+'''
+
+import json
+import random
+import unittest
+from datetime import date, timedelta
+
+import flask
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.models.leave import LeaveModel
+from backend.models.user import UserModel
+from backend.schemas.leave import LeaveSchema
+from backend.schemas.user import UserSchema
+
+
+class RowSerializerTests(unittest.TestCase):
+    '''
+    List responses are byte for byte the encoded schema dumps
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False})
+        self.client = self.app.test_client()
+
+        rand = random.Random(0)
+        with self.app.app_context():
+            db.session.execute(UserModel.__table__.insert(),
+                [{'id': user_id} for user_id in range(1, 21)])
+            rows = []
+            for _ in range(150):
+                start = date(2021, 1, 1) + timedelta(days=rand.randrange(700))
+                rows.append({'user_id': rand.randint(1, 20), 'start_date': start,
+                    'end_date': start + timedelta(days=rand.randrange(10)), 'version_id': 1})
+            db.session.execute(LeaveModel.__table__.insert(), rows)
+            db.session.commit()
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def expected(self, schema, items) -> bytes:
+        '''
+        Flask restful encoding of the schema dump
+        '''
+        return (json.dumps(schema.dump(items)) + '\n').encode()
+
+
+    def test_lists(self):
+        '''
+        Full lists
+        '''
+        with self.app.app_context():
+            leaves = self.expected(LeaveSchema(many=True), LeaveModel.get_all())
+            users = self.expected(UserSchema(many=True), UserModel.get_all())
+
+        self.assertEqual(self.client.get('/leave/list').get_data(), leaves)
+        self.assertEqual(self.client.get('/user/list').get_data(), users)
+
+
+    def test_pages(self):
+        '''
+        Keyset pages, including the last (empty) one
+        '''
+        for path, model, schema in (('/leave/list', LeaveModel, LeaveSchema),
+            ('/user/list', UserModel, UserSchema)):
+            for after_id, limit in ((0, 7), (140, 100), (1000, 5)):
+                with self.app.app_context():
+                    items = model.query.filter(model.id > after_id).order_by(
+                        model.id).limit(limit + 1).all()
+                    next_id = items[limit - 1].id if len(items) > limit else None
+                    expected = (json.dumps({'items': schema(many=True).dump(items[:limit]),
+                        'next': next_id}) + '\n').encode()
+
+                response = self.client.get('%s?after_id=%d&limit=%d' % (path, after_id, limit))
+                self.assertEqual(response.get_data(), expected)
+
+
+    def test_streams(self):
+        '''
+        Newline delimited json streams
+        '''
+        for path, model, schema in (('/leave/list', LeaveModel, LeaveSchema),
+            ('/user/list', UserModel, UserSchema)):
+            with self.app.app_context():
+                expected = ''.join(flask.json.dumps(schema().dump(item)) + '\n'
+                    for item in model.get_all()).encode()
+
+            self.assertEqual(self.client.get(path + '?format=ndjson').get_data(), expected)
+
+
+    def test_debug(self):
+        '''
+        Indented debug output falls back to flask restful encoding
+        '''
+        self.app.debug = True
+        with self.app.app_context():
+            expected = LeaveSchema(many=True).dump(LeaveModel.get_all())
+
+        response = self.client.get('/leave/list')
+        self.assertIn(b'\n    ', response.get_data())
+        self.assertEqual(response.get_json(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
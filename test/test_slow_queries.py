@@ -0,0 +1,94 @@
+'''
+Tests for the slow query log (run in process, no server needed).
+'''
+
+import json
+import os
+import tempfile
+import unittest
+
+from backend.server import create_app
+from backend.models.db import db
+
+
+class SlowQueryTests(unittest.TestCase):
+    '''
+    Slow query log tests
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.directory.name, 'slow-{pid}.log')
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def create_app(self, **config):
+        app = create_app(dict({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False, 'SLOW_QUERY_THRESHOLD_MS': 0,
+            'SLOW_QUERY_LOG_FILE': self.log_file}, **config))
+        self.addCleanup(self.drop_all, app)
+        return app
+
+
+    def drop_all(self, app):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def test_recorded(self):
+        '''
+        Slow statements are recorded with their origin and query plan
+        '''
+        app = self.create_app()
+        client = app.test_client()
+        user_id = client.put('/user/0').get_json()['id']
+        client.get('/leave/remaining/%d/2021' % (user_id))
+
+        body = client.get('/debug/slow-queries?limit=5').get_json()
+        self.assertTrue(body['enabled'])
+        self.assertEqual(len(body['queries']), 5)
+        self.assertGreaterEqual(body['counts']['recorded'], 5)
+
+        query = next(query for query in body['queries']
+            if query['route'] == 'GET /leave/remaining/<int:user_id>/<int:year>')
+        self.assertIn('leave_usage', query['statement'])
+        self.assertIn(str(user_id), query['parameters'])
+        self.assertTrue(query['model_method'].startswith('LeaveModel.get_leave_remaining'))
+        self.assertTrue(any('leave_usage' in row for row in query['plan']))
+
+        with open(self.log_file.format(pid=os.getpid())) as log:
+            lines = [json.loads(line) for line in log]
+        self.assertIn(query, lines)
+
+
+    def test_sampled(self):
+        '''
+        Slow statements that are not sampled are only counted
+        '''
+        app = self.create_app(SLOW_QUERY_SAMPLE_RATE=0.0)
+        client = app.test_client()
+        client.put('/user/0')
+
+        body = client.get('/debug/slow-queries').get_json()
+        self.assertGreater(body['counts']['slow'], 0)
+        self.assertEqual(body['counts']['recorded'], 0)
+        self.assertEqual(body['queries'], [])
+        self.assertFalse(os.path.exists(self.log_file.format(pid=os.getpid())))
+
+
+    def test_threshold(self):
+        '''
+        Fast statements are not recorded
+        '''
+        app = self.create_app(SLOW_QUERY_THRESHOLD_MS=10000)
+        client = app.test_client()
+        client.put('/user/0')
+
+        self.assertEqual(client.get('/debug/slow-queries').get_json()['counts']['slow'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+'''
+Tests for the request scoped unit of work (run in process on a temporary
+file database, no server needed).
+'''
+
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+from threading import Barrier, Thread
+
+from sqlalchemy import event
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.models.leave import LeaveModel, MAX_YEARLY_LEAVE
+
+
+class UnitOfWorkTests(unittest.TestCase):
+    '''
+    Request transaction unit tests
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(
+                self.directory.name, 'leave.db'),
+            'LEAVE_CACHE_ENABLED': False
+        })
+        self.client = self.app.test_client()
+        self.user_id = self.client.put('/user/0').get_json()['id']
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.directory.cleanup()
+
+
+    def create(self, start_date, days):
+        '''
+        Create a leave of days from start_date
+        '''
+        end_date = start_date + timedelta(days=days - 1)
+        return self.client.post('/leave/create', json={'user_id': self.user_id,
+            'start_date': LeaveModel.date_to_str(start_date),
+            'end_date': LeaveModel.date_to_str(end_date)})
+
+
+    def test_error_rolls_back(self):
+        '''
+        Changes staged by a request answered with an error are not committed
+        '''
+        response = self.client.post('/leave/create?merge=true', json={
+            'user_id': self.user_id, 'start_date': '2021-01-01T00:00:00',
+            'end_date': '2021-12-31T00:00:00'})
+        self.assertEqual(response.status_code, 400)
+
+        with self.app.app_context():
+            self.assertEqual(LeaveModel.get_all(), [])
+            self.assertEqual(LeaveModel.get_leave_remaining(self.user_id, 2021),
+                MAX_YEARLY_LEAVE.days)
+
+
+    def test_concurrent_creates(self):
+        '''
+        Concurrent creates cannot overdraw the yearly allotment
+        '''
+        threads = 6
+        days = 30 # only two fit in the allotment
+        barrier = Barrier(threads)
+        statuses = []
+
+        def create(n):
+            barrier.wait()
+            statuses.append(self.create(date(2021, 1, 1) + timedelta(weeks=5 * n),
+                days).status_code)
+
+        workers = [Thread(target=create, args=(n,)) for n in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] * 2 + [400] * (threads - 2))
+        with self.app.app_context():
+            self.assertEqual(len(LeaveModel.get_all()), 2)
+            self.assertEqual(LeaveModel.get_leave_remaining(self.user_id, 2021),
+                MAX_YEARLY_LEAVE.days - 2 * days)
+            self.assertEqual(LeaveModel.get_leave_used(self.user_id, 2021), 2 * days)
+
+
+    def test_stale_update_retry(self):
+        '''
+        An update retried after a concurrent version bump books the ledger
+        change from the committed period, not the failed attempt's
+        '''
+        leave_id = self.create(date(2021, 1, 1), 10).get_json()['id']
+        table = LeaveModel.__table__
+
+        def bump_version(session, flush_context, instances):
+            session.connection().execute(table.update().where(table.c.id == leave_id).values(
+                version_id=table.c.version_id + 1)) # concurrent writer
+
+        with self.app.app_context():
+            event.listen(db.session, 'before_flush', bump_version, once=True)
+        response = self.client.put('/leave/%d' % (leave_id),
+            json={'end_date': '2021-01-05T00:00:00'})
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.app_context():
+            self.assertEqual(LeaveModel.get_leave(leave_id).end_date, date(2021, 1, 5))
+            self.assertEqual(LeaveModel.get_leave_used(self.user_id, 2021), 5)
+            self.assertEqual(LeaveModel.get_leave_remaining(self.user_id, 2021),
+                MAX_YEARLY_LEAVE.days - 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@
 Tests for the user backend restful api.
 '''
 
+import json
 import unittest
 import requests
 
@@ -67,6 +68,22 @@ class UserTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
 
     
+    def test_user_get_not_modified(self):
+        '''
+        Get a user with a matching entity tag
+        '''
+        clear_users()
+
+        id = add_user(1).json()['id']
+        etag = requests.get(USER_URL + '/' + str(id)).headers['ETag']
+        response = requests.get(USER_URL + '/' + str(id), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        requests.delete(USER_URL + '/' + str(id))
+        response = requests.get(USER_URL + '/' + str(id), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 404)
+
+
     def test_user_get_nonexistant(self):
         '''
         Get non-existant user
@@ -127,6 +144,39 @@ class UserListTests(unittest.TestCase):
         self.assertEqual(len(response.json()), 1)
 
 
+    def test_user_list_get_page(self):
+        '''
+        Get users a page at a time
+        '''
+        clear_users()
+
+        ids = [add_user(0).json()['id'] for _ in range(3)]
+        response = requests.get(USER_LIST_URL + '?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(),
+            {'items': [{'id': ids[0]}, {'id': ids[1]}], 'next': ids[1]})
+
+        response = requests.get(USER_LIST_URL + '?limit=2&after_id=' + str(ids[1]))
+        self.assertEqual(response.json(), {'items': [{'id': ids[2]}], 'next': None})
+
+        response = requests.get(USER_LIST_URL + '?limit=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message': 'Invalid page'})
+
+
+    def test_user_list_get_stream(self):
+        '''
+        Get all users streamed as newline delimited json
+        '''
+        clear_users()
+
+        ids = [add_user(0).json()['id'] for _ in range(2)]
+        response = requests.get(USER_LIST_URL + '?format=ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([json.loads(line) for line in response.text.splitlines()],
+            [{'id': ids[0]}, {'id': ids[1]}])
+
+
     def test_user_list_delete(self):
         '''
         Delete all users
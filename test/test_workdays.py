@@ -0,0 +1,137 @@
+'''
+Tests for working day leave accounting (run in process, no server needed).
+'''
+
+import random
+import unittest
+from datetime import date, timedelta
+
+from backend.server import create_app
+from backend.models.db import db
+from backend.models.leave import LeaveModel, MAX_YEARLY_LEAVE
+from backend.models.usage import LeaveUsageModel
+from backend.models.workdays import WorkCalendar
+
+HOLIDAYS = ['2021-01-01', '2021-12-24', '2021-12-25', '2022-01-03']
+
+
+def brute_force(calendar: WorkCalendar, start_date: date, end_date: date) -> int:
+    '''
+    Working days checking each day
+    '''
+    days = 0
+    while start_date <= end_date:
+        days += calendar.weekmask[start_date.weekday()] and start_date not in calendar.holidays
+        start_date += timedelta(days=1)
+    return days
+
+
+class WorkCalendarTests(unittest.TestCase):
+    '''
+    Cumulative count lookups against day by day counts
+    '''
+    def test_counts(self):
+        '''
+        Ranges, windows and span bounds on random calendars
+        '''
+        rand = random.Random(0)
+        for weekmask, holidays in (('1111111', []), ('1111100', HOLIDAYS),
+            ('0111110', HOLIDAYS), ('1000000', [])):
+            calendar = WorkCalendar(weekmask, holidays)
+            for _ in range(100):
+                start = date(2020, 6, 1) + timedelta(days=rand.randrange(700))
+                end = start + timedelta(days=rand.randrange(400))
+                self.assertEqual(calendar.count(start, end), brute_force(calendar, start, end))
+                self.assertEqual(sum(calendar.count_in_year(start, end, year)
+                    for year in range(2019, 2025)), calendar.count(start, end))
+
+                days = (end - start).days + 1
+                counts = calendar.window(start, days)
+                self.assertEqual(len(counts), days + 1)
+                offset = rand.randrange(days)
+                self.assertEqual(counts[days] - counts[offset],
+                    brute_force(calendar, start + timedelta(days=offset), end))
+
+            # no period of a year is longer than the bound with max_days or fewer
+            max_span = calendar.max_span(MAX_YEARLY_LEAVE.days)
+            if max_span is None:
+                self.assertLessEqual(brute_force(calendar, date(2021, 1, 1), date(2021, 12, 31)),
+                    MAX_YEARLY_LEAVE.days * 2)
+                continue
+            for _ in range(100):
+                start = date(2021, 1, 1) + timedelta(days=rand.randrange(365))
+                end = start + max_span / 2
+                if end.year == start.year:
+                    self.assertGreater(calendar.count(start, end), MAX_YEARLY_LEAVE.days)
+
+        self.assertEqual(WorkCalendar().max_span(MAX_YEARLY_LEAVE.days), 2 * MAX_YEARLY_LEAVE)
+        self.assertRaises(ValueError, WorkCalendar, '0000000')
+        self.assertRaises(ValueError, WorkCalendar, '11111')
+
+
+class WorkdayLeaveTests(unittest.TestCase):
+    '''
+    Leave accounting with a working day calendar
+    '''
+    def setUp(self):
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_CACHE_ENABLED': False, 'LEAVE_REGION': 'office',
+            'LEAVE_REGIONS': {'office': {'weekmask': '1111100', 'holidays': HOLIDAYS}}})
+        self.client = self.app.test_client()
+        self.user_id = self.client.put('/user/0').get_json()['id']
+
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+    def create(self, start: str, end: str):
+        return self.client.post('/leave/create', json={'user_id': self.user_id,
+            'start_date': start + 'T00:00:00', 'end_date': end + 'T00:00:00'})
+
+
+    def remaining(self, year: int) -> int:
+        return self.client.get('/leave/remaining/%d/%d' % (self.user_id, year)).get_json()[
+            'remaining']
+
+
+    def test_working_days(self):
+        '''
+        Only working days are charged, by the ledger, the reference
+        aggregate, the rebuild and the analytics
+        '''
+        # Thursday Dec 23 to Monday Jan 3: Dec 23, 27-31 (Dec 24 is a holiday),
+        # Jan 3 is a holiday
+        self.assertEqual(self.create('2021-12-23', '2022-01-03').status_code, 201)
+        self.assertEqual(self.remaining(2021), MAX_YEARLY_LEAVE.days - 6)
+        self.assertEqual(self.remaining(2022), MAX_YEARLY_LEAVE.days)
+
+        # the remaining 78 working days take 108 calendar days
+        self.assertEqual(self.create('2021-03-01', '2021-06-25').status_code, 400)
+        self.assertEqual(self.create('2021-03-01', '2021-06-16').status_code, 201)
+        self.assertEqual(self.remaining(2021), 0)
+
+        with self.app.app_context():
+            self.assertEqual(LeaveModel.get_leave_used(self.user_id, 2021),
+                MAX_YEARLY_LEAVE.days)
+            LeaveModel.rebuild_usage()
+            self.assertEqual(LeaveUsageModel.get_days_used(self.user_id, 2021),
+                MAX_YEARLY_LEAVE.days)
+            self.assertEqual(LeaveUsageModel.get_days_used(self.user_id, 2022), 0)
+
+        body = self.client.get('/leave/analytics/2021?quarter=4').get_json()
+        self.assertEqual((body['user_ids'], body['days_used']), ([self.user_id], [6]))
+
+
+    def test_unknown_region(self):
+        '''
+        An unknown region is a configuration error
+        '''
+        self.assertRaises(ValueError, create_app, {'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'LEAVE_REGION': 'nowhere'})
+
+
+if __name__ == '__main__':
+    unittest.main()